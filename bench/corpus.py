@@ -0,0 +1,107 @@
+"""
+Генератор синтетического корпуса для бенчмарков: обучающая выборка в формате CoNLL-U, морфемная сегментация
+в формате .morph, неразмеченная тестовая выборка и файлы data/grammar_data с категориями.
+"""
+import os
+import random
+from itertools import accumulate
+from collections import OrderedDict
+
+from utils.data_loader import DataLoader
+
+POS_TAGS = ['NOUN', 'VERB', 'ADJ', 'PRON', 'ADV', 'ADP', 'AUX', 'DET', 'NUM', 'PART', 'CCONJ', 'PUNCT']
+ALPHABET = 'abdeghijklmnoprstuvwyzəɲŋ'
+
+
+class SyntheticCorpus:
+    """
+    Синтетический корпус с заданным числом предложений, средней длиной предложения, размером словаря
+    и числом грамматических категорий. Каждая словоформа из словаря получает постоянные часть речи,
+    набор грам. значений и морфемную сегментацию (корень и суффиксы с метками), поэтому корпус обучаем.
+    """
+
+    def __init__(self, n_sents=1000, sent_len=10, vocab_size=5000, n_categories=10, n_values=3, seed=0):
+        self.n_sents = n_sents
+        self.sent_len = sent_len
+        self.vocab_size = vocab_size
+        self.random = random.Random(seed)
+
+        self.categories = ['Cat{}'.format(i) for i in range(n_categories)]
+        self.values = ['Val{}'.format(i) for i in range(n_values)]
+        # у каждой части речи (кроме служебных) - случайное подмножество категорий
+        self.pos2categories = OrderedDict()
+        for pos in POS_TAGS:
+            if pos in {'PUNCT', 'CCONJ', 'PART'}:
+                self.pos2categories[pos] = []
+            else:
+                k = self.random.randint(1, n_categories)
+                self.pos2categories[pos] = sorted(self.random.sample(self.categories, k))
+        self.vocabulary = [self.make_word() for _ in range(vocab_size)]
+        # частоты словоформ распределены по закону Ципфа, как в реальных корпусах
+        self.cum_weights = list(accumulate(1.0 / rank for rank in range(1, vocab_size + 1)))
+
+    def make_word(self):
+        root = ''.join(self.random.choice(ALPHABET) for _ in range(self.random.randint(2, 7)))
+        suffixes = [(''.join(self.random.choice(ALPHABET) for _ in range(self.random.randint(1, 3))),
+                     'SUF{}'.format(self.random.randint(0, 29)))
+                    for _ in range(self.random.randint(0, 2))]
+        pos = self.random.choice(POS_TAGS)
+        feats = OrderedDict((category, self.random.choice(self.values)) for category in self.pos2categories[pos])
+        return {'form': root + ''.join(suffix for suffix, _ in suffixes),
+                'segmentation': ' '.join([root] + ['{}_{}'.format(suffix, label) for suffix, label in suffixes]),
+                'upostag': pos,
+                'feats': feats}
+
+    def sentences(self):
+        for _ in range(self.n_sents):
+            length = max(1, int(self.random.gauss(self.sent_len, self.sent_len / 3)))
+            yield self.random.choices(self.vocabulary, cum_weights=self.cum_weights, k=length)
+
+    def write(self, root_dir, lang_prefix, test_share=0.2):
+        """
+        Запись корпуса в структуру каталогов проекта внутри root_dir:
+        data/<lang>.train.ud, data/morpheme/<lang>.train.morph, data/grammar_data/<lang>_*.json,
+        test_data/<lang>.test.ud, test_data/morpheme/<lang>.test.morph.
+        Возвращает число токенов в обучающей и тестовой выборках.
+        """
+        for directory in ['data/morpheme', 'data/grammar_data', 'test_data/morpheme', 'models', 'logs']:
+            os.makedirs(os.path.join(root_dir, directory), exist_ok=True)
+        data_loader = DataLoader()
+        data_loader.save_json(os.path.join(root_dir, 'data/grammar_data/{}_categories.json'.format(lang_prefix)),
+                              self.categories)
+        data_loader.save_json(os.path.join(root_dir, 'data/grammar_data/{}_pos2categories.json'.format(lang_prefix)),
+                              self.pos2categories)
+
+        paths = {
+            'train': os.path.join(root_dir, 'data/{}.train.ud'.format(lang_prefix)),
+            'train_morph': os.path.join(root_dir, 'data/morpheme/{}.train.morph'.format(lang_prefix)),
+            'test': os.path.join(root_dir, 'test_data/{}.test.ud'.format(lang_prefix)),
+            'test_morph': os.path.join(root_dir, 'test_data/morpheme/{}.test.morph'.format(lang_prefix)),
+        }
+        files = {name: open(path, 'w', encoding='utf-8') for name, path in paths.items()}
+        tokens = {'train': 0, 'test': 0}
+        try:
+            for sent_id, sent in enumerate(self.sentences()):
+                if self.random.random() < test_share:
+                    # load_non_labeled не ожидает пустой строки в конце файла, поэтому разделитель - перед предложением
+                    if tokens['test']:
+                        files['test'].write('\n')
+                        files['test_morph'].write('\n')
+                    tokens['test'] += len(sent)
+                    for i, word in enumerate(sent):
+                        files['test'].write('{}\t{}\n'.format(i + 1, word['form']))
+                        files['test_morph'].write('{}\t{}\n'.format(word['form'], word['segmentation']))
+                else:
+                    tokens['train'] += len(sent)
+                    files['train'].write('# sent_id = {}\n'.format(sent_id))
+                    for i, word in enumerate(sent):
+                        feats = '|'.join('{}={}'.format(k, v) for k, v in word['feats'].items()) or '_'
+                        files['train'].write('{}\t{}\t{}\t{}\t_\t{}\t_\t_\t_\t_\n'.format(
+                            i + 1, word['form'], word['form'], word['upostag'], feats))
+                        files['train_morph'].write('{}\t{}\n'.format(word['form'], word['segmentation']))
+                    files['train'].write('\n')
+                    files['train_morph'].write('\n')
+        finally:
+            for f in files.values():
+                f.close()
+        return tokens
@@ -0,0 +1,161 @@
+"""
+Бенчмарки производительности на синтетическом корпусе (см. bench.corpus):
+    1) features - скорость извлечения признаков (sent2features/word2features) с кэшем признаков словоформ и без;
+    2) train - время Pipeline.pipeline_train по каждой модели;
+    3) inference - скорость Inference.inference от чтения файла до записи результата.
+Каждый этап запускается в отдельном процессе, чтобы пиковая память (peak RSS) относилась только к нему.
+Результаты выводятся в формате JSON.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from bench.corpus import SyntheticCorpus
+from utils.data_loader import DataLoader
+from utils.instrumentation import peak_rss_mb
+from utils.utils import replace_morphemes
+from utils.morpheme_preprocessor import MorphemePreprocessor
+from pipeline.feature_extractor import FeatureExtractor
+from pipeline.feature_encoder import FeatureEncoder
+
+
+def bench_features(root_dir, lang, add_morpheme_features, cache_size, feature_encoding):
+    os.chdir(root_dir)
+    data_loader = DataLoader()
+    if feature_encoding == 'ids':
+        feature_extractor = FeatureEncoder(cache_size=cache_size)
+    else:
+        feature_extractor = FeatureExtractor(cache_size=cache_size)
+    train = data_loader.load_corpus('data/{}.train.ud'.format(lang))
+    if add_morpheme_features:
+        morphemes = list(data_loader.load_morphemes('data/morpheme/{}.train.morph'.format(lang)))
+        train, morphemes = replace_morphemes(train, morphemes)
+        feature_extractor.set_morpheme_preproc(MorphemePreprocessor(lang_prefix=lang, morphemes=morphemes))
+    else:
+        train = feature_extractor.del_hyphen_parts(train)
+
+    tokens = sum(len(sent) for sent in train)
+    start = time.perf_counter()
+    # признаки не выбрасываются, чтобы peak RSS включал память, занятую выборкой
+    X = [feature_extractor.sent2features(sent, sent_id) for sent_id, sent in enumerate(train)]
+    seconds = time.perf_counter() - start
+    return OrderedDict([('cache_size', cache_size),
+                        ('feature_encoding', feature_encoding),
+                        ('tokens', tokens),
+                        ('seconds', seconds),
+                        ('tokens_per_second', tokens / seconds),
+                        ('cache', feature_extractor.words_cache.stats()),
+                        ('peak_rss_mb', peak_rss_mb())])
+
+
+def bench_train(root_dir, lang, add_morpheme_features, jobs, model_format, feature_encoding, joint):
+    from pipeline.train import Pipeline
+
+    os.chdir(root_dir)
+    start = time.perf_counter()
+    pipeline = Pipeline(lang_prefix=lang, add_morpheme_features=add_morpheme_features,
+                        data_path=os.path.join(root_dir, 'data'), feature_encoding=feature_encoding)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    models = pipeline.pipeline_train(jobs=jobs, model_format=model_format, joint=joint)
+    return OrderedDict([('jobs', jobs),
+                        ('feature_encoding', feature_encoding),
+                        ('joint', joint),
+                        ('load_seconds', load_seconds),
+                        ('train_seconds', time.perf_counter() - start),
+                        ('models', models),
+                        ('peak_rss_mb', peak_rss_mb())])
+
+
+def bench_inference(root_dir, lang, add_morpheme_features, model_format, chunk_size, feature_encoding, joint):
+    from pipeline.inference import Inference
+
+    os.chdir(root_dir)
+    test_file = 'test_data/{}.test.ud'.format(lang)
+    tokens = sum(len(sent) for sent in DataLoader().iter_non_labeled(test_file))
+    inference = Inference(lang, 'test_data/{}.annotated.ud'.format(lang), add_morpheme_features,
+                          model_format=model_format, feature_encoding=feature_encoding, joint=joint)
+    start = time.perf_counter()
+    if chunk_size > 0:
+        inference.inference_stream(chunk_size)
+    else:
+        inference.inference()
+    seconds = time.perf_counter() - start
+    return OrderedDict([('chunk_size', chunk_size),
+                        ('feature_encoding', feature_encoding),
+                        ('joint', joint),
+                        ('tokens', tokens),
+                        ('seconds', seconds),
+                        ('tokens_per_second', tokens / seconds),
+                        ('models', inference.model_registry.stats()),
+                        ('peak_rss_mb', peak_rss_mb())])
+
+
+def run_isolated(func, *args):
+    """
+    Запуск этапа бенчмарка в отдельном процессе.
+    """
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(func, *args).result()
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('--sents', type=int, default=2000, help='Number of sentences in the corpus')
+    arg_parser.add_argument('--sent-len', dest='sent_len', type=int, default=10, help='Mean sentence length')
+    arg_parser.add_argument('--vocab', type=int, default=5000, help='Vocabulary size')
+    arg_parser.add_argument('--categories', type=int, default=10, help='Number of grammar categories')
+    arg_parser.add_argument('--values', type=int, default=3, help='Number of values of each category')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--lang', type=str, default='evn')
+    arg_parser.add_argument('--morphemes', dest='add_morpheme_features', default=False, type=bool,
+                            help='Add morpheme features')
+    arg_parser.add_argument('--stages', type=str, nargs='+', default=['features', 'train', 'inference'],
+                            choices=['features', 'train', 'inference'])
+    arg_parser.add_argument('--jobs', type=int, default=1, help='Number of processes for training')
+    arg_parser.add_argument('--model-format', dest='model_format', type=str, default='pickle',
+                            choices=['pickle', 'crfsuite'])
+    arg_parser.add_argument('--feature-encoding', dest='feature_encoding', type=str, default='dict',
+                            choices=['dict', 'ids'])
+    arg_parser.add_argument('--joint', default=False, type=bool, help='Joint POS+FEATS model')
+    arg_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=0,
+                            help='Streaming inference chunk size (0 - whole file)')
+    arg_parser.add_argument('--workdir', type=str, default=None,
+                            help='Directory for the corpus and models (temporary directory by default)')
+    arg_parser.add_argument('--output', type=str, default=None, help='Path to the JSON results (stdout by default)')
+    args = arg_parser.parse_args()
+
+    root_dir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='lowresource_bench_'))
+    corpus = SyntheticCorpus(n_sents=args.sents, sent_len=args.sent_len, vocab_size=args.vocab,
+                             n_categories=args.categories, n_values=args.values, seed=args.seed)
+    tokens = corpus.write(root_dir, args.lang)
+    del corpus
+
+    results = OrderedDict([('config', vars(args)), ('corpus_tokens', tokens)])
+    try:
+        if 'features' in args.stages:
+            results['features'] = [run_isolated(bench_features, root_dir, args.lang, args.add_morpheme_features,
+                                                cache_size, args.feature_encoding) for cache_size in [0, 100000]]
+        if 'train' in args.stages:
+            results['train'] = run_isolated(bench_train, root_dir, args.lang, args.add_morpheme_features,
+                                            args.jobs, args.model_format, args.feature_encoding, args.joint)
+        if 'inference' in args.stages:
+            results['inference'] = run_isolated(bench_inference, root_dir, args.lang, args.add_morpheme_features,
+                                                args.model_format, args.chunk_size, args.feature_encoding,
+                                                args.joint)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    output = json.dumps(results, ensure_ascii=False, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + '\n')
@@ -0,0 +1,156 @@
+"""
+Пакетная разметка нескольких файлов (обычно - тестовых файлов всех языков) в одном процессе
+или в пуле процессов. Задания описываются манифестом - JSON-списком объектов вида
+{"lang": "evn", "input": "...", "output": "...", "morphemes": false}; необязательные поля
+morphemes_path, chunk_size, gc_decoding, model_format, feature_encoding и joint переопределяют
+значения, заданные в командной строке.
+"""
+import sys
+import time
+import logging
+import traceback
+from argparse import ArgumentParser
+
+from utils.utils import init_logging
+from utils.data_loader import DataLoader
+from utils.model_registry import ModelRegistry
+from utils.instrumentation import Instrumentation, peak_rss_mb
+from pipeline.crf_tasks import run_tasks
+from pipeline.inference import Inference
+
+JOB_DEFAULTS = ['chunk_size', 'gc_decoding', 'feature_cache_size', 'model_format', 'feature_encoding', 'joint']
+
+
+def make_job(job, defaults):
+    """
+    Задание из манифеста, дополненное значениями по умолчанию.
+    """
+    if 'lang' not in job or 'output' not in job:
+        raise ValueError('Job must contain "lang" and "output": {}'.format(dict(job)))
+    result = {'lang': job['lang'],
+              'input': job.get('input'),
+              'output': job['output'],
+              'morphemes': bool(job.get('morphemes', defaults['morphemes'])),
+              'morphemes_path': job.get('morphemes_path')}
+    for name in JOB_DEFAULTS:
+        result[name] = job.get(name, defaults[name])
+    return result
+
+
+def run_job(job):
+    """
+    Разметка одного файла. Для каждого задания - свой реестр моделей, чтобы модели предыдущего языка
+    не оставались в памяти. Замеры этапов возвращаются вместе с результатом и записываются
+    в основном процессе.
+    """
+    records = []
+    instrumentation = Instrumentation()
+    instrumentation.add_hook(records.append)
+    inference = Inference(job['lang'], job['output'], job['morphemes'], job['gc_decoding'],
+                          job['feature_cache_size'], job['input'], job['model_format'],
+                          model_registry=ModelRegistry(model_format=job['model_format']),
+                          instrumentation=instrumentation, feature_encoding=job['feature_encoding'],
+                          joint=job['joint'], morphemes_file=job['morphemes_path'])
+    start = time.perf_counter()
+    if job['chunk_size'] > 0:
+        counts = inference.inference_stream(job['chunk_size'])
+    else:
+        counts = inference.inference()
+    seconds = time.perf_counter() - start
+    return {'lang': job['lang'],
+            'input': inference.test_file,
+            'output': job['output'],
+            'sentences': counts['sentences'],
+            'tokens': counts['tokens'],
+            'seconds': seconds,
+            'tokens_per_second': counts['tokens'] / seconds if seconds > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+            'records': records}
+
+
+def run_job_safely(job_id, job):
+    """
+    Разметка одного файла, при которой ошибка не прерывает остальные задания: вместо результата
+    возвращается номер задания, язык, файлы и описание ошибки с трассировкой.
+    """
+    try:
+        result = run_job(job)
+    except Exception as e:
+        result = {'lang': job['lang'],
+                  'input': job['input'],
+                  'output': job['output'],
+                  'error': '{}: {}'.format(type(e).__name__, e),
+                  'traceback': traceback.format_exc(),
+                  'records': []}
+    result['job'] = job_id
+    return result
+
+
+class BatchInference:
+    """
+    Выполнение заданий манифеста: при jobs = 1 - последовательно в текущем процессе, иначе - в пуле из jobs
+    процессов, каждый из которых выполняет несколько заданий подряд. Библиотеки загружаются один раз
+    на процесс, а не на каждый язык, как при отдельных запусках pipeline.inference.
+    Задание, завершившееся ошибкой, не прерывает остальные: ошибка записывается в его результат
+    (поле error) и в лог, итог выводится по всем заданиям.
+    """
+
+    def __init__(self, jobs_list, jobs=1, instrumentation=None):
+        self.jobs_list = jobs_list
+        self.jobs = jobs
+        self.instrumentation = instrumentation or Instrumentation()
+
+    def run(self):
+        start = time.perf_counter()
+        results = run_tasks(run_job_safely, list(enumerate(self.jobs_list)), self.jobs)
+        seconds = time.perf_counter() - start
+        for result in results:
+            for record in result.pop('records'):
+                self.instrumentation.emit(record)
+            if 'error' in result:
+                logging.error('Job {job} ({lang}, {input} -> {output}) failed: {error}\n{traceback}'.format(**result))
+                continue
+            logging.info('{lang}: {sentences} sentences, {tokens} tokens in {seconds:.2f} s '
+                         '({tokens_per_second:.0f} tokens/s, peak RSS {peak_rss_mb:.0f} MB) -> {output}'
+                         .format(**result))
+        done = [result for result in results if 'error' not in result]
+        tokens = sum(result['tokens'] for result in done)
+        logging.info('Total: {} files, {} tokens in {:.2f} s ({:.0f} tokens/s), {} failed job(s)'
+                     .format(len(done), tokens, seconds, tokens / seconds if seconds > 0 else 0.0,
+                             len(results) - len(done)))
+        return results
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('--manifest', type=str, required=True,
+                            help='JSON list of jobs: {"lang", "input", "output", "morphemes"} '
+                                 'with optional per-job overrides of the options below')
+    arg_parser.add_argument('--jobs', default=1, type=int, required=False,
+                            help='Number of worker processes (1 - run all jobs in this process)')
+    arg_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=0, required=False,
+                            help='Tag and write sentences by chunks of this size (streaming mode), 0 - whole file')
+    arg_parser.add_argument('--morphemes', dest='morphemes', default=False, type=bool, required=False,
+                            help='Add morpheme features')
+    arg_parser.add_argument('--gc-decoding', dest='gc_decoding', type=str, default='batch', required=False,
+                            choices=['batch', 'token'],
+                            help='Grammar categories decoding: whole POS-filtered subsequences at once '
+                                 'or every token separately')
+    arg_parser.add_argument('--feature-cache-size', dest='feature_cache_size', default=100000, type=int,
+                            required=False, help='Max number of word forms in the features LRU cache (0 - disabled)')
+    arg_parser.add_argument('--model-format', dest='model_format', default='pickle', type=str, required=False,
+                            choices=['pickle', 'crfsuite'], help='Format of the saved models')
+    arg_parser.add_argument('--feature-encoding', dest='feature_encoding', default='dict', type=str, required=False,
+                            choices=['dict', 'ids'],
+                            help='Features representation (must be the same as in training)')
+    arg_parser.add_argument('--joint', default=False, type=bool, required=False,
+                            help='Tag with the joint POS+FEATS model')
+    args = arg_parser.parse_args()
+
+    instrumentation = Instrumentation()
+    init_logging('batch_inference', instrumentation)
+    defaults = vars(args)
+    jobs_list = [make_job(job, defaults) for job in DataLoader().load_json(args.manifest)]
+    batch_results = BatchInference(jobs_list, args.jobs, instrumentation).run()
+    if any('error' in result for result in batch_results):
+        sys.exit(1)
@@ -0,0 +1,113 @@
+"""
+Сжатие обученных CRF-моделей: из модели отбираются атрибуты с заметными весами (|вес| не меньше порога и/или
+top-k атрибутов по |весу| для каждой метки), и модель переобучается только на них.
+crfsuite не позволяет удалить веса из готовой модели, поэтому меньшая модель получается переобучением; при
+inference атрибуты, которых нет в модели, просто не учитываются, так что признаки для сжатой модели
+извлекаются как обычно.
+"""
+import os
+import time
+
+import sklearn_crfsuite
+from sklearn_crfsuite.utils import flatten
+
+from utils.data_loader import DataLoader
+from utils.instrumentation import peak_rss_mb
+from pipeline.crf_tasks import make_crf, make_report, fit_and_save, count_tokens
+from pipeline.crf_search import report_score
+from pipeline.feature_encoder import attribute_name
+
+
+def select_attributes(state_features, threshold=0.0, top_k=0):
+    """
+    Атрибуты, которые остаются в модели: у которых хотя бы для одной метки |вес| >= threshold и,
+    если top_k > 0, которые входят в top_k атрибутов с наибольшим |весом| хотя бы для одной метки.
+    state_features - веса модели в виде {(атрибут, метка): вес} (см. sklearn_crfsuite.CRF.state_features_).
+    """
+    by_label = {}
+    for (attribute, label), weight in state_features.items():
+        if abs(weight) >= threshold:
+            by_label.setdefault(label, []).append((abs(weight), attribute))
+    attributes = set()
+    for label_weights in by_label.values():
+        if top_k > 0:
+            label_weights = sorted(label_weights, reverse=True)[:top_k]
+        attributes.update(attribute for _, attribute in label_weights)
+    return attributes
+
+
+def prune_features(X, attributes):
+    """
+    Признаки выборки X без атрибутов, не вошедших в attributes. Признаки токена - словарь
+    (FeatureExtractor) или кортеж идентификаторов атрибутов (FeatureEncoder).
+    """
+    result = []
+    for sent in X:
+        if sent and isinstance(sent[0], dict):
+            result.append([{name: value for name, value in word.items() if attribute_name(name, value) in attributes}
+                           for word in sent])
+        else:
+            result.append([tuple(attribute for attribute in word if attribute in attributes) for word in sent])
+    return result
+
+
+def count_attributes(clfr):
+    return len(set(attribute for attribute, _ in clfr.state_features_))
+
+
+def measure_model(model_path, X_test, y_test, labels=None):
+    """
+    Размер файла модели, время её загрузки, скорость разметки (токенов/с) и качество на X_test.
+    """
+    start = time.perf_counter()
+    clfr = sklearn_crfsuite.CRF(model_filename=model_path)
+    clfr.tagger_
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    y_pred = clfr.predict(X_test)
+    tag_time = time.perf_counter() - start
+    return {'attributes': count_attributes(clfr),
+            'bytes': os.path.getsize(model_path),
+            'load_time': load_time,
+            'tokens_per_second': count_tokens(y_test) / tag_time if tag_time > 0 else 0.0,
+            'f1': report_score(make_report(flatten(y_test), flatten(y_pred), labels)['report'])}
+
+
+def compact_and_evaluate(fold, task, X_train, y_train, X_test, y_test, params=None, threshold=0.0, top_k=0):
+    """
+    Обучение полной и сжатой модели на обучающей части и их сравнение на отложенной.
+    Сжатая модель размечает те же, не урезанные, признаки, что получает модель при inference.
+    """
+    full = make_crf(params=params)
+    full.fit(X_train, y_train)
+    attributes = select_attributes(full.state_features_, threshold, top_k)
+    pruned = make_crf(params=params)
+    pruned.fit(prune_features(X_train, attributes), y_train)
+    labels = None
+    if task == 'pos':
+        labels = [label for label in full.classes_ if label != 'X']
+    return {'fold': fold,
+            'task': task,
+            'full': measure_model(full.modelfile.name, X_test, y_test, labels),
+            'pruned': measure_model(pruned.modelfile.name, X_test, y_test, labels),
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def compact_and_save(lang, task, X, y, model_format='pickle', metadata=None, params=None, threshold=0.0, top_k=0):
+    """
+    Сжатие сохранённой модели задачи: атрибуты отбираются по её весам, модель переобучается на всём train'е
+    только с ними и сохраняется на место исходной.
+    Возвращает статистику обучения (см. fit_and_save), число атрибутов и размер файла модели до и после.
+    """
+    data_loader = DataLoader()
+    model_path = data_loader.model_path(lang, task, model_format)
+    full = data_loader.load_task_model(lang, task, model_format)
+    attributes = select_attributes(full.state_features_, threshold, top_k)
+    attributes_before, bytes_before = count_attributes(full), os.path.getsize(model_path)
+    del full
+    result = fit_and_save(lang, task, prune_features(X, attributes), y, model_format, metadata, params)
+    result.update([('attributes_before', attributes_before),
+                   ('attributes_after', len(attributes)),
+                   ('bytes_before', bytes_before),
+                   ('bytes_after', os.path.getsize(model_path))])
+    return result
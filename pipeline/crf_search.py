@@ -0,0 +1,125 @@
+"""
+Поиск параметров обучения CRF (algorithm, c1, c2, max_iterations) для каждой задачи методом последовательного
+деления (successive halving): все конфигурации оцениваются на одном фолде кросс-валидации, лучшая 1/eta часть
+из них - на eta фолдах и т.д., пока оставшиеся конфигурации не будут оценены на всех фолдах.
+"""
+import random
+import logging
+from collections import OrderedDict
+
+from pipeline.crf_tasks import fit_and_evaluate, run_tasks, count_tokens
+
+# значения параметров, из которых составляются конфигурации; c1 (L1-регуляризация) есть только у lbfgs
+ALGORITHMS = ['lbfgs', 'l2sgd']
+C1_VALUES = [0.0, 0.01, 0.05, 0.1, 0.2, 0.5, 1.0]
+C2_VALUES = [0.001, 0.01, 0.05, 0.1, 0.5, 1.0]
+MAX_ITERATIONS_VALUES = [50, 100, 200, None]
+
+
+def sample_configs(n_configs, seed=0):
+    """
+    Случайные различные конфигурации параметров CRF. Первая - пустая, то есть параметры crfsuite по умолчанию,
+    с которыми модели обучаются без поиска.
+    """
+    rng = random.Random(seed)
+    configs = [OrderedDict()]
+    seen = set()
+    for _ in range(100 * n_configs):
+        if len(configs) >= n_configs:
+            break
+        config = OrderedDict([('algorithm', rng.choice(ALGORITHMS))])
+        if config['algorithm'] == 'lbfgs':
+            config['c1'] = rng.choice(C1_VALUES)
+        config['c2'] = rng.choice(C2_VALUES)
+        config['max_iterations'] = rng.choice(MAX_ITERATIONS_VALUES)
+        key = tuple(config.items())
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def fold_schedule(n_folds, eta=3):
+    """
+    Число фолдов на каждом шаге: 1, eta, eta^2, ..., n_folds.
+    """
+    schedule = [1]
+    while schedule[-1] < n_folds:
+        schedule.append(min(schedule[-1] * eta, n_folds))
+    return schedule
+
+
+def report_score(report):
+    """
+    Качество модели на фолде - взвешенный f1 (для POS - без класса X, см. fit_and_evaluate).
+    """
+    return report['weighted avg']['f1-score']
+
+
+class CRFSearch:
+    """
+    Поиск параметров CRF для набора задач.
+    get_fold_data(fold, task) возвращает выборки фолда (X_train, y_train, X_test, y_test).
+    На каждом шаге обучаются модели для всех пар (задача, конфигурация, новый фолд) сразу - в пуле из jobs
+    процессов, начиная с самых больших выборок; результаты, полученные на предыдущих шагах, не пересчитываются.
+    """
+
+    def __init__(self, tasks, get_fold_data, n_folds, configs, eta=3, jobs=1):
+        self.tasks = list(tasks)
+        self.get_fold_data = get_fold_data
+        self.n_folds = n_folds
+        self.configs = configs
+        self.eta = eta
+        self.jobs = jobs
+
+    def search(self):
+        """
+        Возвращает для каждой задачи лучшую конфигурацию, её средний f1 по всем фолдам и число обученных моделей.
+        """
+        candidates = OrderedDict((task, list(range(len(self.configs)))) for task in self.tasks)
+        scores = {}
+        trained = OrderedDict((task, 0) for task in self.tasks)
+        schedule = fold_schedule(self.n_folds, self.eta)
+        for step, n_folds in enumerate(schedule):
+            trials, keys = [], []
+            for task, config_ids in candidates.items():
+                for fold in range(n_folds):
+                    fold_data = None
+                    for config_id in config_ids:
+                        if (task, config_id, fold) in scores:
+                            continue
+                        fold_data = fold_data or self.get_fold_data(fold, task)
+                        trials.append((fold, task) + fold_data + (self.configs[config_id],))
+                        keys.append((task, config_id, fold))
+                        trained[task] += 1
+            order = sorted(range(len(trials)), key=lambda i: count_tokens(trials[i][3]), reverse=True)
+            logging.info('Search step {}: {} models on {} fold(s) in {} process(es)...'.format(
+                step, len(trials), n_folds, self.jobs))
+            results = run_tasks(fit_and_evaluate, [trials[i] for i in order], self.jobs)
+            for i, result in zip(order, results):
+                scores[keys[i]] = report_score(result['report'])
+
+            for task, config_ids in candidates.items():
+                mean_scores = {config_id: self.mean_score(scores, task, config_id, n_folds) for config_id in config_ids}
+                # при равенстве предпочитается конфигурация, найденная раньше (в том числе параметры по умолчанию)
+                ranked = sorted(config_ids, key=lambda config_id: (-mean_scores[config_id], config_id))
+                keep = len(ranked) if n_folds == schedule[-1] else max(1, len(ranked) // self.eta)
+                candidates[task] = ranked[:keep]
+
+        best = OrderedDict()
+        for task, config_ids in candidates.items():
+            config_id = config_ids[0]
+            best[task] = OrderedDict([('params', self.configs[config_id]),
+                                      ('score', self.mean_score(scores, task, config_id, self.n_folds)),
+                                      ('default_score', self.mean_score(scores, task, 0, self.n_folds)),
+                                      ('trained_models', trained[task])])
+        return best
+
+    def mean_score(self, scores, task, config_id, n_folds):
+        """
+        Средний f1 конфигурации по первым n_folds фолдам (None, если она не дошла до этого шага).
+        """
+        fold_scores = [scores.get((task, config_id, fold)) for fold in range(n_folds)]
+        if None in fold_scores:
+            return None
+        return sum(fold_scores) / n_folds
@@ -0,0 +1,144 @@
+"""
+Задачи обучения CRF-моделей, которые можно выполнять как в текущем процессе, так и в пуле процессов.
+"""
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import sklearn_crfsuite
+from sklearn.metrics import classification_report
+from sklearn_crfsuite.utils import flatten
+
+from utils.data_loader import DataLoader
+from utils.instrumentation import peak_rss_mb
+
+
+def make_crf(model_filename=None, params=None):
+    """
+    params - параметры обучения CRF (algorithm, c1, c2, max_iterations и т.п., см. pipeline.crf_search);
+    не заданные параметры остаются значениями crfsuite по умолчанию.
+    """
+    return sklearn_crfsuite.CRF(all_possible_transitions=True, model_filename=model_filename, **(params or {}))
+
+
+def count_tokens(y):
+    return sum(len(sent_labels) for sent_labels in y)
+
+
+def fit_and_save(lang, task, X, y, model_format='pickle', metadata=None, params=None):
+    """
+    Обучение модели для одной задачи (POS или грам. категория) и её сохранение в формате model_format.
+    В формате crfsuite модель сразу обучается в свой итоговый файл.
+    Возвращает статистику: число предложений и токенов, время обучения (wall и CPU), пиковую память процесса.
+    """
+    data_loader = DataLoader()
+    model_filename = None
+    if model_format == 'crfsuite':
+        model_filename = data_loader.model_path(lang, task, model_format)
+    clfr = make_crf(model_filename, params)
+    start, cpu_start = time.time(), time.process_time()
+    clfr.fit(X, y)
+    fit_time, cpu_time = time.time() - start, time.process_time() - cpu_start
+    data_loader.save_model(lang, task, clfr, model_format, metadata)
+    return {'task': task,
+            'sentences': len(X),
+            'tokens': count_tokens(y),
+            'fit_time': fit_time,
+            'cpu_time': cpu_time,
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def fit_and_evaluate(fold, task, X_train, y_train, X_test, y_test, params=None):
+    """
+    Обучение модели на обучающей части фолда и оценка качества на тестовой.
+    Для POS-модели из оценки исключается UNKN-класс X.
+    Возвращает отчёт о качестве в виде словаря (как classification_report с output_dict=True) и текста.
+    """
+    result = fit_and_predict(fold, task, X_train, y_train, X_test, params)
+    classes = result.pop('classes')
+    labels = None
+    if task == 'pos':
+        labels = [label for label in classes if label != 'X']
+    result.update(make_report(flatten(y_test), flatten(result.pop('y_pred')), labels))
+    return result
+
+
+def fit_and_predict(fold, task, X_train, y_train, X_test, params=None):
+    """
+    Обучение модели на обучающей части фолда и предсказание для тестовой.
+    Возвращает предсказания (y_pred), классы модели и статистику обучения.
+    """
+    clfr = make_crf(params=params)
+    start, cpu_start = time.time(), time.process_time()
+    clfr.fit(X_train, y_train)
+    fit_time, cpu_time = time.time() - start, time.process_time() - cpu_start
+    return {'fold': fold,
+            'task': task,
+            'tokens': count_tokens(y_train),
+            'fit_time': fit_time,
+            'cpu_time': cpu_time,
+            'peak_rss_mb': peak_rss_mb(),
+            'classes': list(clfr.classes_),
+            'y_pred': [list(sent_pred) for sent_pred in clfr.predict(X_test)]}
+
+
+def make_report(y_test, y_pred, labels=None):
+    """
+    Отчёт о качестве по плоским спискам меток: словарь (как classification_report с output_dict=True) и текст.
+    """
+    return {'report': classification_report(y_test, y_pred, labels=labels, output_dict=True),
+            'text': classification_report(y_test, y_pred, labels=labels)}
+
+
+def aggregate_reports(reports):
+    """
+    Сведение отчётов по фолдам в один: для каждой метки среднее и стандартное отклонение
+    precision, recall и f1-score по фолдам, в которых метка встречалась, и суммарный support.
+    """
+    scores = OrderedDict()
+    for report in reports:
+        for label, label_scores in report.items():
+            if not isinstance(label_scores, dict):  # accuracy
+                label_scores = {'f1-score': label_scores}
+            label_summary = scores.setdefault(label, OrderedDict())
+            for metric, value in label_scores.items():
+                label_summary.setdefault(metric, []).append(value)
+    aggregated = OrderedDict()
+    for label, label_scores in scores.items():
+        aggregated[label] = OrderedDict()
+        for metric, values in label_scores.items():
+            if metric == 'support':
+                aggregated[label][metric] = int(np.sum(values))
+            else:
+                aggregated[label][metric] = (float(np.mean(values)), float(np.std(values)))
+    return aggregated
+
+
+def format_aggregated_report(aggregated):
+    width = max([len(label) for label in aggregated] + [12])
+    lines = ['{:>{width}}  {:>15}  {:>15}  {:>15}  {:>9}'.format(
+        '', 'precision', 'recall', 'f1-score', 'support', width=width)]
+    for label, label_scores in aggregated.items():
+        columns = []
+        for metric in ['precision', 'recall', 'f1-score']:
+            if metric in label_scores:
+                columns.append('{:.3f} ± {:.3f}'.format(*label_scores[metric]))
+            else:
+                columns.append('')
+        lines.append('{:>{width}}  {:>15}  {:>15}  {:>15}  {:>9}'.format(
+            label, *columns, label_scores.get('support', ''), width=width))
+    return '\n'.join(lines)
+
+
+def run_tasks(func, tasks, jobs=1):
+    """
+    Выполнение func(*args) для каждого набора аргументов из tasks.
+    При jobs > 1 задачи распределяются по пулу из jobs процессов в порядке следования в tasks.
+    Результаты возвращаются в том же порядке, что и задачи.
+    """
+    if jobs <= 1:
+        return [func(*args) for args in tasks]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(func, *args) for args in tasks]
+        return [future.result() for future in futures]
@@ -0,0 +1,124 @@
+"""
+Дисковый кэш признаков предложений train'а: при повторном обучении признаки извлекаются только для новых
+и изменённых предложений, остальные читаются из кэша.
+"""
+import os
+import json
+import shelve
+import hashlib
+from collections import OrderedDict
+
+from utils.data_loader import DataLoader
+
+# версия извлечения признаков: увеличивается при любом изменении признаков, чтобы старые кэши не использовались
+FEATURES_VERSION = 1
+# ключ записи о словаре признаков, которым закодированы идентификаторы в кэше: (число атрибутов, хэш атрибутов)
+VOCABULARY_KEY = '__vocabulary__'
+
+
+def vocabulary_hash(attributes):
+    return hashlib.sha1('\n'.join(attributes).encode('utf-8')).hexdigest()
+
+
+class DiskFeatureCache:
+    """
+    Кэш (shelve) признаков предложений для одного языка и одной конфигурации признаков (config).
+    Ключ предложения - хэш его словоформ и морфемной сегментации, поэтому кэш не зависит от порядка предложений
+    в файле. Для каждой конфигурации - свой файл: cache/<lang>/features_<хэш конфигурации>.
+    Для признаков-идентификаторов (feature_encoding = 'ids') рядом хранится словарь признаков,
+    которым они были закодированы; его нужно сохранить (save_vocabulary) до закрытия кэша, в том числе
+    при ошибке. Размер и хэш сохранённого словаря записываются и в сам кэш, и перед использованием кэша
+    они сверяются с загруженным словарём (check_vocabulary).
+    """
+
+    def __init__(self, lang, config, cache_dir='cache'):
+        self.config = OrderedDict(config)
+        self.config['version'] = FEATURES_VERSION
+        config_hash = hashlib.sha1(json.dumps(self.config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.path = os.path.join(cache_dir, lang, 'features_{}'.format(config_hash))
+        self.vocabulary_path = self.path + '.vocab'
+        self.data_loader = DataLoader()
+        self.shelf = None
+        self.hits = 0
+        self.misses = 0
+        self.pruned = 0
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.shelf = shelve.open(self.path)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shelf.close()
+        self.shelf = None
+
+    def sentence_key(self, sent, morphemes=None):
+        """
+        Хэш предложения: словоформы токенов и, если используются морфемные признаки, сегментация
+        (словоформы и метки морфем), по которой они строятся.
+        """
+        content = [word['form'] for word in sent]
+        if morphemes is not None:
+            content.append([[word['form'], [morpheme['label'] for morpheme in word['morphemes']]]
+                            for word in morphemes])
+        return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        features = self.shelf.get(key)
+        if features is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return features
+
+    def put(self, key, features):
+        self.shelf[key] = features
+
+    def clear(self):
+        self.shelf.clear()
+
+    def prune(self, keys):
+        """
+        Удаление признаков предложений, которых больше нет в train'е.
+        """
+        keys = set(keys)
+        keys.add(VOCABULARY_KEY)
+        for key in [key for key in self.shelf.keys() if key not in keys]:
+            del self.shelf[key]
+            self.pruned += 1
+
+    def load_vocabulary(self):
+        if not os.path.exists(self.vocabulary_path):
+            return []
+        return self.data_loader.load_lines(self.vocabulary_path)
+
+    def save_vocabulary(self, attributes):
+        """
+        Сохранение словаря признаков в файл и записи о нём в кэш (кэш должен быть открыт).
+        Файл пишется первым: если запись о нём не успеет сохраниться, файл всё равно будет продолжением
+        словаря, который в кэше записан.
+        """
+        self.data_loader.save_lines(self.vocabulary_path, attributes)
+        self.shelf[VOCABULARY_KEY] = (len(attributes), vocabulary_hash(attributes))
+
+    def check_vocabulary(self, attributes):
+        """
+        Проверка, что идентификаторы в кэше закодированы словарём attributes (загруженным из файла словаря
+        и, возможно, уже дополненным): словарь, записанный в кэше, должен быть его началом.
+        Если это не так (файла словаря нет, он короче или другой), кэш очищается и возвращается False.
+        """
+        record = self.shelf.get(VOCABULARY_KEY)
+        if record is not None:
+            size, attributes_hash = record
+            if len(attributes) >= size and vocabulary_hash(attributes[:size]) == attributes_hash:
+                return True
+        elif not len(self.shelf):
+            return True
+        self.clear()
+        return False
+
+    def stats(self):
+        return {'path': self.path,
+                'hits': self.hits,
+                'misses': self.misses,
+                'pruned': self.pruned}
@@ -0,0 +1,140 @@
+"""
+Компактное представление признаков: вместо словаря признаков на каждый токен - кортеж идентификаторов
+атрибутов crfsuite. Идентификаторы выдаются словарём признаков языка (FeatureVocabulary), который
+сохраняется рядом с моделями и при inference загружается в неизменяемом виде.
+"""
+from pipeline.feature_extractor import FeatureExtractor, WINDOW_FEATURE_NAMES, LEFT_WINDOW, RIGHT_WINDOW
+
+
+def attribute_name(name, value):
+    """
+    Имя атрибута crfsuite для признака name со значением value - такое же, какое python-crfsuite строит
+    из словаря признаков: 'name:value' для строкового значения и name для числового.
+    Все признаки FeatureExtractor бинарные, поэтому признак с нулевым значением (False, 0) атрибута не даёт:
+    его вес в модели всё равно остаётся нулевым. Для такого признака возвращается None.
+    """
+    if isinstance(value, str):
+        return '{}:{}'.format(name, value)
+    if value:
+        return name
+    return None
+
+
+class FeatureVocabulary:
+    """
+    Словарь признаков: строка атрибута -> идентификатор (его номер в виде строки).
+    Строка идентификатора создаётся один раз и затем используется во всех токенах.
+    В неизменяемом словаре (frozen = True) новые атрибуты не добавляются, а отбрасываются:
+    модель, обученная без них, их всё равно не знает.
+    """
+
+    def __init__(self, attributes=(), frozen=False):
+        self.ids = {}
+        self.attributes = []
+        for attribute in attributes:
+            self.add(attribute)
+        self.frozen = frozen
+
+    def __len__(self):
+        return len(self.attributes)
+
+    def add(self, attribute):
+        attribute_id = str(len(self.attributes))
+        self.ids[attribute] = attribute_id
+        self.attributes.append(attribute)
+        return attribute_id
+
+    def get(self, attribute):
+        if attribute is None:
+            return None
+        attribute_id = self.ids.get(attribute)
+        if attribute_id is None and not self.frozen:
+            attribute_id = self.add(attribute)
+        return attribute_id
+
+    def encode(self, names, values):
+        """
+        Кортеж идентификаторов для признаков с именами names и значениями values.
+        """
+        ids = [self.get(attribute_name(name, value)) for name, value in zip(names, values)]
+        return tuple(attribute_id for attribute_id in ids if attribute_id is not None)
+
+
+class FeatureEncoder(FeatureExtractor):
+    """
+    Извлечение тех же признаков, что у FeatureExtractor.sent2features, но сразу в виде кортежей
+    идентификаторов атрибутов (в том же порядке), без промежуточных словарей на каждый токен.
+    Кортежи передаются в sklearn_crfsuite.CRF вместо словарей признаков.
+    Кэш словоформ (words_cache) хранит для каждой формы готовые кортежи для всех позиций окна.
+    N-граммные признаки не поддерживаются.
+    """
+
+    def __init__(self, vocabulary=None, cache_size=100000):
+        super().__init__(cache_size=cache_size)
+        self.vocabulary = vocabulary if vocabulary is not None else FeatureVocabulary()
+        self.bos_items = self.vocabulary.encode(['BOS'], [True])
+        self.eos_items = self.vocabulary.encode(['EOS'], [True])
+
+    def cached_words_items(self, word):
+        """
+        Идентификаторы признаков словоформы для каждой позиции окна ('', '-1:', '+2:' и т.д.).
+        Для текущего токена ('') к ним добавлены сама словоформа в lowercase и bias.
+        """
+        cached = self.words_cache.get(word)
+        if cached is None:
+            word_features = self.compute_words_features(word)
+            cached = {prefix: self.vocabulary.encode(names, word_features)
+                      for prefix, names in WINDOW_FEATURE_NAMES.items()}
+            cached[''] += self.vocabulary.encode(['word', 'bias'], [word.lower(), 1.0])
+            self.words_cache.put(word, cached)
+        return cached
+
+    def empty_morphemes(self):
+        return ()
+
+    def labels_morpheme_features(self, labels):
+        """
+        То же, что FeatureExtractor.labels_morpheme_features: идентификаторы меток морфем, которые есть в слове.
+        Кортежи запоминаются для каждого набора меток.
+        """
+        items = self.morpheme_features_cache.get(labels)
+        if items is None:
+            present_labels = self.morpheme_preproc.present_labels(labels)
+            items = self.vocabulary.encode(present_labels, [1] * len(present_labels))
+            self.morpheme_features_cache[labels] = items
+        return items
+
+    def sent2features(self, sent, sent_id, postags=False):
+        """
+        Кортежи идентификаторов для всех токенов предложения; окно собирается так же,
+        как в FeatureExtractor.sent2window_features.
+        """
+        sent_len = len(sent)
+        prefixed = [self.cached_words_items(word['form']) for word in sent]
+        sent_items = []
+        for i, word in enumerate(sent):
+            items = list(prefixed[i][''])
+            if sent_len == 1 or i == 0:
+                items.extend(self.bos_items)
+            elif i == sent_len - 1:
+                items.extend(self.eos_items)
+            for offset, prefix in LEFT_WINDOW:
+                if i - offset >= 0:
+                    items.extend(prefixed[i - offset][prefix])
+            for offset, prefix in RIGHT_WINDOW:
+                if i + offset < sent_len:
+                    items.extend(prefixed[i + offset][prefix])
+            if self.morphemes:
+                items.extend(self.morpheme_features(sent, i, sent_id))
+            items = tuple(items)
+            if postags:
+                items = self.add_postag(items, word['upostag'])
+            sent_items.append(items)
+        return sent_items
+
+    def add_postag(self, word_features, postag):
+        return word_features + self.vocabulary.encode(['postag'], [postag])
+
+    def add_pos_features(self, X, y_pred):
+        return [[self.add_postag(word_features, postag) for word_features, postag in zip(sent, sent_labels)]
+                for sent, sent_labels in zip(X, y_pred)]
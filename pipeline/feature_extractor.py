@@ -1,38 +1,126 @@
 from collections import OrderedDict
 
-import numpy as np
 from nltk.util import ngrams
 
+from utils.utils import split_multiwords
+
+
+WORDS_FEATURE_NAMES = ['word_is_upper', 'word_is_title', 'word_is_digit', 'pref[0]', 'suf[-1]',
+                       'pref[:2]', 'suf[-2:]', 'pref[:3]', 'suf[-3:]', 'pref[:4]', 'suf[-4:]']
+# имена признаков all_words_features для каждой позиции окна (текущий токен и по 3 токена слева и справа)
+WINDOW_FEATURE_NAMES = OrderedDict(
+    (prefix, ['{}{}'.format(prefix, name) for name in WORDS_FEATURE_NAMES])
+    for prefix in ['', '-1:', '-2:', '-3:', '+1:', '+2:', '+3:']
+)
+# смещения и префиксы позиций левого и правого контекста в окне
+LEFT_WINDOW = [(1, '-1:'), (2, '-2:'), (3, '-3:')]
+RIGHT_WINDOW = [(1, '+1:'), (2, '+2:'), (3, '+3:')]
+# морфемные признаки слова без сегментации - один общий пустой словарь
+EMPTY_MORPHEME_FEATURES = {}
+
+
+class WordsFeaturesCache:
+    """
+    LRU-кэш признаков словоформ, общий для всего корпуса.
+    Размер ограничен max_size записями; max_size = 0 отключает кэширование.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, word):
+        value = self.cache.get(word)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.cache.move_to_end(word)
+        return value
+
+    def put(self, word, value):
+        if self.max_size <= 0:
+            return
+        self.cache[word] = value
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def stats(self):
+        return {'size': len(self.cache),
+                'hits': self.hits,
+                'misses': self.misses}
+
 
 class FeatureExtractor:
     """
     Класс для извлечения признаков.
     """
 
-    def __init__(self, features=None):
+    def __init__(self, features=None, cache_size=100000):
         self.features = features
+        self.words_cache = WordsFeaturesCache(max_size=cache_size)
         self.hyphen_parts_indexes = OrderedDict()
         self.morpheme_preproc = None
         self.morphemes = None
+        self.morpheme_features_cache = {}
 
     def set_morpheme_preproc(self, morpheme_preproc):
         self.morpheme_preproc = morpheme_preproc
         self.morphemes = self.morpheme_preproc.morphemes
+        self.morpheme_features_cache = {}
 
     def set_morphemes_fold(self, morphemes_fold):
         self.morphemes = morphemes_fold
 
     def del_hyphen_parts(self, dataset):
         """
-        Удаление из train'а токенов дефисных написаний (с id-шниками типа 1-2 и без тегов)
+        Удаление из train'а токенов дефисных написаний (с id-шниками типа 1-2 и без тегов).
+        Исходные предложения не изменяются. Удалённые токены всех предложений, где они были, сохраняются
+        в hyphen_parts_indexes: номер предложения -> индекс многословных токенов (см. utils.utils.split_multiwords).
         """
-        for i, sent in enumerate(dataset.copy()):
-            for j, word in enumerate(sent):
-                if type(word['id']) == tuple:
-                    self.hyphen_parts_indexes[i] = {'pre_hyphen': j + 1,
-                                                    'post_hyphen': j + 2}
-                    dataset[i].pop(j)
-        return dataset
+        result = []
+        self.hyphen_parts_indexes = OrderedDict()
+        for i, sent in enumerate(dataset):
+            words, multiwords = split_multiwords(sent)
+            if multiwords:
+                self.hyphen_parts_indexes[i] = multiwords
+            result.append(words)
+        return result
+
+    def compute_words_features(self, word):
+        """
+        Признаки словоформы, не зависящие от её положения в окне (см. all_words_features).
+        """
+        word_features = [word.isupper(), word.istitle(), word.isdigit(), word[0], word[-1]]  # признаки 1-4
+        if len(word) > 1:                                       # префиксы и суффиксы в зависимости от длины слова
+            word_features.extend([word[:2], word[-2:]])
+        if len(word) > 2:
+            word_features.extend([word[:3], word[-3:]])
+        if len(word) > 3:
+            word_features.extend([word[:4], word[-4:]])
+        return tuple(word_features)
+
+    def cached_words_features(self, word):
+        """
+        Признаки словоформы из LRU-кэша: кортеж признаков и словари признаков с префиксами позиций окна
+        ('', '-1:', '+2:' и т.д.). При промахе всё вычисляется один раз и кладётся в кэш.
+        """
+        cached = self.words_cache.get(word)
+        if cached is None:
+            word_features = self.compute_words_features(word)
+            prefixed = {prefix: dict(zip(names, word_features)) for prefix, names in WINDOW_FEATURE_NAMES.items()}
+            cached = (word_features, prefixed)
+            self.words_cache.put(word, cached)
+        return cached
+
+    def prefixed_words_features(self, word, prefix):
+        """
+        Словарь признаков all_words_features для словоформы, ключи которого имеют префикс позиции в окне.
+        Словарь общий для всех вхождений формы, поэтому изменять его нельзя - только копировать.
+        """
+        return self.cached_words_features(word)[1][prefix]
 
     def all_words_features(self, sent, i, sent_id):
         """
@@ -44,15 +132,7 @@ class FeatureExtractor:
             4) первая и последняя буквы;
             5) если длина слова > 1, то префиксы и суффиксы длины от 2 до 4 символов.
         """
-        word = sent[i]['form']
-        word_features = [word.isupper(), word.istitle(), word.isdigit(), word[0], word[-1]]  # признаки 1-4
-        if len(word) > 1:                                       # префиксы и суффиксы в зависимости от длины слова
-            word_features.extend([word[:2], word[-2:]])
-        if len(word) > 2:
-            word_features.extend([word[:3], word[-3:]])
-        if len(word) > 3:
-            word_features.extend([word[:4], word[-4:]])
-        return word_features
+        return list(self.cached_words_features(sent[i]['form'])[0])
 
     def make_right_context_features(self, sent, i, sent_id):
         """
@@ -62,37 +142,18 @@ class FeatureExtractor:
         В дальнейшем это требуется для формирования списка всех слов окна, который передаётся в функцию ngrams.
         """
         word1 = sent[i + 1]['form']
-        word1_feat = self.all_words_features(sent, i + 1, sent_id)
         r_context = [word1]
-        r_context_features = dict(zip(['+1:word_is_upper', '+1:word_is_title', '+1:word_is_digit',
-                                       '+1:pref[0]', '+1:suf[-1]',
-                                       '+1:pref[:2]', '+1:suf[-2:]', '+1:pref[:3]', '+1:suf[-3:]',
-                                       '+1:pref[:4]', '+1:suf[-4:]'], word1_feat))
+        r_context_features = dict(self.prefixed_words_features(word1, '+1:'))
         if i == len(sent) - 3:
             word2 = sent[i + 2]['form']
-            word2_feat = (self.all_words_features(sent, i + 2, sent_id))
             r_context.append(word2)
-            w2_features = dict(zip(['+2:word_is_upper', '+2:word_is_title', '+2:word_is_digit',
-                                    '+2:pref[0]', '+2:suf[-1]',
-                                    '+2:pref[:2]', '+2:suf[-2:]', '+2:pref[:3]', '+2:suf[-3:]',
-                                    '+2:pref[:4]', '+2:suf[-4:]'], word2_feat))
-            r_context_features.update(w2_features)
+            r_context_features.update(self.prefixed_words_features(word2, '+2:'))
         if i < len(sent) - 3:
             word2 = sent[i + 2]['form']
-            word2_feat = (self.all_words_features(sent, i + 2, sent_id))
             word3 = sent[i + 3]['form']
-            word3_feat = (self.all_words_features(sent, i + 3, sent_id))
             r_context.extend([word2, word3])
-            w2_features = dict(zip(['+2:word_is_upper', '+2:word_is_title', '+2:word_is_digit',
-                                    '+2:pref[0]', '+2:suf[-1]',
-                                    '+2:pref[:2]', '+2:suf[-2:]', '+2:pref[:3]', '+2:suf[-3:]',
-                                    '+2:pref[:4]', '+2:suf[-4:]'], word2_feat))
-            w3_features = dict(zip(['+3:word_is_upper', '+3:word_is_title', '+3:word_is_digit',
-                                    '+3:pref[0]', '+3:suf[-1]',
-                                    '+3:pref[:2]', '+3:suf[-2:]', '+3:pref[:3]', '+3:suf[-3:]',
-                                    '+3:pref[:4]', '+3:suf[-4:]'], word3_feat))
-            r_context_features.update(w2_features)
-            r_context_features.update(w3_features)
+            r_context_features.update(self.prefixed_words_features(word2, '+2:'))
+            r_context_features.update(self.prefixed_words_features(word3, '+3:'))
         return r_context_features, r_context
 
     def make_left_context_features(self, sent, i, sent_id):
@@ -100,37 +161,19 @@ class FeatureExtractor:
         То же, что make_right_context_features, только для левого контекста.
         """
         word1 = sent[i - 1]['form']
-        word1_feat = self.all_words_features(sent, i - 1, sent_id)
         l_context = [word1]
-        l_context_features = dict(
-            zip(['-1:word_is_upper', '-1:word_is_title', '-1:word_is_digit', '-1:pref[0]', '-1:suf[-1]',
-                 '-1:pref[:2]', '-1:suf[-2:]', '-1:pref[:3]', '-1:suf[-3:]', '-1:pref[:4]', '-1:suf[-4:]'], word1_feat))
+        l_context_features = dict(self.prefixed_words_features(word1, '-1:'))
         if i == 2:
             word2 = sent[i - 2]['form']
-            word2_feat = self.all_words_features(sent, i - 2, sent_id)
             l_context.insert(0, word2)
-            w2_features = dict(
-                zip(['-2:word_is_upper', '-2:word_is_title', '-2:word_is_digit', '-2:pref[0]', '-2:suf[-1]',
-                     '-2:pref[:2]', '-2:suf[-2:]', '-2:pref[:3]', '-2:suf[-3:]', '-2:pref[:4]', '-2:suf[-4:]'],
-                    word2_feat))
-            l_context_features.update(w2_features)
+            l_context_features.update(self.prefixed_words_features(word2, '-2:'))
         if i > 2:
             word2 = sent[i - 2]['form']
-            word2_feat = self.all_words_features(sent, i - 2, sent_id)
             word3 = sent[i - 3]['form']
-            word3_feat = self.all_words_features(sent, i - 3, sent_id)
             l_context.insert(0, word2)
             l_context.insert(0, word3)
-            w2_features = dict(
-                zip(['-2:word_is_upper', '-2:word_is_title', '-2:word_is_digit', '-2:pref[0]', '-2:suf[-1]',
-                     '-2:pref[:2]', '-2:suf[-2:]', '-2:pref[:3]', '-2:suf[-3:]', '-2:pref[:4]', '-2:suf[-4:]'],
-                    word2_feat))
-            w3_features = dict(
-                zip(['-3:word_is_upper', '-3:word_is_title', '-3:word_is_digit', '-3:pref[0]', '-3:suf[-1]',
-                     '-3:pref[:2]', '-3:suf[-2:]', '-3:pref[:3]', '-3:suf[-3:]', '-3:pref[:4]', '-3:suf[-4:]'],
-                    word3_feat))
-            l_context_features.update(w2_features)
-            l_context_features.update(w3_features)
+            l_context_features.update(self.prefixed_words_features(word2, '-2:'))
+            l_context_features.update(self.prefixed_words_features(word3, '-3:'))
         return l_context_features, l_context
 
     def ngrams(self, window):
@@ -146,27 +189,43 @@ class FeatureExtractor:
         return bigr_features, trigr_features
 
     def empty_morphemes(self):
-        empty = np.zeros_like(self.morpheme_preproc.labels, dtype=int)
-        empty = empty.tolist()
-        return dict(zip(self.morpheme_preproc.label2ind.keys(), empty))
+        """
+        Морфемные признаки слова, для которого нет сегментации. Словарь общий для всех таких слов.
+        """
+        return EMPTY_MORPHEME_FEATURES
 
-    def morpheme_features(self, sent, i, sent_id):
-        word = sent[i]['form']
-        if i < len(self.morphemes[sent_id]):
-            word_with_morphemes = self.morphemes[sent_id][i]
-            if word != word_with_morphemes['form']:
-                # print('empty')
-                # print(sent)
-                # print(self.morphemes[sent_id])
-                return self.empty_morphemes()
-            return dict(zip(self.morpheme_preproc.label2ind.keys(), self.morpheme_preproc.one_hot(word_with_morphemes)))
-        else:
-            # print('empty')
-            # print(sent)
-            # print(self.morphemes[sent_id])
-            # assert 0 == 1
+    def labels_morpheme_features(self, labels):
+        """
+        Морфемные признаки по меткам морфем слова: только метки, которые в слове есть (со значением 1).
+        Нулевые признаки не добавляются. Старые модели, обученные с нулевыми признаками, размечают так же,
+        но при переобучении crfsuite получает другой набор признаков, и веса и разметка новых моделей
+        немного отличаются от обученных на полных векторах.
+        Признаки запоминаются для каждого набора меток; словарь общий для всех слов с этим набором,
+        поэтому изменять его нельзя - только копировать.
+        """
+        features = self.morpheme_features_cache.get(labels)
+        if features is None:
+            features = {label: 1 for label in self.morpheme_preproc.present_labels(labels)}
+            self.morpheme_features_cache[labels] = features
+        return features
+
+    def word_morpheme_labels(self, sent, i, sent_id):
+        """
+        Метки морфем i-го слова предложения или None, если сегментации для него нет
+        (или она относится к другой словоформе).
+        """
+        if i >= len(self.morphemes[sent_id]):
+            return None
+        word_with_morphemes = self.morphemes[sent_id][i]
+        if sent[i]['form'] != word_with_morphemes['form']:
+            return None
+        return tuple(morpheme['label'] for morpheme in word_with_morphemes['morphemes'])
 
+    def morpheme_features(self, sent, i, sent_id):
+        labels = self.word_morpheme_labels(sent, i, sent_id)
+        if labels is None:
             return self.empty_morphemes()
+        return self.labels_morpheme_features(labels)
 
     def word2features(self, sent, i, sent_id, add_postags=False, ngrams=False):
         """
@@ -188,9 +247,7 @@ class FeatureExtractor:
         (для обучения классификаторов, предсказывающих грамматические категории).
         """
         word = sent[i]['form']
-        word_feat = self.all_words_features(sent, i, sent_id)
-        features = dict(zip(['word_is_upper', 'word_is_title', 'word_is_digit', 'pref[0]', 'suf[-1]',
-                             'pref[:2]', 'suf[-2:]', 'pref[:3]', 'suf[-3:]', 'pref[:4]', 'suf[-4:]'], word_feat))
+        features = dict(self.prefixed_words_features(word, ''))
 
         features.update({'word': word.lower(),
                          'bias': 1.0})
@@ -230,8 +287,53 @@ class FeatureExtractor:
     def sent2features(self, sent, sent_id, postags=False, ngrams=False):
         """
         Все признаки для одного предложения.
+        Без n-грамм признаки строятся сразу для всего предложения (см. sent2window_features).
+        """
+        if ngrams:
+            return [self.word2features(sent, i, sent_id, postags, ngrams) for i in range(len(sent))]
+        return self.sent2window_features(sent, sent_id, postags)
+
+    def sent2window_features(self, sent, sent_id, postags=False):
         """
-        return [self.word2features(sent, i, sent_id, postags, ngrams) for i in range(len(sent))]
+        Признаки предложения, совпадающие с word2features (без n-грамм) для каждого токена, включая порядок ключей.
+        Признаки словоформ для всех позиций окна берутся для каждого токена один раз, после чего окно ±3
+        собирается сдвигом по этому списку, без отдельной обработки каждой границы предложения.
+        """
+        sent_len = len(sent)
+        prefixed = [self.cached_words_features(word['form'])[1] for word in sent]
+        sent_features = []
+        for i, word in enumerate(sent):
+            features = dict(prefixed[i][''])
+            features['word'] = word['form'].lower()
+            features['bias'] = 1.0
+            if sent_len == 1 or i == 0:
+                features['BOS'] = True
+            elif i == sent_len - 1:
+                features['EOS'] = True
+            for offset, prefix in LEFT_WINDOW:
+                if i - offset >= 0:
+                    features.update(prefixed[i - offset][prefix])
+            for offset, prefix in RIGHT_WINDOW:
+                if i + offset < sent_len:
+                    features.update(prefixed[i + offset][prefix])
+            if self.morphemes:
+                features.update(self.morpheme_features(sent, i, sent_id))
+            if postags:
+                features['postag'] = word['upostag']
+            sent_features.append(features)
+        return sent_features
+
+    def is_gc_sample(self, word, pos_tags):
+        """
+        Проверка, участвует ли слово в обучении классификатора грамматической категории,
+        которая свойственна частям речи pos_tags.
+        Для знаменательных частей речи (и ADP, AUX) слово берётся, только если у него есть грам. признаки.
+        """
+        if word['upostag'] not in pos_tags:
+            return False
+        if word['upostag'] in ['NOUN', 'VERB', 'ADJ', 'PRON', 'ADP', 'AUX', 'ADV']:
+            return bool(word['feats'])
+        return True
 
     def sent2features_gc(self, sent, sent_id, category, pos_tags):
         """
@@ -240,15 +342,9 @@ class FeatureExtractor:
         sent_features = []
         sent_labels = []
         for i in range(len(sent)):
-            if sent[i]['upostag'] in ['NOUN', 'VERB', 'ADJ', 'PRON', 'ADP', 'AUX', 'ADV']:
-                if sent[i]['feats']:
-                    if sent[i]['upostag'] in pos_tags:
-                        sent_features.append(self.word2features(sent, i, sent_id, add_postags=True))
-                        sent_labels.append(self.word2label_gc(sent[i], category))
-            else:
-                if sent[i]['upostag'] in pos_tags:
-                    sent_features.append(self.word2features(sent, i, sent_id, add_postags=True))
-                    sent_labels.append(self.word2label_gc(sent[i], category))
+            if self.is_gc_sample(sent[i], pos_tags):
+                sent_features.append(self.word2features(sent, i, sent_id, add_postags=True))
+                sent_labels.append(self.word2label_gc(sent[i], category))
         assert(len(sent_features) == len(sent_labels))
         return sent_features, sent_labels
 
@@ -275,6 +371,12 @@ class FeatureExtractor:
             sent_labels = [self.word2label_gc(sent[i], category) for i in range(len(sent))]
         return sent_labels
 
+    def add_postag(self, word_features, postag):
+        """
+        Копия признаков токена с добавленным частеречным тегом.
+        """
+        return dict(word_features, postag=postag)
+
     def add_pos_features(self, X, y_pred):
         """
         Добавление уже предсказанных частеречных тегов в качестве признаков.
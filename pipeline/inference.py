@@ -1,75 +1,347 @@
 import os
+import json
+import hashlib
 import logging
 from collections import OrderedDict
 from argparse import ArgumentParser
 
-from utils.utils import check_form_to_morpheme, init_logging
+from utils.utils import init_logging, invert_dict, iter_chunks, split_multiwords, \
+    align_morphemes
 from utils.data_loader import DataLoader
+from utils.conllu_writer import ConlluWriter
+from utils.model_registry import ModelRegistry
+from utils.instrumentation import Instrumentation
 from pipeline.feature_extractor import FeatureExtractor
+from pipeline.feature_encoder import FeatureEncoder, FeatureVocabulary
+from pipeline.joint_labels import JointLabels
+from pipeline.result_cache import ResultCache
 from utils.morpheme_preprocessor import MorphemePreprocessor
 
 
 class Inference:
-    def __init__(self, lang_prefix, path_to_save, add_morpheme_features=False):
+    def __init__(self, lang_prefix, path_to_save, add_morpheme_features=False, gc_decoding='batch',
+                 feature_cache_size=100000, input_file=None, model_format='pickle', model_registry=None,
+                 instrumentation=None, feature_encoding='dict', joint=False, morphemes_file=None,
+                 result_cache=None):
         self.lang_prefix = lang_prefix
         self.path_to_save = path_to_save
         self.add_morpheme_features = add_morpheme_features
+        self.gc_decoding = gc_decoding
+        self.model_format = model_format
+        self.feature_encoding = feature_encoding
         self.data_loader = DataLoader()
-        self.feature_extractor = FeatureExtractor()
+        if self.feature_encoding == 'ids':
+            vocabulary = FeatureVocabulary(self.data_loader.load_vocabulary(self.lang_prefix), frozen=True)
+            self.feature_extractor = FeatureEncoder(vocabulary, cache_size=feature_cache_size)
+        else:
+            self.feature_extractor = FeatureExtractor(cache_size=feature_cache_size)
+        self.model_registry = model_registry or ModelRegistry(model_format=model_format, data_loader=self.data_loader)
+        self.instrumentation = instrumentation or Instrumentation()
+        self.result_cache = result_cache
+        self._model_version = None
+        self._checked_tasks = set()
 
-        self.test_file = 'test_data/{}.test.ud'.format(self.lang_prefix)
-        self.morphemes_path = 'test_data/morpheme/{}.test.morph'.format(self.lang_prefix)
+        self.test_file = input_file or self.data_loader.find_input('test_data/{}.test.ud'.format(self.lang_prefix))
+        self.morphemes_path = morphemes_file or \
+            self.data_loader.find_input('test_data/morpheme/{}.test.morph'.format(self.lang_prefix))
         self.models_path = 'models/{}'.format(self.lang_prefix)
         self.morphemes_index_path = 'models/{}/{}_morphemes.pkl'.format(self.lang_prefix, self.lang_prefix)
 
         self.categories = self.data_loader.load_json('data/grammar_data/{}_categories.json'.format(self.lang_prefix))
         self.pos2categories = self.data_loader.load_json(
             'data/grammar_data/{}_pos2categories.json'.format(self.lang_prefix))
+        self.categories2pos = invert_dict(self.pos2categories)
+        self.joint_labels = JointLabels(self.categories, self.categories2pos) if joint else None
 
-        init_logging('inference')
+    def load_models(self):
+        """
+        Предварительная загрузка в реестр POS-модели и моделей для всех грам. категорий.
+        Без неё модели загружаются при первом обращении.
+        """
+        tasks = ['joint'] if self.joint_labels else ['pos'] + list(self.categories)
+        for task in tasks:
+            self.get_model(task)
 
-    def inference(self):
-        test_data = self.data_loader.load_non_labeled(self.test_file)
-        logging.info('Test file {} is loaded'.format(self.test_file))
+    def get_model(self, task):
+        if self.model_format == 'crfsuite' and task not in self._checked_tasks:
+            self.data_loader.check_model_features(self.lang_prefix, task,
+                                                  {'encoding': self.feature_encoding,
+                                                   'morphemes': bool(self.add_morpheme_features)})
+            self._checked_tasks.add(task)
+        return self.model_registry.get(self.lang_prefix, task)
 
-        if self.add_morpheme_features:
-            logging.info('Morphemes {} preprocessing...'.format(self.morphemes_path))
-            morphemes = list(self.data_loader.load_morphemes(self.morphemes_path))
-            labels2ind = self.data_loader.load_model(self.morphemes_index_path)
-            check_form_to_morpheme(test_data, morphemes)
-            morpheme_preprocessor = MorphemePreprocessor(lang_prefix=self.lang_prefix, morphemes=morphemes,
-                                                         labels2ind=labels2ind)
-            self.feature_extractor.set_morpheme_preproc(morpheme_preproc=morpheme_preprocessor)
+    def init_morpheme_preproc(self):
+        labels2ind = self.data_loader.load_model(self.morphemes_index_path)
+        morpheme_preprocessor = MorphemePreprocessor(lang_prefix=self.lang_prefix, morphemes=[],
+                                                     labels2ind=labels2ind)
+        self.feature_extractor.set_morpheme_preproc(morpheme_preproc=morpheme_preprocessor)
+
+    def model_version(self):
+        """
+        Версия моделей языка для ключей кэша результатов: хэш размеров и времени изменения файлов моделей
+        и настроек разметки. После переобучения моделей старые результаты из кэша не используются.
+        """
+        if self._model_version is None:
+            tasks = ['joint'] if self.joint_labels else ['pos'] + list(self.categories)
+            files = []
+            for task in tasks:
+                stat = os.stat(self.data_loader.model_path(self.lang_prefix, task, self.model_format))
+                files.append([task, stat.st_size, stat.st_mtime_ns])
+            config = [self.model_format, self.feature_encoding, self.gc_decoding, bool(self.add_morpheme_features)]
+            self._model_version = hashlib.sha1(json.dumps([files, config]).encode('utf-8')).hexdigest()[:12]
+        return self._model_version
+
+    def tag(self, sentences, morphemes=None):
+        """
+        Разметка списка предложений: предсказание постэгов и значений грамматических категорий.
+        morphemes - морфемная сегментация тех же предложений (если используются морфемные признаки).
+        С кэшем результатов размечаются только предложения, которых ещё нет в кэше (см. tag_cached).
+        Сегментация, не совпадающая со словами по числу предложений или слов, выравнивается (см. align_morphemes).
+        """
+        if morphemes is not None and (len(morphemes) != len(sentences) or any(
+                len(sent) != len(morph_sent) for sent, morph_sent in zip(sentences, morphemes))):
+            morphemes = self.align_morphemes(sentences, morphemes)
+        if self.result_cache is None:
+            return self.tag_sentences(sentences, morphemes)
+        return self.tag_cached(sentences, morphemes)
+
+    def tag_cached(self, sentences, morphemes=None):
+        """
+        Разметка с кэшем результатов: размеченные ранее предложения берутся из кэша, остальные размечаются
+        одним вызовом tag_sentences, причём повторы внутри порции размечаются один раз (и в кэше ищутся тоже
+        один раз, так что в статистику кэша попадают только различные предложения порции).
+        """
+        with self.instrumentation.span('result_cache', lang=self.lang_prefix) as span:
+            version = self.model_version()
+            keys = [self.result_cache.sentence_key(self.lang_prefix, version, sent,
+                                                   morphemes[i] if morphemes is not None else None)
+                    for i, sent in enumerate(sentences)]
+            values = {}
+            new_sents = OrderedDict()  # ключ -> номер первого предложения с этим ключом
+            for i, key in enumerate(keys):
+                if key not in values and key not in new_sents:
+                    value = self.result_cache.get(key)
+                    if value is None:
+                        new_sents[key] = i
+                    else:
+                        values[key] = value
+            span['sentences'] = len(sentences)
+            span['tagged'] = len(new_sents)
+
+        if new_sents:
+            indexes = list(new_sents.values())
+            tagged = self.tag_sentences([sentences[i] for i in indexes],
+                                        [morphemes[i] for i in indexes] if morphemes is not None else None)
+            for key, sent in zip(new_sents, tagged):
+                values[key] = self.result_cache.put(key, sent)
 
-        logging.info('Feature extraction...')
-        X_test = [self.feature_extractor.sent2features(sent, sent_id) for sent_id, sent in enumerate(test_data)]
+        for i, (key, sent) in enumerate(zip(keys, sentences)):
+            if new_sents.get(key) == i:
+                continue
+            postags, feats = values[key]
+            for word_i, word in enumerate(sent):
+                word['id'] = word_i + 1
+                word['upostag'] = postags[word_i]
+                word['feats'] = OrderedDict(feats[word_i])
+        return sentences
+
+    def tag_sentences(self, sentences, morphemes=None):
+        """
+        Разметка предложений моделями.
+        """
+        tokens = sum(len(sent) for sent in sentences)
+        if morphemes is not None:
+            with self.instrumentation.span('morpheme_alignment', lang=self.lang_prefix, tokens=tokens):
+                # сегментация уже выровнена (см. tag): слова с другой словоформой в сегментации
+                # размечаются без морфемных признаков
+                self.feature_extractor.set_morphemes_fold(morphemes)
+
+        with self.instrumentation.span('feature_extraction', lang=self.lang_prefix, tokens=tokens):
+            X_test = [self.feature_extractor.sent2features(sent, sent_id) for sent_id, sent in enumerate(sentences)]
 
-        pos_model = self.data_loader.load_model(os.path.join(self.models_path, '{}_pos.pkl'.format(self.lang_prefix)))
+        if self.joint_labels:
+            return self.tag_joint(sentences, X_test, tokens)
 
-        logging.info('POS prediction...')
-        pos_pred = pos_model.predict(X_test)  # определение постэгов слов в тестовой выборке
+        pos_model = self.get_model('pos')
+        with self.instrumentation.span('predict', lang=self.lang_prefix, task='pos', tokens=tokens):
+            pos_pred = list(pos_model.predict(X_test))  # определение постэгов слов в тестовой выборке
 
         # добавление полученных постэгов в качестве признаков для моделей, распознающих грам. категории
         X_test_new = self.feature_extractor.add_pos_features(X_test, pos_pred)
 
         pred_categories = self.pred_categories_dict_initializer(X_test_new)
-
         for category in self.categories:
-            logging.info('{} grammar category prediction...'.format(category))
-            gc_model = self.data_loader.load_model(os.path.join(
-                self.models_path, '{}_{}.pkl'.format(self.lang_prefix, category)))
-
-            for i, sent in enumerate(X_test_new):
-                for j, sample in enumerate(sent):
-                    if sample['postag'] in self.pos2categories:
-                        if category in self.pos2categories[sample['postag']]:
-                            prediction = gc_model.predict([[sample]])[0][0]
-                            if prediction != 'O':
-                                pred_categories[i][j][category] = prediction
-
-        result_test = self.add_tags(test_data, pos_pred, pred_categories)
+            gc_model = self.get_model(category)
+            with self.instrumentation.span('predict', lang=self.lang_prefix, task=category) as span:
+                if self.gc_decoding == 'batch':
+                    span['tokens'] = self.predict_category_batched(gc_model, category, X_test_new, pos_pred,
+                                                                   pred_categories)
+                else:
+                    span['tokens'] = self.predict_category_per_token(gc_model, category, X_test_new, pos_pred,
+                                                                     pred_categories)
+
+        return self.add_tags(sentences, pos_pred, pred_categories)
+
+    def tag_joint(self, sentences, X_test, tokens):
+        """
+        Разметка совместной моделью: одно предсказание на предложение, составная метка каждого токена
+        разбирается на постэг и значения грам. категорий.
+        """
+        joint_model = self.get_model('joint')
+        with self.instrumentation.span('predict', lang=self.lang_prefix, task='joint', tokens=tokens):
+            y_pred = joint_model.predict(X_test)
+
+        pos_pred = []
+        pred_categories = OrderedDict()
+        for i, sent_pred in enumerate(y_pred):
+            sent_split = [self.joint_labels.split(label) for label in sent_pred]
+            pos_pred.append([postag for postag, _ in sent_split])
+            pred_categories[i] = OrderedDict((j, feats) for j, (_, feats) in enumerate(sent_split))
+        return self.add_tags(sentences, pos_pred, pred_categories)
+
+    def inference(self):
+        """
+        Разметка всего файла. Возвращает число размеченных предложений и токенов.
+        """
+        with self.instrumentation.span('load', lang=self.lang_prefix) as span:
+            comments = []
+            test_data = self.data_loader.load_non_labeled(self.test_file, comments)
+            logging.info('Test file {} is loaded'.format(self.test_file))
+
+            morphemes = None
+            if self.add_morpheme_features:
+                logging.info('Morphemes {} preprocessing...'.format(self.morphemes_path))
+                morphemes = list(self.data_loader.load_morphemes(self.morphemes_path))
+                self.init_morpheme_preproc()
+            test_data, morphemes, multiwords = self.split_multiwords(test_data, morphemes)
+            span['tokens'] = sum(len(sent) for sent in test_data)
+
+        self.load_models()
+        logging.info('Tagging...')
+        result_test = self.tag(test_data, morphemes)
+        self.log_stats()
+        if self.result_cache is not None:
+            self.result_cache.save()
+
         logging.info('Writing to {}...'.format(self.path_to_save))
-        self.writing(result_test, self.path_to_save)
+        with self.instrumentation.span('writing', lang=self.lang_prefix, tokens=span['tokens']):
+            self.writing(result_test, self.path_to_save, multiwords, comments)
+        return {'sentences': len(result_test), 'tokens': span['tokens']}
+
+    def inference_stream(self, chunk_size):
+        """
+        Потоковая разметка: предложения читаются из файла (или stdin) по мере необходимости,
+        размечаются порциями по chunk_size предложений, и каждая порция сразу записывается в выходной файл
+        (или stdout). В памяти одновременно находится только одна порция.
+        Возвращает число размеченных предложений и токенов.
+        """
+        comments = []
+        sentences = self.data_loader.iter_non_labeled(self.test_file, comments)
+        morphemes = None
+        if self.add_morpheme_features:
+            morphemes = self.data_loader.load_morphemes(self.morphemes_path)
+            self.init_morpheme_preproc()
+        self.load_models()
+
+        logging.info('Streaming {} to {} by {} sentences...'.format(self.test_file, self.path_to_save, chunk_size))
+        sents_count, tokens_count = 0, 0
+        with self.data_loader.open_output(self.path_to_save) as result:
+            if morphemes:
+                # предложения без сегментации не отбрасываются, а размечаются без морфемных признаков
+                sentences = ((sent, next(morphemes, [])) for sent in sentences)
+            for chunk in iter_chunks(sentences, chunk_size):
+                chunk_morphemes = None
+                if morphemes:
+                    chunk, chunk_morphemes = [list(part) for part in zip(*chunk)]
+                chunk, chunk_morphemes, multiwords = self.split_multiwords(chunk, chunk_morphemes)
+                # комментарии прочитанных предложений копятся в comments по мере чтения файла
+                chunk_comments = comments[:len(chunk)]
+                del comments[:len(chunk)]
+                tagged = self.tag(chunk, chunk_morphemes)
+                with self.instrumentation.span('writing', lang=self.lang_prefix,
+                                               tokens=sum(len(sent) for sent in tagged)):
+                    self.write_sentences(tagged, result, multiwords, chunk_comments)
+                sents_count += len(chunk)
+                tokens_count += sum(len(sent) for sent in chunk)
+                logging.info('{} sentences are tagged'.format(sents_count))
+        self.log_stats()
+        if self.result_cache is not None:
+            self.result_cache.save()
+        logging.info('Finished')
+        return {'sentences': sents_count, 'tokens': tokens_count}
+
+    def split_multiwords(self, sentences, morphemes=None):
+        """
+        Отделение многословных токенов (с id-шниками типа 1-2) от слов, которые размечаются моделями.
+        Сегментация многословного токена делится между его частями так же, как при обучении
+        (см. utils.utils.align_morphemes).
+        Возвращает слова предложений, их сегментацию и индексы многословных токенов для записи результата.
+        """
+        split = [split_multiwords(sent) for sent in sentences]
+        if morphemes is not None:
+            morphemes = self.align_morphemes(sentences, morphemes)
+        return [words for words, _ in split], morphemes, [multiwords for _, multiwords in split]
+
+    def align_morphemes(self, sentences, morphemes):
+        """
+        Выравнивание сегментации по словам предложений (см. utils.utils.align_morphemes) вместо проверки:
+        расхождения пишутся в лог, а слова без подходящей сегментации размечаются без морфемных признаков
+        (см. FeatureExtractor.word_morpheme_labels). Предложениям, для которых сегментации нет, достаётся пустая.
+        """
+        _, aligned, misalignments = align_morphemes(sentences, morphemes)
+        for i, problems in misalignments.items():
+            logging.warning('Morphemes misalignment in sentence {}: {}'.format(i, '; '.join(problems)))
+        for sent in sentences[len(aligned):]:
+            aligned.append([{'form': word['form'], 'morphemes': []} for word in split_multiwords(sent)[0]])
+        return aligned
+
+    def log_stats(self):
+        logging.info('Word features cache: {}'.format(self.feature_extractor.words_cache.stats()))
+        logging.info('Model registry: {}'.format(self.model_registry.stats()))
+        if self.result_cache is not None:
+            logging.info('Result cache: {}'.format(self.result_cache.stats()))
+
+    def predict_category_per_token(self, gc_model, category, X_test, pos_pred, pred_categories):
+        """
+        Предсказание значений грамматической категории отдельно для каждого токена (без контекста).
+        pos_pred - предсказанные постэги, по которым отбираются токены.
+        Возвращает число размеченных токенов.
+        """
+        tokens = 0
+        for i, (sent, sent_pos) in enumerate(zip(X_test, pos_pred)):
+            for j, (sample, postag) in enumerate(zip(sent, sent_pos)):
+                if postag in self.pos2categories:
+                    if category in self.pos2categories[postag]:
+                        prediction = gc_model.predict([[sample]])[0][0]
+                        tokens += 1
+                        if prediction != 'O':
+                            pred_categories[i][j][category] = prediction
+        return tokens
+
+    def predict_category_batched(self, gc_model, category, X_test, pos_pred, pred_categories):
+        """
+        Предсказание значений грамматической категории одним вызовом модели для всей выборки.
+        Из каждого предложения выбираются токены, у которых предсказанная часть речи допускает данную категорию
+        (так же, как при обучении в FeatureExtractor.sent2features_gc), и подпоследовательности
+        размечаются моделью целиком. Затем предсказания раскладываются по своим местам в pred_categories.
+        Возвращает число размеченных токенов.
+        """
+        pos_tags = self.categories2pos.get(category, [])
+        X_category, positions = [], []
+        for i, (sent, sent_pos) in enumerate(zip(X_test, pos_pred)):
+            sent_positions = [j for j, postag in enumerate(sent_pos) if postag in pos_tags]
+            if sent_positions:
+                X_category.append([sent[j] for j in sent_positions])
+                positions.append((i, sent_positions))
+        if not X_category:
+            return 0
+
+        y_pred = gc_model.predict(X_category)
+        for (i, sent_positions), sent_pred in zip(positions, y_pred):
+            for j, prediction in zip(sent_positions, sent_pred):
+                if prediction != 'O':
+                    pred_categories[i][j][category] = prediction
+        return sum(len(sent_positions) for _, sent_positions in positions)
 
     def pred_categories_dict_initializer(self, test):
         """
@@ -99,33 +371,66 @@ class Inference:
                 word['feats'] = sent_gc_labels[word_i]  # добавление ключа 'feats'
         return result_test
 
-    def writing(self, results, filename):
+    def writing(self, results, filename, multiwords=None, comments=None):
         """
         Запись в файл полученных результатов.
         """
-        with open(filename, 'w', encoding='utf-8') as result:
-            for sent in results:
-                for word in sent:
-                    result.write('{}\t{}\t_\t{}\t_\t'.format(word['id'], word['form'], word['upostag']))
-                    if word['feats']:
-                        keys_list = word['feats'].keys()
-                        for i, key in enumerate(keys_list):
-                            if i < len(keys_list) - 1:
-                                result.write('{}={}|'.format(key, word['feats'][key]))
-                            else:
-                                result.write('{}={}\t_\t_\t_\t_\n'.format(key, word['feats'][key]))
-                    else:
-                        result.write('_\n')
-                result.write('\n')
+        with self.data_loader.open_output(filename) as result:
+            self.write_sentences(results, result, multiwords, comments)
         logging.info('Finished')
 
+    def write_sentences(self, results, result, multiwords=None, comments=None):
+        """
+        Запись размеченных предложений в открытый файл (см. utils.conllu_writer): столбцы, которые не
+        размечаются, берутся из входных данных, после записи файл сбрасывается на диск.
+        multiwords - индексы многословных токенов предложений (см. split_multiwords): их строки записываются
+        перед первым словом каждого токена. comments - строки комментариев предложений из входного файла,
+        они записываются перед предложениями.
+        """
+        with ConlluWriter(result) as writer:
+            writer.write_sentences(results, multiwords, comments)
+
 if __name__ == '__main__':
     arg_parser = ArgumentParser()
     arg_parser.add_argument('--lang', type=str, required=True)
-    arg_parser.add_argument('--save-to', dest='path_to_save', type=str, required=True)
+    arg_parser.add_argument('--save-to', dest='path_to_save', type=str, required=True,
+                            help='Path to the annotated file ("-" - stdout)')
+    arg_parser.add_argument('--input', dest='input_file', type=str, default=None, required=False,
+                            help='Path to the file to annotate ("-" - stdin), test_data/<lang>.test.ud by default')
+    arg_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=0, required=False,
+                            help='Tag and write sentences by chunks of this size (streaming mode), 0 - whole file')
     arg_parser.add_argument('--morphemes', dest='add_morpheme_features', default=False, type=bool, required=False,
                             help='Add morpheme features')
+    arg_parser.add_argument('--gc-decoding', dest='gc_decoding', type=str, default='batch', required=False,
+                            choices=['batch', 'token'],
+                            help='Grammar categories decoding: whole POS-filtered subsequences at once '
+                                 '(default; tags may differ from the earlier per-token output) '
+                                 'or every token separately (the output of previous versions)')
+    arg_parser.add_argument('--feature-cache-size', dest='feature_cache_size', default=100000, type=int,
+                            required=False, help='Max number of word forms in the features LRU cache (0 - disabled)')
+    arg_parser.add_argument('--model-format', dest='model_format', default='pickle', type=str, required=False,
+                            choices=['pickle', 'crfsuite'], help='Format of the saved models')
+    arg_parser.add_argument('--feature-encoding', dest='feature_encoding', default='dict', type=str, required=False,
+                            choices=['dict', 'ids'],
+                            help='Features representation (must be the same as in training)')
+    arg_parser.add_argument('--joint', default=False, type=bool, required=False,
+                            help='Tag with the joint POS+FEATS model')
+    arg_parser.add_argument('--result-cache-size', dest='result_cache_size', default=0, type=int, required=False,
+                            help='Max number of tagged sentences in the result cache (0 - disabled)')
+    arg_parser.add_argument('--result-cache-file', dest='result_cache_file', default=None, type=str, required=False,
+                            help='Load the result cache from this file and save it back after tagging')
     args = arg_parser.parse_args()
 
-    inference_object = Inference(args.lang, args.path_to_save, args.add_morpheme_features)
-    inference_object.inference()
+    instrumentation = Instrumentation()
+    init_logging('inference', instrumentation)
+    result_cache = None
+    if args.result_cache_size > 0:
+        result_cache = ResultCache(args.result_cache_size, args.result_cache_file)
+    inference_object = Inference(args.lang, args.path_to_save, args.add_morpheme_features, args.gc_decoding,
+                                 args.feature_cache_size, args.input_file, args.model_format,
+                                 instrumentation=instrumentation, feature_encoding=args.feature_encoding,
+                                 joint=args.joint, result_cache=result_cache)
+    if args.chunk_size > 0:
+        inference_object.inference_stream(args.chunk_size)
+    else:
+        inference_object.inference()
@@ -0,0 +1,64 @@
+"""
+Составные метки для совместного режима (одна CRF-модель для POS и грам. категорий):
+метка токена - частеречный тег и набор значений грам. категорий, например NOUN|Case=Nom|Number=Sing.
+"""
+from collections import Counter, OrderedDict
+
+
+class JointLabels:
+    """
+    Построение составных меток, замена редких наборов значений и разбор предсказанной метки обратно
+    на upostag и feats.
+    В набор попадают только категории из categories, которые допускает часть речи токена (categories2pos),
+    в порядке categories - как у моделей отдельных категорий.
+    """
+
+    def __init__(self, categories, categories2pos, min_count=2):
+        self.categories = list(categories)
+        self.categories2pos = categories2pos
+        self.min_count = min_count
+
+    def word2label(self, word):
+        postag = word['upostag'] if word['upostag'] != 'PROPN' else 'NOUN'
+        if postag == '_':
+            postag = 'X'
+        feats = word['feats'] or {}
+        parts = [postag]
+        for category in self.categories:
+            if category in feats and postag in self.categories2pos.get(category, []):
+                parts.append('{}={}'.format(category, feats[category]))
+        return '|'.join(parts)
+
+    def sent2labels(self, sent):
+        return [self.word2label(word) for word in sent]
+
+    def split(self, label):
+        """
+        Разбор составной метки: частеречный тег и OrderedDict значений грам. категорий.
+        """
+        parts = label.split('|')
+        return parts[0], OrderedDict(part.split('=', 1) for part in parts[1:])
+
+    def backoff(self, y):
+        """
+        Замена меток, которые встречаются в y реже min_count раз. Редкий набор заменяется самым полным
+        частым набором той же части речи, значения которого входят в редкий набор (при равенстве -
+        самым частым), а если такого нет - одним частеречным тегом.
+        Возвращает новый список меток и словарь замен.
+        """
+        counts = Counter(label for sent_labels in y for label in sent_labels)
+        frequent = {}
+        for label, count in counts.items():
+            if count >= self.min_count:
+                postag, feats = self.split(label)
+                frequent.setdefault(postag, []).append((len(feats), count, label, set(feats.items())))
+        replacements = {}
+        for label, count in counts.items():
+            if count >= self.min_count:
+                continue
+            postag, feats = self.split(label)
+            feats = set(feats.items())
+            candidates = [candidate for candidate in frequent.get(postag, []) if candidate[3] <= feats]
+            replacements[label] = max(candidates)[2] if candidates else postag
+        y = [[replacements.get(label, label) for label in sent_labels] for sent_labels in y]
+        return y, replacements
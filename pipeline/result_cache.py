@@ -0,0 +1,85 @@
+"""
+Кэш результатов разметки предложений: для повторяющихся предложений (заголовки, устойчивые фразы, повторно
+присланные документы) постэги и значения грам. категорий берутся из кэша без извлечения признаков и
+предсказания моделей.
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    LRU-кэш разметки предложений. Ключ - язык, версия моделей (см. Inference.model_version), словоформы
+    предложения и, если используются морфемные признаки, его морфемная сегментация; значение - кортежи
+    постэгов и значений грам. категорий токенов.
+    Размер ограничен max_size предложениями. Если задан path, кэш загружается из файла при создании
+    и сохраняется в него методом save. Кэш можно разделять между несколькими объектами Inference.
+    """
+
+    def __init__(self, max_size=100000, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.cache = pickle.load(f)
+            self.evict()
+
+    def sentence_key(self, lang, model_version, sent, morphemes=None):
+        forms = tuple(word['form'] for word in sent)
+        segmentation = None
+        if morphemes is not None:
+            segmentation = tuple(tuple((morpheme['morpheme'], morpheme['label']) for morpheme in word['morphemes'])
+                                 for word in morphemes)
+        return lang, model_version, forms, segmentation
+
+    def get(self, key):
+        with self.lock:
+            value = self.cache.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return value
+
+    def put(self, key, sent):
+        """
+        Сохранение разметки предложения sent (после Inference.add_tags). Возвращает сохранённое значение.
+        """
+        value = (tuple(word['upostag'] for word in sent),
+                 tuple(tuple(word['feats'].items()) for word in sent))
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            self.evict()
+        return value
+
+    def evict(self):
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            with open(self.path, 'wb') as f:
+                pickle.dump(self.cache, f)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {'size': len(self.cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / requests, 3) if requests else 0.0}
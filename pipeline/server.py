@@ -0,0 +1,229 @@
+import io
+import json
+import logging
+import threading
+from collections import OrderedDict
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.utils import init_logging
+from utils.corpus import Token
+from utils.model_registry import ModelRegistry
+from utils.instrumentation import Instrumentation
+from pipeline.inference import Inference
+from pipeline.result_cache import ResultCache
+
+
+class TaggerService:
+    """
+    Теггер, который держит в памяти модели для нескольких языков и размечает предложения по запросу.
+    Для каждого языка создаётся свой объект Inference; одновременно с ним работает только один поток.
+    Модели всех языков хранятся в общем реестре: при max_models = None они загружаются сразу при старте,
+    иначе - при первом обращении, и в памяти остаётся не больше max_models последних использованных моделей.
+    result_cache - общий для всех языков кэш результатов (pipeline.result_cache.ResultCache) или None.
+    """
+
+    def __init__(self, langs, add_morpheme_features=False, gc_decoding='batch', feature_cache_size=100000,
+                 model_format='pickle', max_models=None, instrumentation=None, feature_encoding='dict',
+                 joint=False, result_cache=None):
+        self.add_morpheme_features = add_morpheme_features
+        self.result_cache = result_cache
+        self.model_registry = ModelRegistry(model_format=model_format, max_models=max_models)
+        self.inferences = OrderedDict()
+        self.locks = {}
+        for lang in langs:
+            inference = Inference(lang, path_to_save=None, add_morpheme_features=add_morpheme_features,
+                                  gc_decoding=gc_decoding, feature_cache_size=feature_cache_size,
+                                  model_format=model_format, model_registry=self.model_registry,
+                                  instrumentation=instrumentation, feature_encoding=feature_encoding,
+                                  joint=joint, result_cache=result_cache)
+            if add_morpheme_features:
+                inference.init_morpheme_preproc()
+            if max_models is None:
+                logging.info('Loading models for {}...'.format(lang))
+                inference.load_models()
+            self.inferences[lang] = inference
+            self.locks[lang] = threading.Lock()
+
+    def make_sentences(self, tokens):
+        """
+        Преобразование токенизированных предложений (списков словоформ) в формат load_non_labeled.
+        """
+        return [[Token(i + 1, form) for i, form in enumerate(sent)] for sent in tokens]
+
+    def make_morphemes(self, inference, tokens, segmentations):
+        """
+        Морфемная сегментация в формате DataLoader.load_morphemes: для каждой словоформы - строка сегментации
+        (как во втором столбце .morph-файла).
+        """
+        return [[{'form': form, 'morphemes': list(inference.data_loader.extract_morphemes(segmentation))}
+                 for form, segmentation in zip(sent, sent_segmentations)]
+                for sent, sent_segmentations in zip(tokens, segmentations)]
+
+    def tag(self, lang, tokens, segmentations=None):
+        if lang not in self.inferences:
+            raise ValueError('Unknown language {}'.format(lang))
+        inference = self.inferences[lang]
+        sentences = self.make_sentences(tokens)
+        morphemes = None
+        if self.add_morpheme_features:
+            if segmentations is None:
+                raise ValueError('Morpheme segmentation is required')
+            morphemes = self.make_morphemes(inference, tokens, segmentations)
+        with self.locks[lang]:
+            return inference.tag(sentences, morphemes)
+
+    def to_conllu(self, lang, tagged):
+        output = io.StringIO()
+        self.inferences[lang].write_sentences(tagged, output)
+        return output.getvalue()
+
+    def to_json(self, tagged):
+        return [[{'id': word['id'],
+                  'form': word['form'],
+                  'upostag': word['upostag'],
+                  'feats': word['feats']} for word in sent] for sent in tagged]
+
+
+class TaggerRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health - список загруженных языков.
+    POST /tag - разметка предложений. Тело запроса (JSON):
+        {"lang": "evn",
+         "sentences": [["форма1", "форма2", ...], ...],
+         "morphemes": [["сегментация1", "сегментация2", ...], ...],  (только для теггера с морфемными признаками)
+         "format": "conllu" | "json"}
+    """
+    service = None
+
+    def send_body(self, code, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', '{}; charset=utf-8'.format(content_type))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code, obj):
+        self.send_body(code, json.dumps(obj, ensure_ascii=False), 'application/json')
+
+    def do_GET(self):
+        if self.path == '/health':
+            health = {'langs': list(self.service.inferences),
+                      'models': self.service.model_registry.stats()}
+            if self.service.result_cache is not None:
+                health['results'] = self.service.result_cache.stats()
+            self.send_json(200, health)
+        else:
+            self.send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+
+    def read_request(self):
+        """
+        Чтение и проверка тела запроса: язык - один из загруженных, предложения - непустые списки непустых строк,
+        сегментация (если есть) - строки, по одной на каждую словоформу. Возвращает язык, предложения, сегментацию
+        и формат ответа.
+        """
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as e:
+            raise ValueError('Bad request: invalid JSON ({})'.format(e))
+        if not isinstance(request, dict):
+            raise ValueError('Bad request: a JSON object is expected')
+        if 'lang' not in request or 'sentences' not in request:
+            raise ValueError('Bad request: "lang" and "sentences" are required')
+        lang, tokens, segmentations = request['lang'], request['sentences'], request.get('morphemes')
+        if not isinstance(lang, str) or lang not in self.service.inferences:
+            raise ValueError('Bad request: unknown language {}'.format(lang))
+        output_format = request.get('format', 'conllu')
+        if output_format not in {'conllu', 'json'}:
+            raise ValueError('Unknown format {}'.format(output_format))
+        if not isinstance(tokens, list):
+            raise ValueError('Bad request: "sentences" must be a list of sentences')
+        for sent_i, sent in enumerate(tokens):
+            if not isinstance(sent, list) or not sent:
+                raise ValueError('Bad request: sentence {} must be a non-empty list of forms'.format(sent_i))
+            if not all(isinstance(form, str) and form for form in sent):
+                raise ValueError('Bad request: forms of sentence {} must be non-empty strings'.format(sent_i))
+        if segmentations is not None:
+            if not isinstance(segmentations, list) or len(segmentations) != len(tokens):
+                raise ValueError('Bad request: "morphemes" must contain a segmentation for every sentence')
+            for sent_i, (sent, sent_segmentations) in enumerate(zip(tokens, segmentations)):
+                if not isinstance(sent_segmentations, list) or len(sent_segmentations) != len(sent) or \
+                        not all(isinstance(segmentation, str) for segmentation in sent_segmentations):
+                    raise ValueError('Bad request: segmentation of sentence {} must be a string for every form '
+                                     '({} forms)'.format(sent_i, len(sent)))
+        return lang, tokens, segmentations, output_format
+
+    def do_POST(self):
+        if self.path != '/tag':
+            self.send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+            return
+        try:
+            lang, tokens, segmentations, output_format = self.read_request()
+            tagged = self.service.tag(lang, tokens, segmentations)
+            if output_format == 'json':
+                body = json.dumps({'sentences': self.service.to_json(tagged)}, ensure_ascii=False)
+            else:
+                body = self.service.to_conllu(lang, tagged)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            logging.exception('Failed to tag the request')
+            self.send_json(500, {'error': 'Internal error: {}: {}'.format(type(e).__name__, e)})
+            return
+        self.send_body(200, body, 'application/json' if output_format == 'json' else 'text/plain')
+
+    def log_message(self, format, *args):
+        logging.info('{} {}'.format(self.address_string(), format % args))
+
+
+def run_server(service, host, port):
+    TaggerRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), TaggerRequestHandler)
+    logging.info('Serving {} on http://{}:{}'.format(', '.join(service.inferences), host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if service.result_cache is not None:
+            service.result_cache.save()
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser()
+    arg_parser.add_argument('--langs', type=str, nargs='+', required=True)
+    arg_parser.add_argument('--host', type=str, default='127.0.0.1', required=False)
+    arg_parser.add_argument('--port', type=int, default=8000, required=False)
+    arg_parser.add_argument('--morphemes', dest='add_morpheme_features', default=False, type=bool, required=False,
+                            help='Add morpheme features')
+    arg_parser.add_argument('--gc-decoding', dest='gc_decoding', type=str, default='batch', required=False,
+                            choices=['batch', 'token'])
+    arg_parser.add_argument('--feature-cache-size', dest='feature_cache_size', default=100000, type=int,
+                            required=False, help='Max number of word forms in the features LRU cache (0 - disabled)')
+    arg_parser.add_argument('--model-format', dest='model_format', default='pickle', type=str, required=False,
+                            choices=['pickle', 'crfsuite'], help='Format of the saved models')
+    arg_parser.add_argument('--max-models', dest='max_models', default=None, type=int, required=False,
+                            help='Max number of models kept in memory (all models are preloaded by default)')
+    arg_parser.add_argument('--feature-encoding', dest='feature_encoding', default='dict', type=str, required=False,
+                            choices=['dict', 'ids'], help='Features representation (must be the same as in training)')
+    arg_parser.add_argument('--joint', default=False, type=bool, required=False,
+                            help='Tag with the joint POS+FEATS model')
+    arg_parser.add_argument('--result-cache-size', dest='result_cache_size', default=0, type=int, required=False,
+                            help='Max number of tagged sentences in the result cache (0 - disabled)')
+    arg_parser.add_argument('--result-cache-file', dest='result_cache_file', default=None, type=str, required=False,
+                            help='Load the result cache from this file on start and save it back on shutdown')
+    args = arg_parser.parse_args()
+
+    instrumentation = Instrumentation()
+    init_logging('server', instrumentation)
+    result_cache = None
+    if args.result_cache_size > 0:
+        result_cache = ResultCache(args.result_cache_size, args.result_cache_file)
+    tagger_service = TaggerService(args.langs, args.add_morpheme_features, args.gc_decoding, args.feature_cache_size,
+                                   args.model_format, args.max_models, instrumentation, args.feature_encoding,
+                                   args.joint, result_cache)
+    run_server(tagger_service, args.host, args.port)
@@ -1,35 +1,56 @@
 import os.path
 import logging
 from pathlib import Path
+from collections import OrderedDict
 from argparse import ArgumentParser
 
 from sklearn.model_selection import KFold
-import sklearn_crfsuite
-from sklearn_crfsuite import metrics
 
 from utils.utils import replace_morphemes, invert_dict, init_logging, get_categories
 from utils.data_loader import DataLoader
 from utils.morpheme_preprocessor import MorphemePreprocessor
+from utils.instrumentation import Instrumentation
 from pipeline.feature_extractor import FeatureExtractor
+from pipeline.feature_encoder import FeatureEncoder, FeatureVocabulary
+from pipeline.disk_feature_cache import DiskFeatureCache
+from pipeline.crf_tasks import fit_and_save, fit_and_evaluate, fit_and_predict, make_report, run_tasks, \
+    count_tokens, aggregate_reports, format_aggregated_report
+from pipeline.joint_labels import JointLabels
+from pipeline.crf_search import CRFSearch, sample_configs
+from pipeline.crf_compaction import compact_and_evaluate, compact_and_save
 
 
 class Pipeline:
-    def __init__(self, lang_prefix, add_morpheme_features=False):
+    def __init__(self, lang_prefix, add_morpheme_features=False, feature_cache_size=100000, data_path=None,
+                 instrumentation=None, feature_encoding='dict', disk_feature_cache=False):
         self.lang_prefix = lang_prefix
         self.add_morpheme_features = add_morpheme_features
+        self.feature_encoding = feature_encoding
+        self.instrumentation = instrumentation or Instrumentation()
 
-        data_path = str(Path(__file__).parents[1]) + '/data'
-        self.train_file = data_path + '/{}.train.ud'.format(self.lang_prefix)
+        data_path = data_path or str(Path(__file__).parents[1]) + '/data'
+        self.data_loader = DataLoader()
+        # корпуса могут храниться сжатыми (<lang>.train.ud.gz и т.д.), они читаются без распаковки на диск
+        self.train_file = self.data_loader.find_input(data_path + '/{}.train.ud'.format(self.lang_prefix))
         if self.add_morpheme_features:
-            self.morphemes_path = data_path + '/morpheme/{}.train.morph'.format(self.lang_prefix)
+            self.morphemes_path = self.data_loader.find_input(
+                data_path + '/morpheme/{}.train.morph'.format(self.lang_prefix))
             assert os.path.exists(self.morphemes_path), 'There is no {} directory'.format(self.morphemes_path)
 
         assert os.path.exists(data_path), 'There is no {} directory'.format(data_path)
         assert os.path.exists(self.train_file), 'There is no {} directory'.format(self.train_file)
 
-        self.data_loader = DataLoader()
-        self.feature_extractor = FeatureExtractor()
-        self.clfr_pos = sklearn_crfsuite.CRF(all_possible_transitions=True)
+        use_morphemes = self.add_morpheme_features and self.lang_prefix in {'evn', 'sel'}
+        self.disk_feature_cache = None
+        if disk_feature_cache:
+            self.disk_feature_cache = DiskFeatureCache(self.lang_prefix, {'encoding': self.feature_encoding,
+                                                                          'morphemes': use_morphemes})
+        if self.feature_encoding == 'ids':
+            # при дисковом кэше продолжается словарь признаков, которым закодированы признаки в кэше
+            attributes = self.disk_feature_cache.load_vocabulary() if self.disk_feature_cache else []
+            self.feature_extractor = FeatureEncoder(FeatureVocabulary(attributes), cache_size=feature_cache_size)
+        else:
+            self.feature_extractor = FeatureExtractor(cache_size=feature_cache_size)
 
         categories_path = data_path + '/grammar_data/{}_categories.json'.format(self.lang_prefix)
         pos2categories = data_path + '/grammar_data/{}_pos2categories.json'.format(self.lang_prefix)
@@ -43,117 +64,369 @@ class Pipeline:
         self.pos2categories = self.data_loader.load_json(pos2categories)
         self.categories2pos = invert_dict(self.pos2categories)
 
-        init_logging('pipeline')
-
-        train = self.data_loader.load_conllu(self.train_file)
+        init_logging('pipeline', self.instrumentation)
 
         self.morphemes = None
         self.morpheme_preproc = None
 
-        if self.add_morpheme_features and self.lang_prefix in {'evn', 'sel'}:
-            morphemes = list(self.data_loader.load_morphemes(self.morphemes_path))
-            self.morpheme_preproc = MorphemePreprocessor(lang_prefix=self.lang_prefix, morphemes=morphemes)
-            # приведение к соответствию (или проверка на соответствие) токенов train'а и морфемной сегментации
-            self.train, self.morphemes = replace_morphemes(train, morphemes)
-        else:
-            # удаление из train'а токенов дефисных написаний (с id-шниками типа 1-2 и без тегов)
-            self.train = self.feature_extractor.del_hyphen_parts(train)
+        with self.instrumentation.span('load', lang=self.lang_prefix) as span:
+            train = self.data_loader.load_corpus(self.train_file)
+            if use_morphemes:
+                morphemes = list(self.data_loader.load_morphemes(self.morphemes_path))
+            span['sentences'] = len(train)
+            span['tokens'] = sum(len(sent) for sent in train)
+
+        with self.instrumentation.span('morpheme_alignment', lang=self.lang_prefix) as span:
+            if use_morphemes:
+                self.morpheme_preproc = MorphemePreprocessor(lang_prefix=self.lang_prefix, morphemes=morphemes)
+                # приведение к соответствию (или проверка на соответствие) токенов train'а и морфемной сегментации
+                self.train, self.morphemes = replace_morphemes(train, morphemes)
+            else:
+                # удаление из train'а токенов дефисных написаний (с id-шниками типа 1-2 и без тегов)
+                self.train = self.feature_extractor.del_hyphen_parts(train)
+            span['tokens'] = sum(len(sent) for sent in self.train)
+
+    def build_feature_store(self, gc_features=True):
+        """
+        Однократное извлечение признаков для всего train'а.
+        Для каждого токена сохраняются:
+            1) признаки для POS-классификатора (self.X_pos) - словарь или, при feature_encoding = 'ids',
+            кортеж идентификаторов (см. pipeline.feature_encoder);
+            2) их копия с золотым postag (self.X_gc) - одна и та же для классификаторов всех грам. категорий;
+            3) частеречный тег (self.y_pos).
+        Выборки для конкретных фолдов и категорий затем собираются выбором по индексам.
+        gc_features = False - без признаков для классификаторов грам. категорий (для совместного режима).
+        """
+        if self.add_morpheme_features:
+            self.feature_extractor.set_morpheme_preproc(self.morpheme_preproc)
+            self.feature_extractor.set_morphemes_fold(self.morphemes)
 
-    def get_features_for_gc_classfier(self, fold, category, morphemes_fold=None):
+        logging.info('Feature extraction...')
+        with self.instrumentation.span('feature_extraction', lang=self.lang_prefix) as span:
+            if self.disk_feature_cache is None:
+                self.X_pos = [self.feature_extractor.sent2features(sent, sent_id)
+                              for sent_id, sent in enumerate(self.train)]
+            else:
+                self.X_pos = self.extract_with_disk_cache()
+                span.update(self.disk_feature_cache.stats())
+            self.X_gc = None
+            if gc_features:
+                self.X_gc = [[self.feature_extractor.add_postag(word_features, word['upostag'])
+                              for word, word_features in zip(sent, sent_features)]
+                             for sent, sent_features in zip(self.train, self.X_pos)]
+            self.y_pos = [self.feature_extractor.sent2labels(sent, category=None, pos=True) for sent in self.train]
+            span['tokens'] = count_tokens(self.y_pos)
+        logging.info('Word features cache: {}'.format(self.feature_extractor.words_cache.stats()))
+
+    def extract_with_disk_cache(self):
+        """
+        Признаки для POS-классификатора с дисковым кэшем: из кэша берутся предложения, которые уже встречались
+        (с теми же словоформами и сегментацией), признаки извлекаются только для новых и изменённых.
+        Признаки предложений, которых больше нет в train'е, из кэша удаляются.
+        """
+        X, keys = [], []
+        with self.disk_feature_cache as cache:
+            if self.feature_encoding == 'ids' and \
+                    not cache.check_vocabulary(self.feature_extractor.vocabulary.attributes):
+                logging.warning('Disk features cache {} does not match the features vocabulary {}, '
+                                'the cache is cleared'.format(cache.path, cache.vocabulary_path))
+            try:
+                for sent_id, sent in enumerate(self.train):
+                    key = cache.sentence_key(sent, self.morphemes[sent_id] if self.morphemes else None)
+                    sent_features = cache.get(key)
+                    if sent_features is None:
+                        sent_features = self.feature_extractor.sent2features(sent, sent_id)
+                        cache.put(key, sent_features)
+                    X.append(sent_features)
+                    keys.append(key)
+                cache.prune(keys)
+            finally:
+                # идентификаторы, уже записанные в кэш, должны быть объяснены сохранённым словарём
+                if self.feature_encoding == 'ids':
+                    cache.save_vocabulary(self.feature_extractor.vocabulary.attributes)
+        logging.info('Disk features cache: {}'.format(cache.stats()))
+        return X
+
+    def get_features_for_pos_classifier(self, sent_indexes):
+        X = [self.X_pos[sent_id] for sent_id in sent_indexes]
+        y = [self.y_pos[sent_id] for sent_id in sent_indexes]
+        return X, y
+
+    def get_features_for_gc_classfier(self, sent_indexes, category):
+        """
+        Выборка для классификатора грам. категории: из предложений с индексами sent_indexes
+        берутся токены, подходящие для категории (см. FeatureExtractor.sent2features_gc).
+        """
         X, y = [], []
-        if morphemes_fold:
-            self.feature_extractor.set_morphemes_fold(morphemes_fold)
-        for sent_id, sent in enumerate(fold):
-            sent_feats, sent_labels = self.feature_extractor.sent2features_gc(
-                sent, sent_id, category, self.categories2pos[category])
+        pos_tags = self.categories2pos[category]
+        for sent_id in sent_indexes:
+            sent_feats, sent_labels = [], []
+            for word, word_features in zip(self.train[sent_id], self.X_gc[sent_id]):
+                if self.feature_extractor.is_gc_sample(word, pos_tags):
+                    sent_feats.append(word_features)
+                    sent_labels.append(self.feature_extractor.word2label_gc(word, category))
             if sent_feats:
                 X.append(sent_feats)
                 y.append(sent_labels)
         return X, y
 
-    def pipeline_cv(self, categories=True):
+    def pipeline_cv(self, categories=True, jobs=1, joint=False, joint_min_count=2):
+        """
+        Кросс-валидация на 5 фолдах.
+        Каждая пара (фолд, задача) обучается на своём экземпляре модели; при jobs > 1 - в пуле процессов.
+        В совместном режиме (joint = True) на каждом фолде обучается одна модель, а её предсказания
+        разбираются на POS и грам. категории и оцениваются так же, как отдельные модели (см. cv_joint).
+        Отчёты выводятся в порядке фолдов, в конце - сводный отчёт (среднее и std по фолдам) для каждой задачи.
+        """
         kf = KFold(n_splits=5)
-        fold_count = 0
         logging.info('Lang: {}'.format(self.lang_prefix))
-        for train_index, test_index in kf.split(self.train):
-            logging.info('Fold {}'.format(fold_count))
-            fold_train, fold_test = [self.train[i] for i in train_index], [self.train[i] for i in test_index]
-            morphemes_train, morphemes_test = None, None
-
-            if self.add_morpheme_features:
-                # морфемы тоже делим на фолды
-                morphemes_train, morphemes_test = [self.morphemes[i] for i in train_index], \
-                                                  [self.morphemes[i] for i in test_index]
-                self.feature_extractor.set_morpheme_preproc(self.morpheme_preproc)
-                self.feature_extractor.set_morphemes_fold(morphemes_train)
-
-            X_train = [self.feature_extractor.sent2features(sent, sent_id) for sent_id, sent in enumerate(fold_train)]
-            y_train = [self.feature_extractor.sent2labels(sent, category=None, pos=True) for sent in fold_train]
-
-            if self.add_morpheme_features:
-                self.feature_extractor.set_morphemes_fold(morphemes_test)
-            X_test = [self.feature_extractor.sent2features(sent, sent_id) for sent_id, sent in enumerate(fold_test)]
-            y_test = [self.feature_extractor.sent2labels(sent, category=None, pos=True) for sent in fold_test]
-
-            logging.info('Training POS classifier...')
-            self.clfr_pos.fit(X_train, y_train)
-            y_pred = self.clfr_pos.predict(X_test)
-
-            # Из оценки исключаем UNKN-классы
-            labels = self.clfr_pos.classes_.copy()
-            if 'X' in labels:
-                labels.remove('X')
-
-            logging.info('Metrics for target labels (without "X" label):')
-            logging.info(metrics.flat_classification_report(
-                y_test, y_pred, labels=labels
-            ))
+        self.build_feature_store(gc_features=not joint)
 
+        task_names = ['pos'] + (list(self.categories) if categories else [])
+        if joint:
+            results = self.cv_joint(kf, categories, jobs, joint_min_count)
+        else:
+            results = self.cv_separate(kf, categories, jobs)
+
+        for fold in range(kf.n_splits):
+            logging.info('Fold {}'.format(fold))
+            for task in task_names:
+                result = results[(fold, task)]
+                if task == 'pos':
+                    logging.info('Metrics for target labels (without "X" label):')
+                else:
+                    logging.info('Metrics for {} grammar category:'.format(task))
+                logging.info('\n' + result['text'])
+
+        logging.info('Metrics averaged over {} folds (mean ± std):'.format(kf.n_splits))
+        for task in task_names:
+            aggregated = aggregate_reports([results[(fold, task)]['report'] for fold in range(kf.n_splits)])
+            logging.info('{}:\n{}'.format('POS' if task == 'pos' else task, format_aggregated_report(aggregated)))
+
+    def cv_separate(self, kf, categories, jobs):
+        """
+        Отдельные модели для POS и каждой грам. категории на каждом фолде.
+        Возвращает отчёты по ключам (фолд, задача).
+        """
+        task_names = ['pos'] + (list(self.categories) if categories else [])
+        tasks = []
+        for fold, (train_index, test_index) in enumerate(kf.split(self.train)):
+            tasks.append((fold, 'pos') + self.get_features_for_pos_classifier(train_index)
+                         + self.get_features_for_pos_classifier(test_index))
             if categories:
-                # цикл, создающий модели для грам. категорий
                 for category in self.categories:
-                    X_train, y_train = self.get_features_for_gc_classfier(fold=fold_train, category=category,
-                                                                          morphemes_fold=morphemes_train)
-
-                    X_test, y_test = self.get_features_for_gc_classfier(fold=fold_test, category=category,
-                                                                        morphemes_fold=morphemes_test)
-
-                    logging.info('Training classifier for {} category...'.format(category))
-                    clfr = sklearn_crfsuite.CRF(all_possible_transitions=True)
-                    clfr.fit(X_train, y_train)
-                    y_pred = clfr.predict(X_test)
-
-                    logging.info('Metrics for {} grammar category:'.format(category))
-                    logging.info(metrics.flat_classification_report(
-                        y_test, y_pred
-                    ))
-
-            fold_count += 1
-
-    def pipeline_train(self, categories=True):
+                    tasks.append((fold, category) + self.get_features_for_gc_classfier(train_index, category)
+                                 + self.get_features_for_gc_classfier(test_index, category))
+
+        schedule = sorted(tasks, key=lambda task: count_tokens(task[3]), reverse=True)
+        logging.info('Training {} models in {} process(es)...'.format(len(schedule), jobs))
+        results = run_tasks(fit_and_evaluate, schedule, jobs)
+        results = {(result['fold'], result['task']): result for result in results}
+        for fold in range(kf.n_splits):
+            for task in task_names:
+                self.emit_fit_record('fit', results[(fold, task)], fold=fold)
+        return results
+
+    def cv_joint(self, kf, categories, jobs, joint_min_count):
+        """
+        Совместная модель на каждом фолде. Редкие составные метки заменяются только в обучающей части.
+        Возвращает отчёты по ключам (фолд, задача), как cv_separate.
+        """
+        joint_labels = self.make_joint_labels(categories, joint_min_count)
+        y_joint = [joint_labels.sent2labels(sent) for sent in self.train]
+        tasks, test_indexes = [], []
+        for fold, (train_index, test_index) in enumerate(kf.split(self.train)):
+            y_train, _ = joint_labels.backoff([y_joint[sent_id] for sent_id in train_index])
+            tasks.append((fold, 'joint', [self.X_pos[sent_id] for sent_id in train_index], y_train,
+                          [self.X_pos[sent_id] for sent_id in test_index]))
+            test_indexes.append(test_index)
+
+        logging.info('Training {} models in {} process(es)...'.format(len(tasks), jobs))
+        results = {}
+        for result, test_index in zip(run_tasks(fit_and_predict, tasks, jobs), test_indexes):
+            self.emit_fit_record('fit', result, fold=result['fold'])
+            results.update(self.evaluate_joint(result, joint_labels, test_index))
+        return results
+
+    def evaluate_joint(self, result, joint_labels, test_index):
+        """
+        Оценка совместной модели по задачам: POS - по всем токенам (без класса X), грам. категория - по тем же
+        токенам, что у её отдельной модели в cv (см. get_features_for_gc_classfier).
+        """
+        fold = result['fold']
+        pos_labels = OrderedDict.fromkeys(joint_labels.split(label)[0] for label in result['classes'])
+        pos_test, pos_pred = [], []
+        gc_test = OrderedDict((category, []) for category in joint_labels.categories)
+        gc_pred = OrderedDict((category, []) for category in joint_labels.categories)
+        for sent_id, sent_pred in zip(test_index, result['y_pred']):
+            for word, postag, label in zip(self.train[sent_id], self.y_pos[sent_id], sent_pred):
+                pred_postag, pred_feats = joint_labels.split(label)
+                pos_test.append(postag)
+                pos_pred.append(pred_postag)
+                for category in joint_labels.categories:
+                    if self.feature_extractor.is_gc_sample(word, self.categories2pos[category]):
+                        gc_test[category].append(self.feature_extractor.word2label_gc(word, category))
+                        gc_pred[category].append(pred_feats.get(category, 'O'))
+
+        reports = {(fold, 'pos'): make_report(pos_test, pos_pred, [label for label in pos_labels if label != 'X'])}
+        for category in joint_labels.categories:
+            reports[(fold, category)] = make_report(gc_test[category], gc_pred[category])
+        return reports
+
+    def pipeline_search(self, categories=True, jobs=1, n_configs=12, eta=3, seed=0):
+        """
+        Поиск параметров CRF для POS-модели и моделей грам. категорий на 5 фолдах (см. pipeline.crf_search).
+        Лучшие параметры каждой задачи сохраняются в models/<lang>/<lang>_crf_params.json,
+        откуда их берёт pipeline_train.
+        """
         logging.info('Lang: {}'.format(self.lang_prefix))
-
-        if self.add_morpheme_features:
-            self.feature_extractor.set_morpheme_preproc(self.morpheme_preproc)
-            self.feature_extractor.set_morphemes_fold(self.morphemes)
-
-        X_train = [self.feature_extractor.sent2features(sent, sent_id) for sent_id, sent in enumerate(self.train)]
-        y_train = [self.feature_extractor.sent2labels(sent, category=None, pos=True) for sent in self.train]
-
-        logging.info('Training POS classifier...')
-        self.clfr_pos.fit(X_train, y_train)
-        self.data_loader.pickle_model(lang=self.lang_prefix, task='pos', model=self.clfr_pos)
-
-        if categories:
-            # цикл, создающий модели для грам. категорий
-            for category in self.categories:
-                X_train, y_train = self.get_features_for_gc_classfier(fold=self.train, category=category,
-                                                                      morphemes_fold=self.morphemes)
-
-                logging.info('Training classifier for {} category...'.format(category))
-                clfr = sklearn_crfsuite.CRF(all_possible_transitions=True)
-                clfr.fit(X_train, y_train)
-                self.data_loader.pickle_model(lang=self.lang_prefix, task=category, model=clfr)
+        self.build_feature_store()
+        folds = list(KFold(n_splits=5).split(self.train))
+        task_names = ['pos'] + (list(self.categories) if categories else [])
+
+        def get_fold_data(fold, task):
+            train_index, test_index = folds[fold]
+            if task == 'pos':
+                return self.get_features_for_pos_classifier(train_index) + \
+                       self.get_features_for_pos_classifier(test_index)
+            return self.get_features_for_gc_classfier(train_index, task) + \
+                self.get_features_for_gc_classfier(test_index, task)
+
+        configs = sample_configs(n_configs, seed)
+        with self.instrumentation.span('search', lang=self.lang_prefix, configs=len(configs)) as span:
+            best = CRFSearch(task_names, get_fold_data, len(folds), configs, eta, jobs).search()
+            span['trained_models'] = sum(result['trained_models'] for result in best.values())
+        for task, result in best.items():
+            default_score = '-' if result['default_score'] is None else '{:.4f}'.format(result['default_score'])
+            logging.info('{}: f1 {:.4f} (default params {}), params {}, {} models trained'.format(
+                task, result['score'], default_score, dict(result['params']), result['trained_models']))
+        crf_params = self.data_loader.load_crf_params(self.lang_prefix)
+        crf_params.update(best)
+        self.data_loader.save_crf_params(self.lang_prefix, crf_params)
+        logging.info('Best params are saved to {}'.format(self.data_loader.crf_params_path(self.lang_prefix)))
+        return best
+
+    def make_joint_labels(self, categories, joint_min_count):
+        return JointLabels(self.categories if categories else [], self.categories2pos, joint_min_count)
+
+    def pipeline_train(self, categories=True, jobs=1, model_format='pickle', joint=False, joint_min_count=2):
+        """
+        Обучение и сохранение POS-модели и моделей для грам. категорий.
+        При jobs > 1 модели обучаются в пуле процессов, начиная с самых больших выборок.
+        model_format - формат сохранения моделей (pickle или crfsuite, см. DataLoader.save_model).
+        joint = True - вместо них одна совместная модель (joint) над составными метками POS и грам. категорий
+        (см. pipeline.joint_labels); составные метки, встретившиеся реже joint_min_count раз, заменяются.
+        Если для задачи есть параметры CRF, найденные pipeline_search, модель обучается с ними.
+        """
+        logging.info('Lang: {}'.format(self.lang_prefix))
+        self.build_feature_store(gc_features=not joint)
+        all_indexes = range(len(self.train))
+
+        if joint:
+            joint_labels = self.make_joint_labels(categories, joint_min_count)
+            y, replacements = joint_labels.backoff([joint_labels.sent2labels(sent) for sent in self.train])
+            logging.info('Joint labels: {} classes, {} rare labels backed off'.format(
+                len(set(label for sent_labels in y for label in sent_labels)), len(replacements)))
+            tasks = [('joint', self.X_pos, y)]
+        else:
+            tasks = [('pos',) + self.get_features_for_pos_classifier(all_indexes)]
+            if categories:
+                for category in self.categories:
+                    tasks.append((category,) + self.get_features_for_gc_classfier(all_indexes, category))
+
+        # самые долгие задачи ставим в очередь первыми, чтобы они не оказались в хвосте
+        schedule = sorted(tasks, key=lambda task: count_tokens(task[2]), reverse=True)
+        self.data_loader.make_models_dir(self.lang_prefix)
+        if self.feature_encoding == 'ids':
+            vocabulary = self.feature_extractor.vocabulary
+            self.data_loader.save_vocabulary(self.lang_prefix, vocabulary.attributes)
+            logging.info('Feature vocabulary: {} attributes'.format(len(vocabulary)))
+        logging.info('Training {} models in {} process(es)...'.format(len(schedule), jobs))
+        metadata = {'morphemes': bool(self.morphemes), 'encoding': self.feature_encoding}
+        if joint:
+            metadata['joint_min_count'] = joint_min_count
+        crf_params = self.data_loader.load_crf_params(self.lang_prefix)
+        if crf_params:
+            logging.info('Tuned CRF params for tasks: {}'.format(', '.join(crf_params)))
+        results = run_tasks(fit_and_save, [(self.lang_prefix, task, X, y, model_format, metadata,
+                                            crf_params.get(task, {}).get('params'))
+                                           for task, X, y in schedule], jobs)
+
+        results = {result['task']: result for result in results}
+        for task, _, _ in tasks:
+            logging.info('Model {task}: {sentences} sentences, {tokens} tokens, fit time {fit_time:.2f} s'.format(
+                **results[task]))
+            self.emit_fit_record('fit', results[task])
+        return [results[task] for task, _, _ in tasks]
+
+    def pipeline_compact(self, categories=True, jobs=1, model_format='pickle', threshold=0.1, top_k=0):
+        """
+        Сжатие моделей, сохранённых pipeline_train (см. pipeline.crf_compaction): в каждой модели остаются
+        только атрибуты с |весом| >= threshold (и, если top_k > 0, из top_k самых весомых для какой-либо метки),
+        и модель переобучается на них.
+        Сначала полная и сжатая модели сравниваются на отложенной части train'а (первый из 5 фолдов):
+        число атрибутов, размер файла, время загрузки, скорость разметки и f1. Затем сжимаются сохранённые модели.
+        """
+        logging.info('Lang: {}'.format(self.lang_prefix))
+        self.build_feature_store()
+        task_names = ['pos'] + (list(self.categories) if categories else [])
+        crf_params = self.data_loader.load_crf_params(self.lang_prefix)
+
+        def get_task_data(task, sent_indexes):
+            if task == 'pos':
+                return self.get_features_for_pos_classifier(sent_indexes)
+            return self.get_features_for_gc_classfier(sent_indexes, task)
+
+        train_index, test_index = next(KFold(n_splits=5).split(self.train))
+        tasks = [(0, task) + get_task_data(task, train_index) + get_task_data(task, test_index)
+                 + (crf_params.get(task, {}).get('params'), threshold, top_k) for task in task_names]
+        logging.info('Evaluating compaction of {} models on a held-out split in {} process(es)...'.format(
+            len(tasks), jobs))
+        evaluation = run_tasks(compact_and_evaluate, tasks, jobs)
+        logging.info('{:>12}  {:>17}  {:>15}  {:>15}  {:>17}  {:>15}'.format(
+            '', 'attributes', 'size, KB', 'load, ms', 'tokens/s', 'f1'))
+        for result in evaluation:
+            full, pruned = result['full'], result['pruned']
+            logging.info('{:>12}  {:>8}->{:<8}  {:>7.0f}->{:<7.0f}  {:>7.1f}->{:<7.1f}  {:>8.0f}->{:<8.0f}  '
+                         '{:.4f} ({:+.4f})'.format(
+                             result['task'], full['attributes'], pruned['attributes'],
+                             full['bytes'] / 1024, pruned['bytes'] / 1024,
+                             full['load_time'] * 1000, pruned['load_time'] * 1000,
+                             full['tokens_per_second'], pruned['tokens_per_second'],
+                             pruned['f1'], pruned['f1'] - full['f1']))
+            record = OrderedDict([('name', 'compaction'), ('lang', self.lang_prefix), ('task', result['task']),
+                                  ('threshold', threshold), ('top_k', top_k)])
+            record.update(('full_' + name, value) for name, value in full.items())
+            record.update(('pruned_' + name, value) for name, value in pruned.items())
+            self.instrumentation.emit(record)
+
+        all_indexes = range(len(self.train))
+        metadata = {'morphemes': bool(self.morphemes), 'encoding': self.feature_encoding,
+                    'pruning': {'threshold': threshold, 'top_k': top_k}}
+        tasks = [(self.lang_prefix, task) + get_task_data(task, all_indexes)
+                 + (model_format, metadata, crf_params.get(task, {}).get('params'), threshold, top_k)
+                 for task in task_names]
+        logging.info('Compacting {} saved models in {} process(es)...'.format(len(tasks), jobs))
+        results = run_tasks(compact_and_save, tasks, jobs)
+        for result in results:
+            logging.info('Model {task}: {attributes_before} -> {attributes_after} attributes, '
+                         '{bytes_before} -> {bytes_after} bytes'.format(**result))
+            self.emit_fit_record('fit', result, compacted=True)
+        logging.info('Total size: {} -> {} bytes'.format(sum(result['bytes_before'] for result in results),
+                                                         sum(result['bytes_after'] for result in results)))
+        return evaluation, results
+
+    def emit_fit_record(self, name, result, **attrs):
+        """
+        Замер обучения модели, выполненного в пуле процессов (см. pipeline.crf_tasks).
+        """
+        record = OrderedDict([('name', name), ('lang', self.lang_prefix), ('task', result['task'])])
+        record.update(attrs)
+        record.update([('tokens', result['tokens']),
+                       ('wall_time', result['fit_time']),
+                       ('cpu_time', result['cpu_time']),
+                       ('peak_rss_mb', result['peak_rss_mb'])])
+        self.instrumentation.emit(record)
 
 
 if __name__ == '__main__':
@@ -161,15 +434,50 @@ if __name__ == '__main__':
     arg_parser.add_argument('--lang', type=str, required=True)
     arg_parser.add_argument('--morphemes', dest='add_morpheme_features', default=False, type=bool, required=False,
                             help='Add morpheme features')
-    arg_parser.add_argument('--option', type=str, required=True, choices=['cv', 'train'])
+    arg_parser.add_argument('--option', type=str, required=True, choices=['cv', 'train', 'search', 'compact'])
     arg_parser.add_argument('--categories', default=True, type=bool, required=False)
+    arg_parser.add_argument('--feature-cache-size', dest='feature_cache_size', default=100000, type=int,
+                            required=False, help='Max number of word forms in the features LRU cache (0 - disabled)')
+    arg_parser.add_argument('--jobs', default=1, type=int, required=False,
+                            help='Number of processes for training models (in all modes)')
+    arg_parser.add_argument('--model-format', dest='model_format', default='pickle', type=str, required=False,
+                            choices=['pickle', 'crfsuite'], help='Format of the saved models')
+    arg_parser.add_argument('--feature-encoding', dest='feature_encoding', default='dict', type=str, required=False,
+                            choices=['dict', 'ids'],
+                            help='Features representation: dicts or attribute ids from the language vocabulary')
+    arg_parser.add_argument('--disk-feature-cache', dest='disk_feature_cache', default=False, type=bool,
+                            required=False, help='Reuse features of unchanged sentences from cache/<lang>')
+    arg_parser.add_argument('--joint', default=False, type=bool, required=False,
+                            help='Train one model over composite POS+FEATS labels instead of separate models')
+    arg_parser.add_argument('--joint-min-count', dest='joint_min_count', default=2, type=int, required=False,
+                            help='Composite labels seen less often are backed off to a frequent sub-bundle')
+    arg_parser.add_argument('--search-configs', dest='search_configs', default=12, type=int, required=False,
+                            help='Number of CRF parameter configurations to try per task (search mode)')
+    arg_parser.add_argument('--search-eta', dest='search_eta', default=3, type=int, required=False,
+                            help='Successive halving rate: 1/eta of configurations go to the next step')
+    arg_parser.add_argument('--search-seed', dest='search_seed', default=0, type=int, required=False,
+                            help='Random seed for sampling configurations')
+    arg_parser.add_argument('--prune-threshold', dest='prune_threshold', default=0.1, type=float, required=False,
+                            help='Compact mode: keep attributes with |weight| >= threshold for some label')
+    arg_parser.add_argument('--prune-top-k', dest='prune_top_k', default=0, type=int, required=False,
+                            help='Compact mode: keep only top-k attributes by |weight| per label (0 - no limit)')
     args = arg_parser.parse_args()
 
-    pipeline = Pipeline(lang_prefix=args.lang, add_morpheme_features=args.add_morpheme_features)
+    pipeline = Pipeline(lang_prefix=args.lang, add_morpheme_features=args.add_morpheme_features,
+                        feature_cache_size=args.feature_cache_size, feature_encoding=args.feature_encoding,
+                        disk_feature_cache=args.disk_feature_cache)
 
     if args.option == 'train':
-        pipeline.pipeline_train(categories=args.categories)
+        pipeline.pipeline_train(categories=args.categories, jobs=args.jobs, model_format=args.model_format,
+                                joint=args.joint, joint_min_count=args.joint_min_count)
     elif args.option == 'cv':
-        pipeline.pipeline_cv(categories=args.categories)
+        pipeline.pipeline_cv(categories=args.categories, jobs=args.jobs, joint=args.joint,
+                             joint_min_count=args.joint_min_count)
+    elif args.option == 'search':
+        pipeline.pipeline_search(categories=args.categories, jobs=args.jobs, n_configs=args.search_configs,
+                                 eta=args.search_eta, seed=args.search_seed)
+    elif args.option == 'compact':
+        pipeline.pipeline_compact(categories=args.categories, jobs=args.jobs, model_format=args.model_format,
+                                  threshold=args.prune_threshold, top_k=args.prune_top_k)
     else:
         logging.error('Unknown option {}'.format(args.option))
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.data_loader import DataLoader
+from pipeline.batch_inference import make_job, BatchInference
+from pipeline.crf_tasks import fit_and_save
+from pipeline.feature_extractor import FeatureExtractor
+
+
+class TestBatchInference(unittest.TestCase):
+
+    def setUp(self):
+        self.defaults = {'morphemes': False, 'chunk_size': 0, 'gc_decoding': 'batch', 'feature_cache_size': 100000,
+                         'model_format': 'pickle', 'feature_encoding': 'dict', 'joint': False}
+
+    def test_make_job(self):
+        '''
+        Поля задания переопределяют значения по умолчанию, остальные берутся из командной строки.
+        '''
+        job = make_job({'lang': 'evn', 'output': 'evn.ud', 'morphemes': True, 'chunk_size': 50}, self.defaults)
+        self.assertEqual('evn', job['lang'])
+        self.assertIsNone(job['input'])
+        self.assertIsNone(job['morphemes_path'])
+        self.assertTrue(job['morphemes'])
+        self.assertEqual(50, job['chunk_size'])
+        self.assertEqual('pickle', job['model_format'])
+
+    def test_make_job_without_output(self):
+        with self.assertRaises(ValueError):
+            make_job({'lang': 'evn'}, self.defaults)
+
+    def test_failed_job(self):
+        '''
+        Задание без моделей (здесь - нет модели в формате crfsuite) завершается ошибкой, но остальные задания
+        выполняются, и их результаты возвращаются вместе с ошибкой.
+        '''
+        cwd, tmp_dir = os.getcwd(), tempfile.mkdtemp()
+        sents = DataLoader().load_corpus('data/test.evn.train.ud')
+        try:
+            os.chdir(tmp_dir)
+            os.makedirs('data/grammar_data')
+            data_loader = DataLoader()
+            data_loader.save_json('data/grammar_data/tst_categories.json', [])
+            data_loader.save_json('data/grammar_data/tst_pos2categories.json', {})
+            feature_extractor = FeatureExtractor()
+            X = [feature_extractor.sent2features(sent, sent_id) for sent_id, sent in enumerate(sents)]
+            fit_and_save('tst', 'pos', X, [[word['upostag'] for word in sent] for sent in sents])
+            with open('tst.ud', 'w', encoding='utf-8') as f:
+                f.write('1\ttug\n2\tnə\n\n')
+            jobs_list = [make_job({'lang': 'tst', 'input': 'tst.ud', 'output': 'tst.out.ud'}, self.defaults),
+                         make_job({'lang': 'tst', 'input': 'tst.ud', 'output': 'tst.crf.ud',
+                                   'model_format': 'crfsuite'}, self.defaults),
+                         make_job({'lang': 'tst', 'input': 'tst.ud', 'output': 'tst.out2.ud'}, self.defaults)]
+            with self.assertLogs(level='ERROR'):
+                results = BatchInference(jobs_list).run()
+            self.assertEqual([0, 1, 2], [result['job'] for result in results])
+            self.assertEqual([1, 2], [results[0]['sentences'], results[2]['tokens']])
+            self.assertNotIn('error', results[0])
+            self.assertIn('FileNotFoundError', results[1]['error'])
+            self.assertTrue(os.path.exists('tst.out2.ud'))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import io
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from utils.corpus import Token, parse_token
+from utils.conllu_writer import format_token, format_sentence, ConlluWriter
+from utils.data_loader import DataLoader
+
+
+class TestConlluWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_format_token(self):
+        '''
+        Токен без значений грам. категорий записывается всеми десятью столбцами; столбцы входной строки,
+        которые не размечаются, сохраняются.
+        '''
+        self.assertEqual('5\ta\t_\tSCONJ\t_\t_\t_\t_\t_\t_\n', format_token(Token(5, 'a', upostag='SCONJ')))
+        line = '2\təɲinin\təɲini\tNOUN\t_\tCase=Nom|Number=Sing\t1\tobj\t_\tSpaceAfter=No'
+        token = parse_token(line)
+        self.assertEqual(line + '\n', format_token(token))
+        token['feats'] = OrderedDict()
+        self.assertEqual('2\təɲinin\təɲini\tNOUN\t_\t_\t1\tobj\t_\tSpaceAfter=No\n', format_token(token))
+
+    def test_same_as_serialize(self):
+        '''
+        Предложения, распаршенные conllu, записываются так же, как их записывает conllu.
+        '''
+        sents = DataLoader().load_conllu('data/test.evn.train.ud')
+        result = io.StringIO()
+        with ConlluWriter(result, buffer_size=10) as writer:
+            writer.write_sentences(sents)
+        self.assertEqual(''.join(sent.serialize() for sent in sents), result.getvalue())
+
+    def test_multiwords(self):
+        sent = [Token(1, 'tug'), Token(2, 'əɲinin', upostag='NOUN'), Token(3, 'nə', upostag='PART')]
+        multiwords = ((1, parse_token('5-6\təɲininnə')),)
+        self.assertEqual('1\ttug\t_\t_\t_\t_\t_\t_\t_\t_\n'
+                         '2-3\təɲininnə\t_\t_\t_\t_\t_\t_\t_\t_\n'
+                         '2\təɲinin\t_\tNOUN\t_\t_\t_\t_\t_\t_\n'
+                         '3\tnə\t_\tPART\t_\t_\t_\t_\t_\t_\n\n', format_sentence(sent, multiwords))
+
+    def test_comments(self):
+        '''
+        Комментарии неразмеченного файла записываются перед своими предложениями.
+        '''
+        filename = os.path.join(self.tmp_dir, 'test.ud')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('# sent_id = 1\n# text = a\n1\ta\n\n1\tb\n\n')
+        comments = []
+        sents = DataLoader().load_non_labeled(filename, comments)
+        result = io.StringIO()
+        with ConlluWriter(result) as writer:
+            writer.write_sentences(sents, comments=comments)
+        self.assertEqual('# sent_id = 1\n# text = a\n1\ta\t_\t_\t_\t_\t_\t_\t_\t_\n\n'
+                         '1\tb\t_\t_\t_\t_\t_\t_\t_\t_\n\n', result.getvalue())
+
+    def test_buffer(self):
+        '''
+        Предложения пишутся в файл, когда буфер заполнен, и при выходе из блока with.
+        '''
+        result = io.StringIO()
+        with ConlluWriter(result, buffer_size=1000) as writer:
+            writer.write_sentence([Token(1, 'a')])
+            self.assertEqual('', result.getvalue())
+        self.assertEqual('1\ta\t_\t_\t_\t_\t_\t_\t_\t_\n\n', result.getvalue())
+
+    def test_gzip(self):
+        sents = DataLoader().load_conllu('data/test.evn.train.ud')
+        filename = os.path.join(self.tmp_dir, 'result.ud.gz')
+        DataLoader().write_conllu(filename, sents)
+        with gzip.open(filename, 'rt', encoding='utf-8') as f:
+            self.assertEqual(''.join(sent.serialize() for sent in sents), f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
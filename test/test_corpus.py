@@ -0,0 +1,105 @@
+import sys
+import pickle
+import threading
+import unittest
+from collections import OrderedDict
+
+from utils.corpus import Token, FeatsTable, FEATS_TABLE, parse_token, iter_sentences
+from utils.data_loader import DataLoader
+
+
+class TestCorpus(unittest.TestCase):
+
+    def test_parse_token(self):
+        '''
+        Токен разбирается так же, как conllu: id-шники многословных токенов - кортежи, feats - OrderedDict.
+        '''
+        token = parse_token('2\təɲinin\təɲini\tNOUN\t_\tCase=Nom|Number=Sing\t_\t_\t_\t_')
+        self.assertEqual(2, token['id'])
+        self.assertEqual('NOUN', token['upostag'])
+        self.assertIsNone(token['xpostag'])
+        self.assertEqual(OrderedDict([('Case', 'Nom'), ('Number', 'Sing')]), token['feats'])
+        self.assertEqual((2, '-', 3), parse_token('2-3\təɲininnə')['id'])
+        self.assertIsNone(parse_token('1\ttug')['feats'])
+
+    def test_feats_table(self):
+        '''
+        Одинаковые наборы значений грам. категорий хранятся один раз; присваивание feats заменяет набор.
+        '''
+        first = Token(1, 'a', feats=OrderedDict([('Case', 'Nom')]))
+        second = Token(2, 'b', feats=OrderedDict([('Case', 'Nom')]))
+        self.assertIs(first['feats'], second['feats'])
+        second['feats'] = OrderedDict([('Case', 'Gen')])
+        self.assertEqual(OrderedDict([('Case', 'Nom')]), first['feats'])
+        self.assertEqual(first.feats_id, FEATS_TABLE.get_id(OrderedDict([('Case', 'Nom')])))
+
+    def test_missing_field(self):
+        '''
+        Отсутствующее поле, как у словаря, - KeyError.
+        '''
+        token = Token(1, 'a')
+        with self.assertRaises(KeyError):
+            token['lemmas']
+        self.assertIsNone(token.get('lemmas'))
+
+    def test_feats_table_threads(self):
+        '''
+        Наборы, одновременно добавляемые из нескольких потоков, получают разные номера, и по номеру
+        возвращается именно тот набор.
+        '''
+        table = FeatsTable()
+        bundles = [OrderedDict([('Case', 'C{}'.format(i)), ('Number', str(i % 7))]) for i in range(2000)]
+        results = {}
+        barrier = threading.Barrier(8)
+
+        def add(thread_i):
+            barrier.wait()
+            results[thread_i] = [table.get_id(feats) for feats in bundles[thread_i::8] + bundles]
+
+        threads = [threading.Thread(target=add, args=(thread_i,)) for thread_i in range(8)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # частые переключения потоков, чтобы гонка проявлялась
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(len(bundles) + 1, len(table))
+        for thread_i, ids in results.items():
+            for feats, feats_id in zip(bundles[thread_i::8] + bundles, ids):
+                self.assertEqual(feats, table.bundles[feats_id])
+
+    def test_pickle(self):
+        token = Token(1, 'a', upostag='NOUN', feats=OrderedDict([('Case', 'Nom')]))
+        self.assertEqual(token, pickle.loads(pickle.dumps(token)))
+
+    def test_load_corpus(self):
+        '''
+        Токены загруженного корпуса совпадают с токенами DataLoader.load_conllu, комментарии пропускаются.
+        '''
+        data_loader = DataLoader()
+        corpus = data_loader.load_corpus('data/test.evn.train.ud')
+        conllu = data_loader.load_conllu('data/test.evn.train.ud')
+        self.assertEqual(len(conllu), len(corpus))
+        for corpus_sent, conllu_sent in zip(corpus, conllu):
+            for token, word in zip(corpus_sent, conllu_sent):
+                for field in ['id', 'form', 'lemma', 'upostag', 'feats']:
+                    self.assertEqual(word[field], token[field])
+        self.assertEqual([['a', 'b'], ['c']],
+                         [[token['form'] for token in sent]
+                          for sent in iter_sentences(['# text = a b', '1\ta', '2\tb', '', '', '1\tc'])])
+
+    def test_comments(self):
+        '''
+        Комментарии собираются по предложениям в том виде, в каком они были в файле.
+        '''
+        comments = []
+        lines = ['# sent_id = 1', '# text = a b', '1\ta', '2\tb', '', '1\tc', '', '#sent_id = 3', '1\td']
+        self.assertEqual(3, len(list(iter_sentences(lines, comments))))
+        self.assertEqual([['# sent_id = 1', '# text = a b'], [], ['#sent_id = 3']], comments)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from pipeline.crf_compaction import select_attributes, prune_features
+
+
+class TestCRFCompaction(unittest.TestCase):
+
+    def setUp(self):
+        self.state_features = {('word.lower():он', 'PRON'): 1.5, ('word.lower():он', 'VERB'): -0.8,
+                               ('suffix_2:ул', 'VERB'): 0.9, ('bias', 'PRON'): 0.05, ('bias', 'VERB'): -0.02,
+                               ('word.istitle()', 'PRON'): 0.3}
+
+    def test_select_attributes(self):
+        '''
+        Атрибут остаётся, если он проходит порог хотя бы для одной метки; top_k ограничивает атрибуты каждой метки.
+        '''
+        self.assertEqual({'word.lower():он', 'suffix_2:ул', 'word.istitle()'},
+                         select_attributes(self.state_features, threshold=0.1))
+        self.assertEqual({'word.lower():он', 'suffix_2:ул'},
+                         select_attributes(self.state_features, threshold=0.1, top_k=1))
+        self.assertEqual(4, len(select_attributes(self.state_features)))
+
+    def test_prune_features(self):
+        '''
+        Атрибуты ищутся по именам, которые python-crfsuite строит из словаря признаков; кортежи
+        идентификаторов фильтруются как есть.
+        '''
+        X = [[{'bias': 1.0, 'word.lower()': 'он', 'word.istitle()': False}, {'bias': 1.0, 'suffix_2': 'ул'}]]
+        self.assertEqual([[{'word.lower()': 'он'}, {'suffix_2': 'ул'}]],
+                         prune_features(X, {'word.lower():он', 'suffix_2:ул', 'word.istitle()'}))
+        self.assertEqual([[('1',), ()]], prune_features([[('0', '1'), ('2',)]], {'1'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
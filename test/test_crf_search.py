@@ -0,0 +1,39 @@
+import unittest
+
+from pipeline.crf_search import CRFSearch, sample_configs, fold_schedule
+
+
+class TestCRFSearch(unittest.TestCase):
+
+    def test_sample_configs(self):
+        '''
+        Первая конфигурация - параметры по умолчанию, c1 задаётся только для lbfgs, конфигурации не повторяются.
+        '''
+        configs = sample_configs(8, seed=1)
+        self.assertEqual(8, len(configs))
+        self.assertEqual({}, configs[0])
+        for config in configs[1:]:
+            self.assertEqual(config['algorithm'] == 'lbfgs', 'c1' in config)
+        self.assertEqual(len(configs), len(set(tuple(config.items()) for config in configs)))
+        self.assertEqual(configs, sample_configs(8, seed=1))
+
+    def test_fold_schedule(self):
+        self.assertEqual([1, 3, 5], fold_schedule(5, eta=3))
+        self.assertEqual([1, 2, 4, 5], fold_schedule(5, eta=2))
+
+    def test_search(self):
+        '''
+        До последнего шага доходит 1/eta конфигураций, и лучшая из них оценена на всех фолдах.
+        '''
+        X = [[{'word': 'он'}, {'word': 'пришёл'}], [{'word': 'она'}, {'word': 'ушла'}]]
+        y = [['PRON', 'VERB'], ['PRON', 'VERB']]
+        configs = sample_configs(6)
+        best = CRFSearch(['pos'], lambda fold, task: (X, y, X, y), 3, configs, eta=3).search()
+        self.assertEqual(['pos'], list(best))
+        self.assertIn(best['pos']['params'], configs)
+        self.assertAlmostEqual(1.0, best['pos']['score'])
+        self.assertEqual(6 + 2 * 2, best['pos']['trained_models'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+from utils.data_loader import DataLoader
+
+
+class TestDataLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.data_loader = DataLoader()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.train_file = 'data/test.evn.train.ud'
+        self.morphemes_file = 'data/morpheme/test.evn.train.morph'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def compress(self, filename, extension, open_compressed):
+        compressed = os.path.join(self.tmp_dir, os.path.basename(filename) + extension)
+        with open(filename, 'rb') as f, open_compressed(compressed, 'wb') as out:
+            out.write(f.read())
+        return compressed
+
+    def test_compressed(self):
+        '''
+        Сжатые файлы читаются так же, как исходные, независимо от расширения.
+        '''
+        corpus = self.data_loader.load_corpus(self.train_file)
+        conllu = self.data_loader.load_conllu(self.train_file)
+        morphemes = list(self.data_loader.load_morphemes(self.morphemes_file))
+        for extension, open_compressed in [('.gz', gzip.open), ('.xz', lzma.open), ('.bz2', bz2.open)]:
+            train_file = self.compress(self.train_file, extension, open_compressed)
+            self.assertEqual(corpus, self.data_loader.load_corpus(train_file))
+            self.assertEqual(conllu, self.data_loader.load_conllu(train_file))
+            self.assertEqual(morphemes, list(self.data_loader.load_morphemes(
+                self.compress(self.morphemes_file, extension, open_compressed))))
+        renamed = os.path.join(self.tmp_dir, 'train.ud')
+        shutil.move(train_file, renamed)
+        self.assertEqual(corpus, self.data_loader.load_corpus(renamed))
+
+    def test_find_input(self):
+        self.assertEqual(self.train_file, self.data_loader.find_input(self.train_file))
+        compressed = self.compress(self.train_file, '.xz', lzma.open)
+        self.assertEqual(compressed, self.data_loader.find_input(compressed[:-len('.xz')]))
+
+    def test_iter_non_labeled(self):
+        '''
+        Предложения разделяются одной или несколькими пустыми строками, комментарии пропускаются.
+        '''
+        filename = os.path.join(self.tmp_dir, 'test.ud')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write('# sent_id = 1\n1\ta\n2\tb\n\n\n1\tc\n\n')
+        sentences = self.data_loader.iter_non_labeled(filename)
+        self.assertEqual(['a', 'b'], [word['form'] for word in next(sentences)])
+        self.assertEqual([['c']], [[word['form'] for word in sent] for sent in sentences])
+        self.assertEqual(2, len(self.data_loader.load_non_labeled(filename)))
+
+    def test_check_model_features(self):
+        '''
+        Модель crfsuite, обученная с другими настройками признаков, не проходит проверку.
+        '''
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            self.data_loader.check_model_features('evn', 'pos', {'encoding': 'ids', 'morphemes': True})
+            self.data_loader.make_models_dir('evn')
+            self.data_loader.save_json(self.data_loader.model_metadata_path('evn', 'pos'),
+                                       {'task': 'pos', 'features': {'encoding': 'ids', 'morphemes': True}})
+            self.data_loader.check_model_features('evn', 'pos', {'encoding': 'ids', 'morphemes': True})
+            with self.assertRaisesRegex(ValueError, 'encoding=dict'):
+                self.data_loader.check_model_features('evn', 'pos', {'encoding': 'dict', 'morphemes': True})
+            with self.assertRaisesRegex(ValueError, 'morphemes=False'):
+                self.data_loader.check_model_features('evn', 'pos', {'encoding': 'ids', 'morphemes': False})
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from pipeline.disk_feature_cache import DiskFeatureCache
+
+
+class TestDiskFeatureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.sent = [OrderedDict([('id', 1), ('form', 'он')]), OrderedDict([('id', 2), ('form', 'взглянул')])]
+        self.morphemes = [{'form': 'он', 'morphemes': [{'morpheme': 'он', 'label': 'ROOT'}]},
+                          {'form': 'взглянул', 'morphemes': [{'morpheme': 'взглян', 'label': 'ROOT'},
+                                                             {'morpheme': 'ул', 'label': 'PST'}]}]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_sentence_key(self):
+        '''
+        Ключ зависит только от словоформ и сегментации, а не от остальных полей токенов.
+        '''
+        cache = DiskFeatureCache('evn', {'encoding': 'dict'}, self.cache_dir)
+        other_ids = [OrderedDict([('id', 5), ('form', 'он')]), OrderedDict([('id', 6), ('form', 'взглянул')])]
+        self.assertEqual(cache.sentence_key(self.sent), cache.sentence_key(other_ids))
+        self.assertNotEqual(cache.sentence_key(self.sent), cache.sentence_key(self.sent[:1]))
+        self.assertNotEqual(cache.sentence_key(self.sent), cache.sentence_key(self.sent, self.morphemes))
+
+    def test_get_put_prune(self):
+        '''
+        Признаки сохраняются между открытиями кэша, а prune удаляет предложения, которых больше нет.
+        '''
+        cache = DiskFeatureCache('evn', {'encoding': 'dict'}, self.cache_dir)
+        key = cache.sentence_key(self.sent)
+        old_key = cache.sentence_key(self.sent[:1])
+        with cache:
+            self.assertIsNone(cache.get(key))
+            cache.put(key, [{'word': 'он'}, {'word': 'взглянул'}])
+            cache.put(old_key, [{'word': 'он'}])
+        with cache:
+            self.assertEqual([{'word': 'он'}, {'word': 'взглянул'}], cache.get(key))
+            cache.prune([key])
+            self.assertIsNone(cache.get(old_key))
+        self.assertEqual({'hits': 1, 'misses': 2, 'pruned': 1},
+                         {name: value for name, value in cache.stats().items() if name != 'path'})
+
+    def test_check_vocabulary(self):
+        '''
+        Кэш идентификаторов используется, только если сохранённый словарь - начало загруженного;
+        если файла словаря нет (например, обучение прервалось до его сохранения) или он другой, кэш очищается.
+        '''
+        cache = DiskFeatureCache('evn', {'encoding': 'ids'}, self.cache_dir)
+        key = cache.sentence_key(self.sent)
+        with cache:
+            self.assertTrue(cache.check_vocabulary(['BOS:True', 'EOS:True']))
+            cache.put(key, [('0', '2'), ('1', '3')])
+            cache.save_vocabulary(['BOS:True', 'EOS:True', 'word:он', 'word:взглянул'])
+        with cache:
+            attributes = cache.load_vocabulary()
+            self.assertTrue(cache.check_vocabulary(attributes + ['word:новый']))
+            self.assertIsNotNone(cache.get(key))
+            self.assertFalse(cache.check_vocabulary(['BOS:True', 'EOS:True', 'word:взглянул', 'word:он']))
+            self.assertIsNone(cache.get(key))
+            cache.put(key, [('0', '2'), ('1', '3')])
+            cache.save_vocabulary(attributes)
+        os.remove(cache.vocabulary_path)
+        with cache:
+            self.assertEqual([], cache.load_vocabulary())
+            self.assertFalse(cache.check_vocabulary(['BOS:True', 'EOS:True']))
+            self.assertIsNone(cache.get(key))
+
+    def test_config(self):
+        '''
+        Для разных конфигураций признаков - разные файлы кэша.
+        '''
+        self.assertNotEqual(DiskFeatureCache('evn', {'encoding': 'dict'}, self.cache_dir).path,
+                            DiskFeatureCache('evn', {'encoding': 'ids'}, self.cache_dir).path)
+
+
+if __name__ == '__main__':
+    unittest.main()
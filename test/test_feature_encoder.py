@@ -0,0 +1,47 @@
+import unittest
+from collections import OrderedDict
+
+from pipeline.feature_extractor import FeatureExtractor
+from pipeline.feature_encoder import FeatureEncoder, FeatureVocabulary, attribute_name
+
+
+class TestFeatureEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.test_sent = [OrderedDict([('id', i + 1), ('form', form), ('upostag', postag)])
+                          for i, (form, postag) in enumerate([('Оторвавшись', 'VERB'), ('от', 'ADP'),
+                                                              ('бумаг', 'NOUN'), (',', 'PUNCT'), ('он', 'PRON'),
+                                                              ('взглянул', 'VERB'), ('на', 'ADP'),
+                                                              ('Ефимову', 'PROPN'), ('.', 'PUNCT')])]
+
+    def decode(self, vocabulary, items):
+        return [vocabulary.attributes[int(attribute_id)] for attribute_id in items]
+
+    def test_sent2features_matches_feature_extractor(self):
+        '''
+        Идентификаторы атрибутов FeatureEncoder соответствуют ненулевым признакам FeatureExtractor.sent2features
+        в том же порядке - для предложений разной длины и с postag.
+        '''
+        feature_extractor = FeatureExtractor()
+        feature_encoder = FeatureEncoder()
+        for length in [1, 2, 4, len(self.test_sent)]:
+            sent = self.test_sent[:length]
+            for postags in [False, True]:
+                expected = [[attribute_name(name, value) for name, value in word_features.items() if value]
+                            for word_features in feature_extractor.sent2features(sent, 0, postags)]
+                fact = [self.decode(feature_encoder.vocabulary, items)
+                        for items in feature_encoder.sent2features(sent, 0, postags)]
+                self.assertEqual(expected, fact)
+
+    def test_frozen_vocabulary(self):
+        '''
+        Неизменяемый словарь не добавляет новых атрибутов, и они отбрасываются.
+        '''
+        vocabulary = FeatureVocabulary(['word:от', 'bias'], frozen=True)
+        self.assertEqual(('0', '1'), vocabulary.encode(['word', 'bias', 'BOS'], ['от', 1.0, True]))
+        self.assertEqual((), vocabulary.encode(['word', 'word_is_upper'], ['на', False]))
+        self.assertEqual(2, len(vocabulary))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
 from collections import OrderedDict
 
-from pipeline.feature_extractor import FeatureExtractor
+import sklearn_crfsuite
+
+from pipeline.feature_extractor import FeatureExtractor, WordsFeaturesCache
+from utils.morpheme_preprocessor import MorphemePreprocessor
 
 
 class TestFeatureExtr(unittest.TestCase):
@@ -124,6 +127,22 @@ class TestFeatureExtr(unittest.TestCase):
         fact_result = self.test_feature_extr.all_words_features(test_data, i=0, sent_id=0)
         self.assertEqual(true_result, fact_result)
 
+    def test_del_hyphen_parts(self):
+        '''
+        Токены дефисных написаний удаляются без изменения исходных предложений, и индексы сохраняются
+        для всех таких токенов предложения.
+        '''
+        sent = [OrderedDict([('id', (1, '-', 2)), ('form', 'ab')]), OrderedDict([('id', 1), ('form', 'a')]),
+                OrderedDict([('id', 2), ('form', 'b')]), OrderedDict([('id', (3, '-', 4)), ('form', 'cd')]),
+                OrderedDict([('id', 3), ('form', 'c')]), OrderedDict([('id', 4), ('form', 'd')])]
+        dataset = [self.test_sent, sent]
+        result = self.test_feature_extr.del_hyphen_parts(dataset)
+        self.assertEqual(self.test_sent, result[0])
+        self.assertEqual(['a', 'b', 'c', 'd'], [word['form'] for word in result[1]])
+        self.assertEqual(6, len(sent))
+        self.assertEqual([1], list(self.test_feature_extr.hyphen_parts_indexes))
+        self.assertEqual([0, 2], [position for position, _ in self.test_feature_extr.hyphen_parts_indexes[1]])
+
     def test_full_right_context(self):
         '''
         Тест функции make_right_context_features при условии, что правый контекст будет полным (длиной 3 токена)
@@ -454,6 +473,70 @@ class TestFeatureExtr(unittest.TestCase):
         fact_result = self.test_feature_extr.add_pos_features(X, y_pred)
         self.assertCountEqual(true_result, fact_result)
 
+    def test_words_features_cache(self):
+        '''
+        Тест кэша признаков словоформ: повторные вхождения формы берутся из кэша,
+        а результат совпадает с извлечением без кэша.
+        '''
+        no_cache_extr = FeatureExtractor(cache_size=0)
+        cached_result = [self.test_feature_extr.sent2features(self.test_sent, 0) for _ in range(2)]
+        fact_result = no_cache_extr.sent2features(self.test_sent, 0)
+        self.assertEqual(cached_result[0], fact_result)
+        self.assertEqual(cached_result[1], fact_result)
+        stats = self.test_feature_extr.words_cache.stats()
+        self.assertEqual(stats['size'], len(self.test_sent))
+        self.assertEqual(stats['misses'], len(self.test_sent))
+        self.assertEqual(no_cache_extr.words_cache.stats()['size'], 0)
+
+    def test_sent2window_features(self):
+        '''
+        Тест sent2window_features: для предложений любой длины признаки (и порядок ключей) совпадают
+        с word2features для каждого токена - с postag и без.
+        '''
+        for length in range(1, len(self.test_sent) + 1):
+            sent = self.test_sent[:length]
+            for postags in [False, True]:
+                true_result = [list(self.test_feature_extr.word2features(sent, i, 0, postags).items())
+                               for i in range(length)]
+                fact_result = [list(word_features.items())
+                               for word_features in self.test_feature_extr.sent2window_features(sent, 0, postags)]
+                self.assertEqual(true_result, fact_result)
+
+    def test_words_features_cache_eviction(self):
+        '''
+        Тест вытеснения из LRU-кэша: при переполнении удаляется давно не использовавшаяся форма.
+        '''
+        cache = WordsFeaturesCache(max_size=2)
+        cache.put('он', 1)
+        cache.put('на', 2)
+        cache.get('он')
+        cache.put('от', 3)
+        self.assertIsNone(cache.get('на'))
+        self.assertEqual(cache.get('он'), 1)
+        self.assertEqual(cache.get('от'), 3)
+
+    def test_sparse_morpheme_features(self):
+        '''
+        Морфемные признаки содержат только метки, которые есть в слове. Обучение на них не равносильно обучению
+        на полных векторах с нулями: у crfsuite получается другой набор признаков модели и другие веса.
+        '''
+        labels2ind = {'ACC': 0, 'PL': 1}
+        self.test_feature_extr.set_morpheme_preproc(MorphemePreprocessor('evn', [], labels2ind))
+        self.assertEqual({'PL': 1}, self.test_feature_extr.labels_morpheme_features(('ROOT', 'PL')))
+        self.assertEqual({}, self.test_feature_extr.labels_morpheme_features(('ROOT',)))
+
+        X_sparse = [[{'w': 'a', 'PL': 1}, {'w': 'b'}], [{'w': 'a'}, {'w': 'c', 'PL': 1}]] * 3
+        X_dense = [[dict(word, **{label: word.get(label, 0) for label in labels2ind}) for word in sent]
+                   for sent in X_sparse]
+        y = [['N', 'V'], ['V', 'N']] * 3
+        sparse, dense = sklearn_crfsuite.CRF(), sklearn_crfsuite.CRF()
+        sparse.fit(X_sparse, y)
+        dense.fit(X_dense, y)
+        self.assertLess(len(sparse.state_features_), len(dense.state_features_))
+        self.assertNotEqual(dense.predict_marginals_single([{'w': 'a', 'PL': 1}]),
+                            sparse.predict_marginals_single([{'w': 'a', 'PL': 1}]))
+
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+from collections import OrderedDict
+
+from pipeline.inference import Inference
+from utils.corpus import Token
+from utils.utils import invert_dict
+
+
+class ContextModel:
+    """
+    Модель, метка которой зависит от контекста: каждому токену присваивается длина размечаемой последовательности.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        return [[str(len(sent))] * len(sent) for sent in X]
+
+
+class TestGcDecoding(unittest.TestCase):
+
+    def setUp(self):
+        # без загрузки файлов языка: для предсказания категорий нужны только соответствия частей речи и категорий
+        self.inference = Inference.__new__(Inference)
+        self.inference.pos2categories = OrderedDict([('NOUN', ['Case']), ('VERB', ['Tense'])])
+        self.inference.categories2pos = invert_dict(self.inference.pos2categories)
+        self.X = [[{'w': 'a'}, {'w': 'b'}, {'w': 'c'}], [{'w': 'd'}]]
+        self.pos_pred = [['NOUN', 'VERB', 'NOUN'], ['NOUN']]
+
+    def predict(self, method):
+        model = ContextModel()
+        pred_categories = {i: {j: OrderedDict() for j in range(len(sent))} for i, sent in enumerate(self.X)}
+        tokens = method(model, 'Case', self.X, self.pos_pred, pred_categories)
+        return tokens, model.calls, pred_categories
+
+    def test_batched(self):
+        '''
+        batch (по умолчанию): токены с подходящей частью речи размечаются подпоследовательностью одним вызовом
+        модели, так что предсказание зависит от соседних токенов.
+        '''
+        tokens, calls, pred_categories = self.predict(self.inference.predict_category_batched)
+        self.assertEqual(3, tokens)
+        self.assertEqual(1, calls)
+        self.assertEqual({'Case': '2'}, pred_categories[0][0])
+        self.assertEqual({}, pred_categories[0][1])
+        self.assertEqual({'Case': '2'}, pred_categories[0][2])
+        self.assertEqual({'Case': '1'}, pred_categories[1][0])
+
+    def test_per_token(self):
+        '''
+        token (прежнее поведение): каждый токен размечается отдельно, без контекста, поэтому разметка
+        может отличаться от batch.
+        '''
+        tokens, calls, pred_categories = self.predict(self.inference.predict_category_per_token)
+        self.assertEqual(3, tokens)
+        self.assertEqual(3, calls)
+        self.assertEqual({'Case': '1'}, pred_categories[0][0])
+        self.assertEqual({}, pred_categories[0][1])
+        self.assertEqual({'Case': '1'}, pred_categories[0][2])
+
+
+class TestMorphemesAlignment(unittest.TestCase):
+
+    def test_align_morphemes(self):
+        '''
+        Несовпадающая сегментация не прерывает разметку: расхождения пишутся в лог, у слов без сегментации
+        и у предложений, для которых её нет, она пустая.
+        '''
+        inference = Inference.__new__(Inference)
+        sentences = [[Token(1, 'tug'), Token(2, 'nə')], [Token(1, 'oːn')]]
+        morphemes = [[{'form': 'tug', 'morphemes': [{'morpheme': 'tug', 'label': 'ROOT'}]}]]
+        with self.assertLogs(level='WARNING'):
+            aligned = inference.align_morphemes(sentences, morphemes)
+        self.assertEqual([['tug', 'nə'], ['oːn']], [[word['form'] for word in sent] for sent in aligned])
+        self.assertEqual([[], []], [word['morphemes'] for word in aligned[0][1:] + aligned[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
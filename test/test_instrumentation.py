@@ -0,0 +1,36 @@
+import unittest
+import tracemalloc
+
+from utils.instrumentation import Instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        self.instrumentation = Instrumentation()
+        self.instrumentation.add_hook(self.records.append)
+
+    def test_nested_peaks(self):
+        '''
+        Вложенный замер не сбрасывает пик памяти, уже достигнутый во внешнем: внешний пик не меньше
+        пиков всех вложенных и выделенного до них.
+        '''
+        tracemalloc.start()
+        try:
+            with self.instrumentation.span('outer'):
+                data = bytearray(8 * 1024 * 1024)
+                del data
+                with self.instrumentation.span('inner'):
+                    small = bytearray(1024 * 1024)
+                    del small
+        finally:
+            tracemalloc.stop()
+        inner, outer = self.records
+        self.assertEqual(['inner', 'outer'], [inner['name'], outer['name']])
+        self.assertLess(inner['py_peak_mb'], 4)
+        self.assertGreaterEqual(outer['py_peak_mb'], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
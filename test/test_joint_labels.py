@@ -0,0 +1,42 @@
+import unittest
+from collections import OrderedDict
+
+from pipeline.joint_labels import JointLabels
+
+
+class TestJointLabels(unittest.TestCase):
+
+    def setUp(self):
+        self.joint_labels = JointLabels(['Case', 'Number', 'Tense'],
+                                        {'Case': ['NOUN', 'PRON'], 'Number': ['NOUN', 'VERB'], 'Tense': ['VERB']})
+
+    def test_word2label(self):
+        '''
+        В составную метку попадают только категории, допустимые для части речи, в порядке categories;
+        PROPN заменяется на NOUN, как у POS-модели.
+        '''
+        word = {'upostag': 'PROPN', 'feats': OrderedDict([('Number', 'Sing'), ('Tense', 'Past'), ('Case', 'Nom')])}
+        self.assertEqual('NOUN|Case=Nom|Number=Sing', self.joint_labels.word2label(word))
+        self.assertEqual('PUNCT', self.joint_labels.word2label({'upostag': 'PUNCT', 'feats': None}))
+
+    def test_split(self):
+        postag, feats = self.joint_labels.split('NOUN|Case=Nom|Number=Sing')
+        self.assertEqual('NOUN', postag)
+        self.assertEqual(OrderedDict([('Case', 'Nom'), ('Number', 'Sing')]), feats)
+        self.assertEqual(('PUNCT', OrderedDict()), self.joint_labels.split('PUNCT'))
+
+    def test_backoff(self):
+        '''
+        Редкая метка заменяется самым полным частым набором той же части речи, который в неё входит,
+        а если такого нет - частеречным тегом.
+        '''
+        y = [['NOUN|Case=Nom', 'NOUN|Case=Nom', 'NOUN|Case=Nom|Number=Sing'],
+             ['VERB|Tense=Past', 'NOUN|Case=Gen', 'NOUN|Case=Gen']]
+        y_backoff, replacements = self.joint_labels.backoff(y)
+        self.assertEqual({'NOUN|Case=Nom|Number=Sing': 'NOUN|Case=Nom', 'VERB|Tense=Past': 'VERB'}, replacements)
+        self.assertEqual([['NOUN|Case=Nom', 'NOUN|Case=Nom', 'NOUN|Case=Nom'],
+                          ['VERB', 'NOUN|Case=Gen', 'NOUN|Case=Gen']], y_backoff)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+
+from pipeline.result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.sent = [OrderedDict([('id', 1), ('form', 'он'), ('upostag', 'PRON'),
+                                  ('feats', OrderedDict([('Case', 'Nom')]))]),
+                     OrderedDict([('id', 2), ('form', 'пришёл'), ('upostag', 'VERB'), ('feats', OrderedDict())])]
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_sentence_key(self):
+        '''
+        Ключ зависит от языка, версии моделей, словоформ и сегментации.
+        '''
+        cache = ResultCache()
+        key = cache.sentence_key('evn', 'v1', self.sent)
+        self.assertEqual(key, cache.sentence_key('evn', 'v1', [{'form': 'он'}, {'form': 'пришёл'}]))
+        self.assertNotEqual(key, cache.sentence_key('sel', 'v1', self.sent))
+        self.assertNotEqual(key, cache.sentence_key('evn', 'v2', self.sent))
+        morphemes = [{'form': 'он', 'morphemes': [{'morpheme': 'он', 'label': 'ROOT'}]},
+                     {'form': 'пришёл', 'morphemes': [{'morpheme': 'пришёл', 'label': 'ROOT'}]}]
+        self.assertNotEqual(key, cache.sentence_key('evn', 'v1', self.sent, morphemes))
+
+    def test_lru(self):
+        '''
+        При переполнении вытесняется давно не использовавшееся предложение.
+        '''
+        cache = ResultCache(max_size=2)
+        keys = [cache.sentence_key('evn', 'v1', self.sent[:n]) for n in range(3)]
+        cache.put(keys[0], [])
+        cache.put(keys[1], self.sent[:1])
+        self.assertEqual(((), ()), cache.get(keys[0]))
+        cache.put(keys[2], self.sent[:2])
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual((('PRON', 'VERB'), ((('Case', 'Nom'),), ())), cache.get(keys[2]))
+        self.assertEqual({'size': 2, 'hits': 2, 'misses': 1, 'evictions': 1, 'hit_rate': 0.667}, cache.stats())
+
+    def test_save(self):
+        path = os.path.join(self.cache_dir, 'evn', 'results.pkl')
+        cache = ResultCache(path=path)
+        key = cache.sentence_key('evn', 'v1', self.sent)
+        cache.put(key, self.sent)
+        cache.save()
+        self.assertEqual((('PRON', 'VERB'), ((('Case', 'Nom'),), ())), ResultCache(path=path).get(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
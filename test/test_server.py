@@ -0,0 +1,94 @@
+import json
+import threading
+import unittest
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+
+from pipeline.server import TaggerRequestHandler
+
+
+class StubService:
+    """
+    Сервис без моделей: размечает все слова как NOUN, на словоформе 'fail' падает с IndexError,
+    на словоформе 'missing' - с KeyError.
+    """
+    inferences = {'evn': None}
+
+    def tag(self, lang, tokens, segmentations=None):
+        if ['fail'] in tokens:
+            raise IndexError('string index out of range')
+        if ['missing'] in tokens:
+            raise KeyError('upostag')
+        return [[{'id': i + 1, 'form': form, 'upostag': 'NOUN', 'feats': {}} for i, form in enumerate(sent)]
+                for sent in tokens]
+
+    def to_json(self, tagged):
+        return tagged
+
+
+class QuietRequestHandler(TaggerRequestHandler):
+    service = StubService()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), QuietRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def post(self, request):
+        connection = HTTPConnection('127.0.0.1', self.server.server_address[1])
+        body = request if isinstance(request, str) else json.dumps(request)
+        connection.request('POST', '/tag', body.encode('utf-8'), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        result = response.status, json.loads(response.read().decode('utf-8'))
+        connection.close()
+        return result
+
+    def test_tag(self):
+        status, response = self.post({'lang': 'evn', 'sentences': [['tug', 'nə']], 'format': 'json'})
+        self.assertEqual(200, status)
+        self.assertEqual(['tug', 'nə'], [word['form'] for word in response['sentences'][0]])
+
+    def test_empty_form(self):
+        status, response = self.post({'lang': 'evn', 'sentences': [['tug', '']], 'format': 'json'})
+        self.assertEqual(400, status)
+        self.assertIn('sentence 0', response['error'])
+
+    def test_misaligned_morphemes(self):
+        status, _ = self.post({'lang': 'evn', 'sentences': [['tug', 'nə']], 'morphemes': [['tug']]})
+        self.assertEqual(400, status)
+        status, _ = self.post({'lang': 'evn', 'sentences': [['tug'], ['nə']], 'morphemes': [['tug']]})
+        self.assertEqual(400, status)
+
+    def test_bad_requests(self):
+        self.assertEqual(400, self.post('{')[0])
+        self.assertEqual(400, self.post({'lang': 'evn', 'sentences': [[1, 2]]})[0])
+        status, response = self.post({'lang': 'krl', 'sentences': [['tug']]})
+        self.assertEqual(400, status)
+        self.assertIn('unknown language krl', response['error'])
+        self.assertEqual(400, self.post({'lang': ['evn'], 'sentences': [['tug']]})[0])
+
+    def test_internal_error(self):
+        '''
+        Ошибка при разметке возвращается клиенту как 500 с описанием, а не обрывает соединение.
+        '''
+        status, response = self.post({'lang': 'evn', 'sentences': [['fail']]})
+        self.assertEqual(500, status)
+        self.assertIn('IndexError', response['error'])
+        status, response = self.post({'lang': 'evn', 'sentences': [['missing']]})
+        self.assertEqual(500, status)
+        self.assertIn('KeyError', response['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
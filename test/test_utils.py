@@ -1,7 +1,8 @@
 import unittest
 from collections import OrderedDict
 
-from utils.utils import replace_morphemes
+from utils.utils import replace_morphemes, align_morphemes, split_multiwords
+from utils.conllu_writer import format_sentence
 from utils.data_loader import DataLoader
 
 class TestUtils(unittest.TestCase):
@@ -148,3 +149,54 @@ class TestUtils(unittest.TestCase):
         for i, w in enumerate(true_train):
             self.assertEqual(w, fact_train[0][i])
         self.assertEqual(true_morphemes, fact_morphemes[0])
+
+    def test_align_morphemes_wide_range(self):
+        '''
+        Сегментация токена из трёх частей делится между частями, исходные списки не изменяются.
+        '''
+        sent = [OrderedDict([('id', (1, '-', 3)), ('form', 'abc')]), OrderedDict([('id', 1), ('form', 'a')]),
+                OrderedDict([('id', 2), ('form', 'b')]), OrderedDict([('id', 3), ('form', 'c')]),
+                OrderedDict([('id', 4), ('form', 'd')])]
+        morphemes = [[{'form': 'abc', 'morphemes': [{'morpheme': 'a', 'label': 'ROOT'},
+                                                    {'morpheme': 'x', 'label': 'PL'},
+                                                    {'morpheme': 'b', 'label': 'ROOT'},
+                                                    {'morpheme': 'c', 'label': 'ROOT'}]},
+                      {'form': 'd', 'morphemes': [{'morpheme': 'd', 'label': 'ROOT'}]}]]
+        train, aligned, misalignments = align_morphemes([sent], morphemes)
+        self.assertEqual(['a', 'b', 'c', 'd'], [word['form'] for word in train[0]])
+        self.assertEqual([['ROOT', 'PL'], ['ROOT'], ['ROOT'], ['ROOT']],
+                         [[morpheme['label'] for morpheme in word['morphemes']] for word in aligned[0]])
+        self.assertEqual({}, misalignments)
+        self.assertEqual(5, len(sent))
+        self.assertEqual(2, len(morphemes[0]))
+
+    def test_align_morphemes_misalignment(self):
+        '''
+        Расхождения не прерывают выравнивание, а возвращаются по номерам предложений.
+        '''
+        sent = [OrderedDict([('id', 1), ('form', 'a')]), OrderedDict([('id', 2), ('form', 'b')])]
+        morphemes = [[{'form': 'a', 'morphemes': [{'morpheme': 'a', 'label': 'ROOT'}]}]]
+        train, aligned, misalignments = align_morphemes([sent, sent], morphemes)
+        self.assertEqual(1, len(train))
+        self.assertEqual([{'form': 'b', 'morphemes': []}], aligned[0][1:])
+        self.assertEqual([None, 0], list(misalignments))
+
+    def test_split_multiwords(self):
+        '''
+        Многословные токены (в том числе с id-шниками-строками из неразмеченной выборки) отделяются от слов
+        и записываются обратно перед своим первым словом.
+        '''
+        sent = [OrderedDict([('id', '1'), ('form', 'tug')]), OrderedDict([('id', '2-3'), ('form', 'əɲininnə')]),
+                OrderedDict([('id', '2'), ('form', 'əɲinin')]), OrderedDict([('id', '3'), ('form', 'nə')])]
+        words, multiwords = split_multiwords(sent)
+        self.assertEqual(['tug', 'əɲinin', 'nə'], [word['form'] for word in words])
+        self.assertEqual(((1, sent[1]),), multiwords)
+        self.assertEqual(4, len(sent))
+        self.assertEqual('1\ttug\t_\t_\t_\t_\t_\t_\t_\t_\n'
+                         '2-3\təɲininnə\t_\t_\t_\t_\t_\t_\t_\t_\n'
+                         '2\təɲinin\t_\t_\t_\t_\t_\t_\t_\t_\n'
+                         '3\tnə\t_\t_\t_\t_\t_\t_\t_\t_\n\n', format_sentence(words, multiwords))
+        words, multiwords = split_multiwords(self.train[0])
+        self.assertEqual(9, len(words))
+        self.assertEqual([1, 4], [position for position, _ in multiwords])
+        self.assertEqual(self.train[0].metadata, words.metadata)
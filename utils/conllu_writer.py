@@ -0,0 +1,121 @@
+"""
+Запись предложений в формате CoNLL-U: каждое предложение собирается в одну строку, а строки пишутся в файл
+большими блоками. Столбцы, которых разметка не касается (лемма, xpostag, head, deprel, deps, misc), и
+многословные токены записываются такими, какими были во входном файле; комментарии предложений
+записываются, если их передать (см. utils.corpus.iter_sentences).
+"""
+from collections import OrderedDict
+
+from utils.corpus import FIELDS, Token, multiword_range
+
+# строки наборов значений грам. категорий по их номерам в utils.corpus.FEATS_TABLE: наборы общие для многих токенов,
+# поэтому каждый форматируется один раз
+FEATS_STRINGS = {0: '_'}
+
+
+def format_field(value):
+    """
+    Значение столбца в виде строки, как у conllu.serialize: None - '_', словарь (feats, misc) - 'k=v|k=v',
+    кортеж id-шника - '1-2', список пар (deps) - 'head:deprel|...'.
+    """
+    if value is None:
+        return '_'
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        if not value:
+            return '_'
+        return '|'.join('{}={}'.format(key, '_' if item is None else item) for key, item in value.items())
+    if isinstance(value, tuple):
+        return ''.join(str(item) for item in value)
+    if isinstance(value, list):
+        return '|'.join('{}:{}'.format(head, deprel) for deprel, head in value)
+    return str(value)
+
+
+def format_token(token, token_id=None):
+    """
+    Строка токена (словаря или utils.corpus.Token); token_id заменяет его id-шник.
+    """
+    if token.__class__ is not Token:
+        columns = [format_field(token.get(field)) for field in FIELDS]
+        if token_id is not None:
+            columns[0] = token_id
+        return '\t'.join(columns) + '\n'
+    if token_id is None:
+        token_id = str(token.id) if token.id.__class__ is int else format_field(token.id)
+    feats = FEATS_STRINGS.get(token.feats_id)
+    if feats is None:
+        feats = FEATS_STRINGS[token.feats_id] = format_field(token.feats)
+    # у Token все столбцы, кроме id и feats, - строки или None
+    return '\t'.join((token_id, token.form or '_', token.lemma or '_', token.upostag or '_', token.xpostag or '_',
+                      feats, token.head or '_', token.deprel or '_', token.deps or '_', token.misc or '_')) + '\n'
+
+
+def format_sentence(sent, multiwords=None, metadata=None, comments=None):
+    """
+    Предложение одной строкой: комментарии (строки comments как есть и metadata в виде '# ключ = значение'),
+    токены и пустая строка в конце.
+    multiwords - индекс многословных токенов предложения (см. utils.utils.split_multiwords): строка каждого
+    такого токена записывается перед его первым словом, id-шник пересчитывается от номера этого слова.
+    """
+    lines = []
+    if comments:
+        lines.extend(comment + '\n' for comment in comments)
+    if metadata:
+        lines.extend('# {} = {}\n'.format(key, value) for key, value in metadata.items())
+    if not multiwords:
+        lines.extend([format_token(word) for word in sent])
+    else:
+        ranges = OrderedDict()
+        for position, word in multiwords:
+            ranges.setdefault(position, []).append(word)
+        for word_i, word in enumerate(sent):
+            for multiword in ranges.get(word_i, ()):
+                first, last = multiword_range(multiword)
+                lines.append(format_token(multiword, '{}-{}'.format(word_i + 1, word_i + 1 + last - first)))
+            lines.append(format_token(word))
+    lines.append('\n')
+    return ''.join(lines)
+
+
+class ConlluWriter:
+    """
+    Буферизованная запись предложений в открытый файл: отформатированные предложения копятся в буфере
+    и пишутся одним вызовом write, когда их суммарная длина достигает buffer_size символов.
+    """
+
+    def __init__(self, f, buffer_size=1 << 16):
+        self.f = f
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def write_sentence(self, sent, multiwords=None, metadata=None, comments=None):
+        text = format_sentence(sent, multiwords, metadata, comments)
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def write_sentences(self, sents, multiwords=None, comments=None):
+        """
+        multiwords - индексы многословных токенов по предложениям, comments - строки комментариев
+        по предложениям (или None).
+        """
+        for sent_i, sent in enumerate(sents):
+            self.write_sentence(sent, multiwords[sent_i] if multiwords else None, getattr(sent, 'metadata', None),
+                                comments[sent_i] if comments else None)
+
+    def flush(self):
+        if self.buffer:
+            self.f.write(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+        self.f.flush()
@@ -0,0 +1,199 @@
+"""
+Компактное представление корпуса: токен - объект со слотами вместо OrderedDict из 10 ключей.
+Строки (словоформы, леммы, теги) интернируются, а наборы значений грам. категорий (feats) хранятся
+номерами в общей таблице, так что одинаковые наборы всех токенов - один и тот же объект.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+FIELDS = ('id', 'form', 'lemma', 'upostag', 'xpostag', 'feats', 'head', 'deprel', 'deps', 'misc')
+
+
+class FeatsTable:
+    """
+    Таблица наборов значений грам. категорий: номер -> OrderedDict (0 - нет значений, None).
+    Наборы из таблицы общие для многих токенов, поэтому изменять их нельзя - только заменять целиком.
+    Таблица общая для всего процесса (в том числе для потоков сервера), поэтому новые наборы добавляются
+    под блокировкой; найденные наборы читаются без неё.
+    """
+
+    def __init__(self):
+        self.ids = {None: 0}
+        self.bundles = [None]
+        self.lock = threading.Lock()
+
+    def get_id(self, feats):
+        if feats is None:
+            return 0
+        key = tuple(feats.items())
+        feats_id = self.ids.get(key)
+        if feats_id is None:
+            with self.lock:
+                feats_id = self.ids.get(key)
+                if feats_id is None:
+                    # набор добавляется раньше номера: по номеру из ids набор всегда уже есть в bundles
+                    self.bundles.append(OrderedDict(key))
+                    feats_id = len(self.bundles) - 1
+                    self.ids[key] = feats_id
+        return feats_id
+
+    def __len__(self):
+        return len(self.bundles)
+
+
+FEATS_TABLE = FeatsTable()
+
+
+class Token:
+    """
+    Токен CoNLL-U. Поддерживает обращение как к словарю (word['form'], word['feats'] = ...), которым
+    пользуются извлечение признаков и inference, поэтому может заменять OrderedDict из DataLoader.load_conllu.
+    id - число, кортеж (1, '-', 2) для многословного токена или (1, '.', 1) для пустого узла; feats - OrderedDict
+    (через FEATS_TABLE) или None; остальные столбцы хранятся строками как есть ('_' - None).
+    """
+    __slots__ = ('id', 'form', 'lemma', 'upostag', 'xpostag', 'feats_id', 'head', 'deprel', 'deps', 'misc')
+
+    def __init__(self, id=None, form=None, lemma=None, upostag=None, xpostag=None, feats=None, head=None,
+                 deprel=None, deps=None, misc=None):
+        self.id = id
+        self.form = form
+        self.lemma = lemma
+        self.upostag = upostag
+        self.xpostag = xpostag
+        self.feats_id = FEATS_TABLE.get_id(feats)
+        self.head = head
+        self.deprel = deprel
+        self.deps = deps
+        self.misc = misc
+
+    @property
+    def feats(self):
+        return FEATS_TABLE.bundles[self.feats_id]
+
+    @feats.setter
+    def feats(self, feats):
+        self.feats_id = FEATS_TABLE.get_id(feats)
+
+    def __getitem__(self, key):
+        # как у словаря: отсутствующее поле - KeyError, а не AttributeError
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    __setitem__ = object.__setattr__
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return FIELDS
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in FIELDS]
+
+    def to_dict(self):
+        return OrderedDict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, Token):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __reduce__(self):
+        # номер набора feats имеет смысл только в текущем процессе, поэтому сохраняется сам набор
+        return Token, tuple(getattr(self, field) for field in FIELDS)
+
+    def __repr__(self):
+        return 'Token({})'.format(', '.join('{}={!r}'.format(field, value) for field, value in self.items()))
+
+
+def multiword_range(word):
+    """
+    Номера первого и последнего слова многословного токена (токена дефисного написания с id-шником типа 1-2
+    и без тегов) или None для обычного слова. id-шник - кортеж (распаршенный conllu) или строка
+    (неразмеченная выборка).
+    """
+    word_id = word['id']
+    if isinstance(word_id, tuple):
+        return (word_id[0], word_id[2]) if word_id[1] == '-' else None
+    if isinstance(word_id, str) and '-' in word_id:
+        first, last = word_id.split('-', 1)
+        return int(first), int(last)
+    return None
+
+
+def is_multiword(word):
+    return multiword_range(word) is not None
+
+
+def parse_id(value):
+    if value.isdigit():
+        return int(value)
+    for separator in ('-', '.'):
+        if separator in value:
+            first, last = value.split(separator, 1)
+            if first.isdigit() and last.isdigit():
+                return int(first), separator, int(last)
+    return value
+
+
+def parse_feats(value):
+    """
+    Набор значений грам. категорий, как у conllu: 'Case=Nom|Number=Sing' -> OrderedDict, '_' -> None.
+    """
+    if '=' in value:
+        return OrderedDict((part.split('=')[0], nullable(part.split('=')[1]))
+                           for part in value.split('|') if len(part.split('=')) == 2)
+    return nullable(value)
+
+
+def nullable(value):
+    if not value or value == '_':
+        return None
+    return value
+
+
+def parse_token(line):
+    """
+    Токен из строки CoNLL-U (столбцов может быть меньше десяти, например только id и словоформа).
+    """
+    columns = line.split('\t')
+    columns.extend([None] * (len(FIELDS) - len(columns)))
+    token_id, form, lemma, upostag, xpostag, feats, head, deprel, deps, misc = columns[:len(FIELDS)]
+    return Token(parse_id(token_id),
+                 sys.intern(form) if form is not None else None,
+                 sys.intern(lemma) if lemma is not None else None,
+                 sys.intern(upostag) if upostag is not None else None,
+                 nullable(xpostag),
+                 parse_feats(feats) if feats is not None else None,
+                 nullable(head),
+                 sys.intern(deprel) if deprel is not None else None,
+                 nullable(deps),
+                 nullable(misc))
+
+
+def iter_sentences(lines, comments=None):
+    """
+    Предложения (списки токенов) из строк CoNLL-U; пустые предложения не выдаются.
+    comments - список, в который для каждого выданного предложения добавляется список строк его комментариев
+    ('# sent_id = 1' и т.п.) в том виде, в каком они были в файле; без него комментарии пропускаются.
+    """
+    sent, sent_comments = [], []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            if sent:
+                if comments is not None:
+                    comments.append(sent_comments)
+                yield sent
+                sent, sent_comments = [], []
+        elif line.startswith('#'):
+            sent_comments.append(line)
+        else:
+            sent.append(parse_token(line))
+    if sent:
+        if comments is not None:
+            comments.append(sent_comments)
+        yield sent
@@ -1,11 +1,31 @@
 import os
 import re
+import bz2
+import sys
+import gzip
 import json
+import lzma
 import pickle
+import shutil
+from contextlib import contextmanager
 from collections import OrderedDict
 
+import sklearn_crfsuite
 from conllu import parse
 
+from utils.corpus import iter_sentences
+from utils.conllu_writer import ConlluWriter
+
+# сжатые входные файлы: расширение, сигнатура в начале файла, функция открытия
+COMPRESSIONS = [('.gz', b'\x1f\x8b', gzip.open),
+                ('.xz', b'\xfd7zXZ\x00', lzma.open),
+                ('.bz2', b'BZh', bz2.open)]
+MODEL_EXTENSIONS = {'pickle': 'pkl',
+                    'crfsuite': 'crfsuite'}
+# параметры sklearn_crfsuite.CRF, которые сохраняются в метаданных модели
+CRF_PARAMS = ['algorithm', 'c1', 'c2', 'max_iterations', 'min_freq',
+              'all_possible_states', 'all_possible_transitions']
+
 
 class DataLoader:
     def __init__(self):
@@ -19,32 +39,116 @@ class DataLoader:
         """
         Загрузка файла в формате conllu и его парсинг.
         """
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = f.read()
-        parse_result = parse(data)
-        filtered_result = []
-        for i, el in enumerate(parse_result.copy()):
-            if len(el) != 0:
-                filtered_result.append(el)
-        return filtered_result
+        return list(self.iter_conllu(filename))
+
+    def iter_conllu(self, filename):
+        """
+        Потоковый парсинг файла в формате conllu (в том числе сжатого, см. open_input): предложения
+        разбираются по одному, пустые (без токенов) пропускаются.
+        """
+        with self.open_input(filename) as f:
+            for lines in self.iter_blocks(f):
+                for sent in parse('\n'.join(lines)):
+                    if len(sent) != 0:
+                        yield sent
+
+    def load_corpus(self, filename):
+        """
+        Быстрая загрузка файла в формате conllu в компактном представлении (см. utils.corpus):
+        списки токенов utils.corpus.Token вместо OrderedDict. Комментарии не сохраняются.
+        """
+        with self.open_input(filename) as f:
+            return list(iter_sentences(f))
 
     def write_conllu(self, filename, object):
-        with open(filename, 'w') as f:
-            for sent in object:
-                f.write(sent.serialize())
+        """
+        Запись предложений (распаршенных conllu или списков utils.corpus.Token) вместе с их комментариями.
+        """
+        with self.open_output(filename) as f:
+            with ConlluWriter(f) as writer:
+                writer.write_sentences(object)
 
-    def load_non_labeled(self, filename):
+    def load_non_labeled(self, filename, comments=None):
         """
         Загрузка неразмеченной выборки.
-        Преобразование в формат, аналогичный распаршенному conllu: списки словарей с ключами 'id' и 'form'.
+        Преобразование в формат, аналогичный распаршенному conllu: списки токенов utils.corpus.Token
+        (из неразмеченной выборки берутся id и словоформа).
+        comments - список для комментариев предложений (см. utils.corpus.iter_sentences).
+        """
+        return list(self.iter_non_labeled(filename, comments))
+
+    def find_input(self, filename):
+        """
+        Путь к входному файлу: сам filename или, если его нет, его сжатая копия (filename.gz, .xz, .bz2).
         """
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = f.read()
-            sents_list = data.split('\n\n')
-        words_list = [list(filter(None, el.split('\n'))) for el in sents_list]
-        result_list = [[word.split('\t') for word in sent] for sent in words_list]
-        ordered = [[OrderedDict(zip(['id', 'form'], word)) for word in sent] for sent in result_list]
-        return ordered
+        if filename == '-' or os.path.exists(filename):
+            return filename
+        for extension, _, _ in COMPRESSIONS:
+            if os.path.exists(filename + extension):
+                return filename + extension
+        return filename
+
+    @contextmanager
+    def open_input(self, filename):
+        """
+        Открытие файла на чтение; '-' - стандартный ввод. Сжатые файлы (gzip, xz, bzip2) распознаются
+        по сигнатуре и распаковываются по мере чтения.
+        """
+        if filename == '-':
+            # сигнатура стандартного ввода просматривается без чтения из него
+            source, signature = sys.stdin.buffer, sys.stdin.buffer.peek(6)[:6]
+        else:
+            source = filename
+            with open(filename, 'rb') as f:
+                signature = f.read(6)
+        for _, magic, open_compressed in COMPRESSIONS:
+            if signature.startswith(magic):
+                with open_compressed(source, 'rt', encoding='utf-8') as f:
+                    yield f
+                return
+        if filename == '-':
+            yield sys.stdin
+        else:
+            with open(filename, 'r', encoding='utf-8') as f:
+                yield f
+
+    def iter_blocks(self, f):
+        """
+        Строки файла, сгруппированные по блокам, разделённым пустыми строками (предложения conllu и
+        морфемной сегментации). Пустые блоки не выдаются.
+        """
+        block = []
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.strip():
+                block.append(line)
+            elif block:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    @contextmanager
+    def open_output(self, filename):
+        """
+        Открытие файла на запись; '-' - стандартный вывод, файл с расширением .gz сжимается gzip'ом.
+        """
+        if filename == '-':
+            yield sys.stdout
+        elif filename.endswith('.gz'):
+            with gzip.open(filename, 'wt', encoding='utf-8') as f:
+                yield f
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                yield f
+
+    def iter_non_labeled(self, filename, comments=None):
+        """
+        Потоковая загрузка неразмеченной выборки: предложения читаются по одному и сразу отдаются дальше,
+        файл целиком в память не загружается. Формат предложений и comments те же, что у load_non_labeled.
+        """
+        with self.open_input(filename) as f:
+            yield from iter_sentences(f, comments)
 
     def extract_morphemes(self, morphemes):
         morphemes = morphemes.split()
@@ -65,18 +169,18 @@ class DataLoader:
                    'label': label}
 
     def load_morphemes(self, morphemes_path):
-        with open(morphemes_path) as f:
-            data = f.read()
-            sentences = list(filter(None, data.split('\n\n')))
-        for sent in sentences:
-            words = list(filter(None, sent.split('\n')))
-            sent_words_with_morphemes = []
-            for i, word in enumerate(words):
-                form_morphemes = word.strip().split('\t')
-                form, morphemes = form_morphemes[0], form_morphemes[1]
-                morphemes = list(self.extract_morphemes(morphemes))
-                sent_words_with_morphemes.append({'form': form, 'morphemes': list(morphemes)})
-            yield sent_words_with_morphemes
+        """
+        Потоковая загрузка морфемной сегментации: предложения (списки словоформ с морфемами) читаются по одному.
+        """
+        with self.open_input(morphemes_path) as f:
+            for words in self.iter_blocks(f):
+                sent_words_with_morphemes = []
+                for word in words:
+                    form_morphemes = word.strip().split('\t')
+                    form, morphemes = form_morphemes[0], form_morphemes[1]
+                    morphemes = list(self.extract_morphemes(morphemes))
+                    sent_words_with_morphemes.append({'form': form, 'morphemes': list(morphemes)})
+                yield sent_words_with_morphemes
 
     def load_json(self, path_to_json):
         with open(path_to_json) as outfile:
@@ -96,9 +200,105 @@ class DataLoader:
             model = pickle.load(f)
         return model
 
+    def make_models_dir(self, lang):
+        os.makedirs('models/{}'.format(lang), exist_ok=True)
+
+    def model_path(self, lang, task, model_format='pickle'):
+        return 'models/{}/{}_{}.{}'.format(lang, lang, task, MODEL_EXTENSIONS[model_format])
+
+    def model_metadata_path(self, lang, task):
+        return 'models/{}/{}_{}.json'.format(lang, lang, task)
+
+    def vocabulary_path(self, lang):
+        return 'models/{}/{}_features.vocab'.format(lang, lang)
+
+    def crf_params_path(self, lang):
+        return 'models/{}/{}_crf_params.json'.format(lang, lang)
+
+    def save_crf_params(self, lang, crf_params):
+        self.make_models_dir(lang)
+        self.save_json(self.crf_params_path(lang), crf_params)
+
+    def load_crf_params(self, lang):
+        """
+        Лучшие параметры CRF по задачам, найденные поиском (pipeline.crf_search); пустой словарь, если поиска не было.
+        """
+        if not os.path.exists(self.crf_params_path(lang)):
+            return OrderedDict()
+        return self.load_json(self.crf_params_path(lang))
+
+    def save_lines(self, path, lines):
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line + '\n')
+
+    def load_lines(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f]
+
+    def save_vocabulary(self, lang, attributes):
+        """
+        Сохранение словаря признаков языка: по одному атрибуту на строку, номер строки - идентификатор.
+        """
+        self.make_models_dir(lang)
+        self.save_lines(self.vocabulary_path(lang), attributes)
+
+    def load_vocabulary(self, lang):
+        return self.load_lines(self.vocabulary_path(lang))
+
+    def save_model(self, lang, task, model, model_format='pickle', metadata=None):
+        """
+        Сохранение обученной модели CRF в одном из форматов:
+            1) pickle - объект sklearn_crfsuite.CRF целиком;
+            2) crfsuite - файл модели crfsuite как есть и рядом json с метаданными (классы, параметры CRF,
+            настройки признаков из metadata).
+        """
+        if model_format == 'pickle':
+            self.pickle_model(lang, task, model)
+            return
+        self.make_models_dir(lang)
+        model_path = self.model_path(lang, task, model_format)
+        if os.path.abspath(model.modelfile.name) != os.path.abspath(model_path):
+            shutil.copyfile(model.modelfile.name, model_path)
+        params = {name: getattr(model, name, None) for name in CRF_PARAMS}
+        model_metadata = OrderedDict([('task', task),
+                                      ('classes', list(model.classes_)),
+                                      ('params', params),
+                                      ('features', metadata or {})])
+        self.save_json(self.model_metadata_path(lang, task), model_metadata)
+
+    def load_task_model(self, lang, task, model_format='pickle'):
+        """
+        Загрузка модели для задачи task (pos или грам. категория) в указанном формате.
+        Модель в формате crfsuite не распаковывается через pickle: crfsuite открывает файл модели сам и читает
+        его в память целиком, так что каждый процесс держит свою копию модели.
+        """
+        model_path = self.model_path(lang, task, model_format)
+        if model_format == 'pickle':
+            return self.load_model(model_path)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(model_path)
+        return sklearn_crfsuite.CRF(model_filename=model_path)
+
+    def check_model_features(self, lang, task, features):
+        """
+        Сверка настроек признаков, с которыми размечается текст (features, например {'encoding': 'ids',
+        'morphemes': True}), с настройками из json модели в формате crfsuite. Если они расходятся, модель
+        получила бы признаки, которых не видела при обучении, поэтому выбрасывается ValueError.
+        Для моделей без json (pickle) проверять нечего.
+        """
+        metadata_path = self.model_metadata_path(lang, task)
+        if not os.path.exists(metadata_path):
+            return
+        trained = self.load_json(metadata_path).get('features', {})
+        mismatches = ['{}={} (model: {})'.format(name, value, trained[name])
+                      for name, value in features.items() if name in trained and trained[name] != value]
+        if mismatches:
+            raise ValueError('Model {} is trained with other feature settings: {}'.format(
+                self.model_path(lang, task, 'crfsuite'), ', '.join(mismatches)))
+
     def pickle_model(self, lang, task, model):
-        if not os.path.exists('models/{}'.format(lang)):
-            os.mkdir('models/{}'.format(lang))
+        self.make_models_dir(lang)
         with open('models/{}/{}_{}.pkl'.format(lang, lang, task), 'wb') as f:
             pickle.dump(model, f)
 
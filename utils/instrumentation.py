@@ -0,0 +1,80 @@
+import json
+import time
+import resource
+import tracemalloc
+from contextlib import contextmanager
+from collections import OrderedDict
+
+
+# пики памяти Python (tracemalloc) открытых замеров, от внешнего к вложенному: tracemalloc хранит один пик
+# на процесс, и вложенный замер его сбрасывает, поэтому пик до сброса сохраняется для внешних замеров
+_traced_peaks = []
+
+
+def peak_rss_mb():
+    """
+    Пиковое потребление памяти текущим процессом (peak RSS) в мегабайтах.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Instrumentation:
+    """
+    Замеры этапов обработки (загрузка, выравнивание морфем, извлечение признаков, обучение и применение
+    каждой CRF-модели, запись результата).
+    Каждый замер - словарь с именем этапа, его атрибутами (язык, задача, число токенов и т.п.),
+    временем (wall и CPU) и пиковой памятью процесса. Если включён tracemalloc, добавляется ещё и
+    пик памяти, выделенной Python за время этапа.
+    Замеры передаются всем зарегистрированным обработчикам (add_hook) и, если задан path,
+    дописываются в файл в формате JSON lines.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hooks = []
+
+    def add_hook(self, hook):
+        """
+        hook - функция, которая вызывается с каждым замером.
+        """
+        self.hooks.append(hook)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        Замер этапа. Контекстный менеджер возвращает словарь замера, в который внутри этапа можно добавить
+        атрибуты, известные только по его ходу (например, число обработанных токенов).
+        """
+        record = OrderedDict([('name', name)])
+        record.update(attrs)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            if _traced_peaks:
+                _traced_peaks[-1] = max(_traced_peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            _traced_peaks.append(0)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = time.perf_counter() - wall_start
+            record['cpu_time'] = time.process_time() - cpu_start
+            if tracing:
+                peak = max(_traced_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if _traced_peaks:
+                    _traced_peaks[-1] = max(_traced_peaks[-1], peak)
+                record['py_peak_mb'] = peak / 1024 / 1024
+            self.emit(record)
+
+    def emit(self, record):
+        """
+        Передача готового замера обработчикам и запись в файл.
+        Используется и напрямую - для этапов, замеренных в других процессах.
+        """
+        record.setdefault('peak_rss_mb', peak_rss_mb())
+        record['timestamp'] = time.time()
+        for hook in self.hooks:
+            hook(record)
+        if self.path:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -0,0 +1,68 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.data_loader import DataLoader
+
+
+class ModelRegistry:
+    """
+    Реестр моделей с ленивой загрузкой: модель для пары (язык, задача) загружается при первом обращении
+    и хранится в LRU-кэше. Кэш ограничивается числом моделей (max_models) и/или суммарным размером
+    файлов моделей в байтах (max_bytes); None - без ограничения.
+    Реестр можно разделять между несколькими объектами Inference (в том числе для разных языков).
+    """
+
+    def __init__(self, model_format='pickle', max_models=None, max_bytes=None, data_loader=None):
+        self.model_format = model_format
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.data_loader = data_loader or DataLoader()
+        self.models = OrderedDict()  # (lang, task) -> (model, размер файла)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time = 0.0
+
+    def get(self, lang, task):
+        key = (lang, task)
+        with self.lock:
+            if key in self.models:
+                self.hits += 1
+                self.models.move_to_end(key)
+                return self.models[key][0]
+
+            self.misses += 1
+            start = time.time()
+            model = self.data_loader.load_task_model(lang, task, self.model_format)
+            self.load_time += time.time() - start
+            model_size = os.path.getsize(self.data_loader.model_path(lang, task, self.model_format))
+            self.models[key] = (model, model_size)
+            self.evict()
+            return model
+
+    def evict(self):
+        """
+        Удаление давно не использовавшихся моделей, пока кэш не уложится в ограничения.
+        Последняя загруженная модель не удаляется никогда.
+        """
+        while len(self.models) > 1 and (
+                (self.max_models is not None and len(self.models) > self.max_models) or
+                (self.max_bytes is not None and self.size_bytes() > self.max_bytes)):
+            (lang, task), _ = self.models.popitem(last=False)
+            self.evictions += 1
+            logging.debug('Model {} {} is evicted from the registry'.format(lang, task))
+
+    def size_bytes(self):
+        return sum(model_size for _, model_size in self.models.values())
+
+    def stats(self):
+        return {'models': len(self.models),
+                'bytes': self.size_bytes(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'load_time': round(self.load_time, 3)}
@@ -14,6 +14,7 @@ class MorphemePreprocessor:
             self.labels = self.morpheme_classes()
             self.label2ind = self.labels_index(self.labels)
             self.pickle_model()
+        self.ind2label = {i: label for label, i in self.label2ind.items()}
 
     def morpheme_classes(self):
         labels = set()
@@ -35,6 +36,14 @@ class MorphemePreprocessor:
                 empty_vector[self.label2ind[m['label']]] = 1
         return empty_vector
 
+    def present_labels(self, labels):
+        """
+        Метки морфем слова (кроме ROOT) без повторов в порядке их индексов - ненулевые позиции вектора one_hot.
+        labels - метки всех морфем слова.
+        """
+        indexes = {self.label2ind[label] for label in labels if label != 'ROOT'}
+        return [self.ind2label[i] for i in sorted(indexes)]
+
     def pickle_model(self):
         if not os.path.exists('models/{}'.format(self.lang_prefix)):
             os.mkdir('models/{}'.format(self.lang_prefix))
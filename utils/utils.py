@@ -2,7 +2,12 @@ import os
 import time
 import uuid
 import logging
-from collections import defaultdict
+from itertools import islice
+from collections import defaultdict, OrderedDict
+
+from conllu.models import TokenList
+
+from utils.corpus import multiword_range, is_multiword
 
 from utils.data_loader import DataLoader
 
@@ -15,7 +20,12 @@ def check_form_to_morpheme(train, morphemes: list):
             assert(w['form'] == morph_sent[j]['form'])
     return True
 
-def init_logging(file_name):
+def init_logging(file_name, instrumentation=None):
+    """
+    Логирование в консоль и в файл в папке logs.
+    Если передан объект utils.instrumentation.Instrumentation, его замеры пишутся рядом с логом,
+    в файл с тем же именем и расширением .jsonl.
+    """
     fmt = logging.Formatter('%(asctime)-15s %(message)s')
 
     logger = logging.getLogger()
@@ -31,56 +41,125 @@ def init_logging(file_name):
     logfile = logging.FileHandler(os.path.join(log_dir_name, log_file_name), 'w')
     logfile.setFormatter(fmt)
     logger.addHandler(logfile)
+    if instrumentation is not None:
+        instrumentation.path = os.path.join(log_dir_name, os.path.splitext(log_file_name)[0] + '.jsonl')
     return log_dir_name
 
+def split_multiwords(sent):
+    """
+    Отделение многословных токенов от слов предложения за один проход, без изменения исходного списка.
+    Возвращает список слов и индекс многословных токенов - кортеж пар (номер слова, перед которым стоит
+    токен, токен), по которому их можно вернуть на место при записи (см. utils.conllu_writer.format_sentence).
+    """
+    words, multiwords = [], []
+    for word in sent:
+        if is_multiword(word):
+            multiwords.append((len(words), word))
+        else:
+            words.append(word)
+    if isinstance(sent, TokenList):
+        words = TokenList(words, sent.metadata)
+    return words, tuple(multiwords)
+
+def split_multiword_morphemes(word_morphemes, parts):
+    """
+    Разбиение сегментации многословного токена между его частями: каждой части, кроме первой, достаётся
+    по одной морфеме с конца, первой - все остальные.
+    """
+    n_tail = len(parts) - 1
+    morphemes = word_morphemes['morphemes']
+    split = max(len(morphemes) - n_tail, 0)
+    tail = [[morpheme] for morpheme in morphemes[split:]]
+    parts_morphemes = [morphemes[:split]] + tail + [[] for _ in range(n_tail - len(tail))]
+    return [{'form': part['form'], 'morphemes': part_morphemes}
+            for part, part_morphemes in zip(parts, parts_morphemes)]
+
+def align_sentence_morphemes(sent, morph_sent):
+    """
+    Выравнивание токенов предложения и его морфемной сегментации за один проход.
+    Многословные токены удаляются, а сегментация такого токена (если в .morph-файле он записан одной словоформой)
+    делится между его частями (см. split_multiword_morphemes).
+    Возвращает новые списки токенов и сегментаций слов и список описаний расхождений. При расхождении
+    словоформ сегментация слова остаётся на своём месте (признаки для неё не строятся, см.
+    FeatureExtractor.word_morpheme_labels), а для слов без сегментации добавляется пустая.
+    """
+    words, words_morphemes, problems = [], [], []
+    j, k = 0, 0
+    while j < len(sent):
+        word = sent[j]
+        word_range = multiword_range(word)
+        if word_range is not None:
+            parts = sent[j + 1:j + 2 + word_range[1] - word_range[0]]
+            j += 1 + len(parts)
+            words.extend(parts)
+            part_forms = [part['form'] for part in parts]
+            if k < len(morph_sent) and morph_sent[k]['form'] == word['form']:
+                if len(morph_sent[k]['morphemes']) < len(parts):
+                    problems.append('{}: {} morphemes for {} parts'.format(
+                        word['form'], len(morph_sent[k]['morphemes']), len(parts)))
+                words_morphemes.extend(split_multiword_morphemes(morph_sent[k], parts))
+                k += 1
+            elif [morph['form'] for morph in morph_sent[k:k + len(parts)]] == part_forms:
+                # сегментация уже записана по частям
+                words_morphemes.extend(morph_sent[k:k + len(parts)])
+                k += len(parts)
+            else:
+                problems.append('{} ({}): no segmentation'.format(word['form'], ' '.join(part_forms)))
+                words_morphemes.extend({'form': form, 'morphemes': []} for form in part_forms)
+            continue
+        j += 1
+        words.append(word)
+        if k < len(morph_sent):
+            if morph_sent[k]['form'] != word['form']:
+                problems.append('{} != {}'.format(word['form'], morph_sent[k]['form']))
+            words_morphemes.append(morph_sent[k])
+            k += 1
+        else:
+            problems.append('{}: no segmentation'.format(word['form']))
+            words_morphemes.append({'form': word['form'], 'morphemes': []})
+    if k < len(morph_sent):
+        problems.append('{} extra segmented words'.format(len(morph_sent) - k))
+    if isinstance(sent, TokenList):
+        words = TokenList(words, sent.metadata)
+    return words, words_morphemes, problems
+
+def align_morphemes(train, morphemes):
+    """
+    Выравнивание корпуса и морфемной сегментации (см. align_sentence_morphemes): исходные списки не изменяются.
+    Возвращает новые списки предложений и сегментаций и словарь расхождений: номер предложения -> описания.
+    """
+    aligned_train, aligned_morphemes, misalignments = [], [], OrderedDict()
+    if len(train) != len(morphemes):
+        misalignments[None] = ['{} sentences, {} segmented sentences'.format(len(train), len(morphemes))]
+    for i, (sent, morph_sent) in enumerate(zip(train, morphemes)):
+        words, words_morphemes, problems = align_sentence_morphemes(sent, morph_sent)
+        aligned_train.append(words)
+        aligned_morphemes.append(words_morphemes)
+        if problems:
+            misalignments[i] = problems
+    return aligned_train, aligned_morphemes, misalignments
+
 def replace_morphemes(train, morphemes):
-    print('Len train:', len(train))
-    print('Len morphemes', len(morphemes))
-    for i, sent in enumerate(train):
-        morph_sent = morphemes[i].copy()
-        if len(morph_sent) != len(sent):
-            hyphen_count = sum([1 for w in sent if '-' in str(w['id'])])
-            counter = 0
-            while counter < hyphen_count:
-                morph_sent = morphemes[i]
-                for j, w in enumerate(sent):
-
-                    if '-' in str(w['id']):
-                        morph = [(index, m) for index, m in enumerate(morph_sent) if m['form'] == w['form']][0]
-                        index_morph, morph = morph[0], morph[1]
-                        if w['id'][2] - w['id'][0] == 1:
-                            part1 = sent[j + 1]['form']
-                            part2 = sent[j + 2]['form']
-                            morph1 = morph['morphemes'][:-1]
-                            morph2 = [morph['morphemes'][-1]]
-                            morphemes[i].pop(index_morph)
-                            morphemes[i].insert(index_morph, {'form': part1, 'morphemes': morph1})
-                            morphemes[i].insert(index_morph + 1, {'form': part2, 'morphemes': morph2})
-                            sent.pop(j)
-                        if w['id'][2] - w['id'][0] == 2:
-                            part1 = sent[j + 1]['form']
-                            part2 = sent[j + 2]['form']
-                            part3 = sent[j + 3]['form']
-                            morph1 = morph['morphemes'][:-2]
-                            morph2 = [morph['morphemes'][-2]]
-                            morph3 = [morph['morphemes'][-1]]
-                            morphemes[i].pop(index_morph)
-                            morphemes[i].insert(index_morph, {'form': part1, 'morphemes': morph1})
-                            morphemes[i].insert(index_morph + 1, {'form': part2, 'morphemes': morph2})
-                            morphemes[i].insert(index_morph + 2, {'form': part3, 'morphemes': morph3})
-                            sent.pop(j)
-                        break
-                    else:
-                        continue
-                counter += 1
-                continue
-            assert(len(morphemes[i]) == len(sent))
-            for ind, word in enumerate(sent):
-                assert(word['form'] == morphemes[i][ind]['form'])
-            train.pop(i)
-            train.insert(i, sent)
+    """
+    Приведение к соответствию токенов train'а и морфемной сегментации (см. align_morphemes).
+    Расхождения не прерывают загрузку, а пишутся в лог.
+    """
+    logging.info('Len train: {}, len morphemes: {}'.format(len(train), len(morphemes)))
+    train, morphemes, misalignments = align_morphemes(train, morphemes)
+    for i, problems in misalignments.items():
+        logging.warning('Morphemes misalignment in sentence {}: {}'.format(i, '; '.join(problems)))
     return train, morphemes
 
+def iter_chunks(iterable, chunk_size):
+    """
+    Разбиение итерируемого объекта на списки длиной chunk_size (последний может быть короче).
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
 def invert_dict(dictionary):
     new_dic = {}
     for k, v in dictionary.items():